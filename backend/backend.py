@@ -1,7 +1,9 @@
 # backend.py
 import sys
 import os
+import threading
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from datetime import datetime
@@ -14,7 +16,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__f
 
 # Import model functions from separate model module
 from model import analyze_anomaly_contributions, save_contribution_results
-from generate_tree import generate_anomaly_tree
+from generate_tree import generate_anomaly_tree, drain_anomaly_backlog, tree_export, compact_tree, llm_usage
+from job_queue import JobQueue, QueueFullError
+from data_cache import LOCAL_TZ, TimeSeriesCache
+from history_store import HistoryStore
+from downsample import downsample, METHODS as SAMPLING_METHODS
 
 app = FastAPI()
 
@@ -41,93 +47,79 @@ class AnomalyDataPayload(BaseModel):
     data: List[Dict[str, Any]]
     anomaly_timestamps: List[str]
 
+ANOMALY_COLUMNS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0", "ts"]
+
+# Parsed once and kept sorted by timestamp; reloaded when the file's mtime or size changes.
+normal_data_cache = TimeSeriesCache("normal_data.csv")
+anomaly_data_cache = TimeSeriesCache("anomaly_results_classified.csv", columns=ANOMALY_COLUMNS, coerce=True)
+# Day/device-partitioned Parquet history (ANOMALY_HISTORY_STORE). When set, /anomaly_data
+# batches are written to it and /get_data and /get_time_range read anomalies from it instead
+# of the CSV. normal_data.csv stays the live sensor feed: its rows are served together with
+# the store's sensor rows (migrated history plus /anomaly_data batches), one row per
+# (device, ts), so it can be rotated once its history has been migrated.
+history_store = HistoryStore.from_env()
+
+
 @app.get("/get_data")
-async def get_data(start_time: str = None, end_time: str = None):
-    import pandas as pd
+async def get_data(start_time: str = None, end_time: str = None, max_points: int = None,
+                   sampling: str = "minmax"):
+    """Sensor rows and classified anomalies in [start_time, end_time].
+
+    With `max_points`, sensor rows are downsampled per device and channel
+    ("minmax" or "lttb", see downsample.py); rows at anomaly timestamps and
+    the anomaly list itself are never dropped.
+    """
     from urllib.parse import unquote
-    
-    normal_data_path = "normal_data.csv"
-    anomaly_data_path = "anomaly_results_classified.csv"
-    
+
     try:
         # Decode URL-encoded time parameters (convert + to space)
         if start_time:
             start_time = unquote(start_time.replace("+", " "))
         if end_time:
             end_time = unquote(end_time.replace("+", " "))
-        
-        # Read normal_data.csv
-        if os.path.exists(normal_data_path):
-            df_normal = pd.read_csv(normal_data_path)
-            # Ensure 'ts' is datetime type (retain timezone info)
-            df_normal["ts"] = pd.to_datetime(df_normal["ts"])
-            
-            # If time parameters are provided, do filtering
+        if max_points is not None and sampling not in SAMPLING_METHODS:
+            raise ValueError(f"sampling must be one of {SAMPLING_METHODS}")
+
+        df_normal = df_anomaly = None
+        # Naive query times are taken as US Pacific when the CSV timestamps are tz-aware
+        normal = normal_data_cache.get()
+        if normal is not None:
+            df_normal = normal.df
             if start_time and end_time:
-                # Parse query time (assume no timezone, need to match timezone in CSV)
-                start_dt = pd.to_datetime(start_time)
-                end_dt = pd.to_datetime(end_time)
-                
-                # If CSV has timezone but query parameters do not, handle timezone
-                # Get timezone of the first time in the CSV (if available)
-                if df_normal["ts"].dt.tz is not None:
-                    # CSV times are tz-aware, query params are not, need to add the timezone
-                    if start_dt.tz is None:
-                        # Assume query time is US Pacific (consistent with CSV)
-                        import pytz
-                        pacific_tz = pytz.timezone("America/Los_Angeles")
-                        start_dt = pacific_tz.localize(start_dt)
-                        end_dt = pacific_tz.localize(end_dt)
-                
-                df_normal = df_normal[(df_normal["ts"] >= start_dt) & (df_normal["ts"] <= end_dt)]
+                df_normal = normal.between(start_time, end_time)
                 print(f"Filtered normal data: {len(df_normal)} rows between {start_time} and {end_time}")
-            
-            # Convert to list of dict format
-            data = df_normal.to_dict(orient="records")
-        else:
-            data = []
-            print(f"Warning: {normal_data_path} not found")
-        
-        # Read anomaly_results_classified.csv, only select specific columns
-        anomaly_data = []
-        if os.path.exists(anomaly_data_path):
-            df_anomaly = pd.read_csv(anomaly_data_path)
-            # Select only required columns: t_ch0, t_ch1, t_ch2, t_ch3, v_ch0, ts
-            required_cols = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0", "ts"]
-            # Check if columns exist
-            available_cols = [col for col in required_cols if col in df_anomaly.columns]
-            if available_cols:
-                df_anomaly_selected = df_anomaly[available_cols].copy()
-                # Ensure 'ts' is datetime type
-                df_anomaly_selected["ts"] = pd.to_datetime(df_anomaly_selected["ts"], errors="coerce")
-                
-                # If time parameters are provided, do filtering
-                if start_time and end_time:
-                    start_dt = pd.to_datetime(start_time)
-                    end_dt = pd.to_datetime(end_time)
-                    
-                    # Handle timezone (if anomaly data has timezone)
-                    if df_anomaly_selected["ts"].dt.tz is not None:
-                        if start_dt.tz is None:
-                            import pytz
-                            pacific_tz = pytz.timezone("America/Los_Angeles")
-                            start_dt = pacific_tz.localize(start_dt)
-                            end_dt = pacific_tz.localize(end_dt)
-                    
-                    df_anomaly_selected = df_anomaly_selected[
-                        (df_anomaly_selected["ts"] >= start_dt) & (df_anomaly_selected["ts"] <= end_dt)
-                    ]
-                    print(f"Filtered anomaly data: {len(df_anomaly_selected)} rows between {start_time} and {end_time}")
-                
-                anomaly_data = df_anomaly_selected.to_dict(orient="records")
+        elif history_store is None:
+            print(f"Warning: {normal_data_cache.path} not found")
+
+        if history_store is not None:
+            # Only the day/device partitions overlapping the range are opened
+            bounds = (start_time, end_time) if start_time and end_time else (None, None)
+            df_normal = history_store.merge(history_store.read("sensor", *bounds), df_normal)
+            df_anomaly = history_store.read("classified", *bounds, columns=ANOMALY_COLUMNS)
         else:
-            print(f"Warning: {anomaly_data_path} not found")
-        
-        return {
-            "message": "Data retrieved successfully",
-            "data": data,
-            "anomaly_data": anomaly_data
-        }
+            # Only t_ch0, t_ch1, t_ch2, t_ch3, v_ch0 and ts are kept for anomalies
+            anomalies = anomaly_data_cache.get()
+            if anomalies is not None:
+                if len(anomalies.df.columns):
+                    df_anomaly = anomalies.df
+                    if start_time and end_time:
+                        df_anomaly = anomalies.between(start_time, end_time)
+                        print(f"Filtered anomaly data: {len(df_anomaly)} rows between {start_time} and {end_time}")
+            else:
+                print(f"Warning: {anomaly_data_cache.path} not found")
+
+        response = {"message": "Data retrieved successfully"}
+        if max_points is not None and df_normal is not None:
+            raw_points = len(df_normal)
+            keep = None
+            if df_anomaly is not None and "ts" in df_anomaly.columns and "ts" in df_normal.columns:
+                keep = df_normal["ts"].isin(df_anomaly["ts"]).to_numpy()
+            df_normal = downsample(df_normal, max_points, method=sampling, keep=keep)
+            response["downsampling"] = {"method": sampling, "raw_points": raw_points, "points": len(df_normal)}
+
+        response["data"] = df_normal.to_dict(orient="records") if df_normal is not None else []
+        response["anomaly_data"] = df_anomaly.to_dict(orient="records") if df_anomaly is not None else []
+        return response
     except Exception as e:
         import traceback
         print(f"Error in get_data: {str(e)}")
@@ -138,38 +130,42 @@ async def get_data(start_time: str = None, end_time: str = None):
             "anomaly_data": []
         }
 
+def _local_wall(ts):
+    """US Pacific wall time of `ts`, so naive CSV and tz-aware store bounds compare."""
+    import pandas as pd
+
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert(LOCAL_TZ).tz_localize(None) if ts.tz is not None else ts
+
+
 @app.get("/get_time_range")
 async def get_time_range():
-    import pandas as pd
-    
-    normal_data_path = "normal_data.csv"
-    
     try:
-        if os.path.exists(normal_data_path):
-            df = pd.read_csv(normal_data_path)
-            if "ts" in df.columns and len(df) > 0:
-                # Ensure 'ts' is datetime type
-                df["ts"] = pd.to_datetime(df["ts"])
-                # Find earliest and latest time
-                start_time = df["ts"].min().strftime("%Y-%m-%d %H:%M:%S")
-                end_time = df["ts"].max().strftime("%Y-%m-%d %H:%M:%S")
-                return {
-                    "message": "Time range retrieved successfully",
-                    "start_time": start_time,
-                    "end_time": end_time
-                }
-            else:
+        normal = normal_data_cache.get()
+        if history_store is not None:
+            # Store history and the live normal_data.csv feed together
+            ranges = [r for r in (history_store.time_range("sensor"), normal.time_range() if normal else None) if r]
+            time_range = (min(_local_wall(r[0]) for r in ranges), max(_local_wall(r[1]) for r in ranges)) \
+                if ranges else None
+        else:
+            if normal is None:
                 return {
-                    "message": "No timestamp data found in CSV",
+                    "message": f"File {normal_data_cache.path} not found",
                     "start_time": "",
                     "end_time": ""
                 }
-        else:
+            time_range = normal.time_range()
+        if time_range is None:
             return {
-                "message": f"File {normal_data_path} not found",
+                "message": "No timestamp data found in CSV",
                 "start_time": "",
                 "end_time": ""
             }
+        return {
+            "message": "Time range retrieved successfully",
+            "start_time": time_range[0].strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": time_range[1].strftime("%Y-%m-%d %H:%M:%S")
+        }
     except Exception as e:
         return {
             "message": f"Error reading time range: {str(e)}",
@@ -177,6 +173,14 @@ async def get_time_range():
             "end_time": ""
         }
 
+
+@app.post("/data/reload")
+async def reload_data():
+    """Drop the cached CSVs (e.g. after replacing a file in place); the next read reloads them."""
+    normal_data_cache.reload()
+    anomaly_data_cache.reload()
+    return {"message": "Data caches cleared", "caches": [normal_data_cache.stats(), anomaly_data_cache.stats()]}
+
 @app.get("/get_anomaly_list")
 async def get_anomaly_list():
     import pandas as pd
@@ -198,22 +202,98 @@ async def get_anomaly_list():
         }
 
 @app.get("/get_dynamic_tree")
-async def get_dynamic_tree():
-    import json
-    
-    tree_file_path = "anomaly_results_classified_tree.json"
-    
+async def get_dynamic_tree(request: Request):
+    # Served from the in-memory tree's cached serialization; no file read or re-parse.
     try:
-        if os.path.exists(tree_file_path):
-            with open(tree_file_path, "r", encoding="utf-8") as f:
-                tree_data = json.load(f)
-            return tree_data
-        else:
-            return {"error": f"File {tree_file_path} not found"}
-    except json.JSONDecodeError as e:
-        return {"error": f"Invalid JSON format: {str(e)}"}
+        version, body = tree_export()
     except Exception as e:
-        return {"error": f"Error reading file: {str(e)}"}
+        return {"error": f"Error loading tree: {str(e)}"}
+    etag = f'"tree-{version}"'
+    headers = {"ETag": etag, "X-Tree-Version": str(version)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Contribution analysis can run on several workers at once, but the template tree
+# and the shared CSV outputs are not safe for concurrent writers.
+_tree_lock = threading.Lock()
+
+
+def _store_history(job, dataset, rows):
+    """Append `rows` to the history store, if one is configured; a failed write does not fail the job."""
+    if history_store is None or rows is None or len(rows) == 0:
+        return
+    try:
+        with job.stage(f"store_{dataset}"):
+            history_store.append(dataset, rows)
+    except Exception as e:
+        print(f"[warning] history store write ({dataset}) failed: {e}")
+
+
+def process_anomaly_batch(job, payload):
+    """Worker-side processing of one /anomaly_data batch (runs off the event loop)."""
+    data = payload["data"]
+    anomaly_timestamps = payload["anomaly_timestamps"]
+
+    # Perform contribution analysis
+    print(f"\n[job {job.id}] Starting contribution analysis...")
+    _store_history(job, "sensor", data)
+    with job.stage("contribution_analysis"):
+        contribution_results = analyze_anomaly_contributions(data, anomaly_timestamps)
+
+    if contribution_results is None:
+        return {
+            "message": "Anomaly data received but contribution analysis failed",
+            "anomaly_count": len(anomaly_timestamps),
+            "data_points_count": len(data),
+            "processing_time": datetime.now().isoformat(),
+            "contribution_analysis": {
+                "completed": False,
+                "error": "Could not analyze contributions"
+            }
+        }
+
+    output_filename = "backend_anomaly_contribution_results.csv"
+    tree_error = None
+    with _tree_lock:
+        # Save results to CSV
+        with job.stage("save_results"):
+            saved_file = save_contribution_results(results_df=contribution_results, output_file=output_filename)
+        _store_history(job, "contributions", contribution_results)
+
+        # Build/extend anomaly tree using the saved CSV
+        try:
+            with job.stage("tree_generation"):
+                tree_result = generate_anomaly_tree(csv_path=saved_file, request_id=job.id)
+            _store_history(job, "classified", tree_result["csv_df"])
+        except Exception as e:
+            print(f"[warning] generate_anomaly_tree failed: {e}")
+            tree_error = str(e)
+
+    response_data = {
+        "message": "Anomaly data received and analyzed successfully",
+        "anomaly_count": len(anomaly_timestamps),
+        "data_points_count": len(data),
+        "processing_time": datetime.now().isoformat(),
+        "contribution_analysis": {
+            "completed": True,
+            "results_file": saved_file,
+            "analyzed_anomalies": len(contribution_results)
+        },
+        "tree_generation": {
+            "completed": tree_error is None,
+            "error": tree_error
+        }
+    }
+    return response_data
+
+
+job_queue = JobQueue(
+    handler=process_anomaly_batch,
+    num_workers=int(os.environ.get("ANOMALY_JOB_WORKERS", "2")),
+    max_queue_size=int(os.environ.get("ANOMALY_JOB_QUEUE_SIZE", "8")),
+)
 
 
 @app.post("/anomaly_data")
@@ -221,54 +301,11 @@ async def receive_anomaly_data(payload: AnomalyDataPayload):
     print(f"Received anomaly detection results at {payload.time}")
     print(f"Number of data points: {len(payload.data)}")
     print(f"Number of anomalies detected: {len(payload.anomaly_timestamps)}")
-    
-    if payload.anomaly_timestamps:
-        print(f"Anomaly timestamps: {payload.anomaly_timestamps[:5]}...")  # Show first 5
-        
-        # Perform contribution analysis
-        print("\nStarting contribution analysis...")
-        contribution_results = analyze_anomaly_contributions(
-            payload.data, 
-            payload.anomaly_timestamps
-        )
-        
-        output_filename = "backend_anomaly_contribution_results.csv"
-        # Save results to CSV
-        saved_file = save_contribution_results(results_df = contribution_results, output_file = output_filename)
-        
-        if contribution_results is not None:
-            # Build/extend anomaly tree using the saved CSV
-            try:
-                generate_anomaly_tree(csv_path=saved_file)
-            except Exception as e:
-                print(f"[warning] generate_anomaly_tree failed: {e}")
-            
-            response_data = {
-                "message": "Anomaly data received and analyzed successfully", 
-                "anomaly_count": len(payload.anomaly_timestamps),
-                "data_points_count": len(payload.data),
-                "processing_time": datetime.now().isoformat(),
-                "contribution_analysis": {
-                    "completed": True,
-                    "results_file": saved_file,
-                    "analyzed_anomalies": len(contribution_results)
-                }
-            }
-        else:
-            response_data = {
-                "message": "Anomaly data received but contribution analysis failed", 
-                "anomaly_count": len(payload.anomaly_timestamps),
-                "data_points_count": len(payload.data),
-                "processing_time": datetime.now().isoformat(),
-                "contribution_analysis": {
-                    "completed": False,
-                    "error": "Could not analyze contributions"
-                }
-            }
-    else:
+
+    if not payload.anomaly_timestamps:
         print("No anomalies detected in this batch")
-        response_data = {
-            "message": "Data received - no anomalies to analyze", 
+        return {
+            "message": "Data received - no anomalies to analyze",
             "anomaly_count": 0,
             "data_points_count": len(payload.data),
             "processing_time": datetime.now().isoformat(),
@@ -277,5 +314,147 @@ async def receive_anomaly_data(payload: AnomalyDataPayload):
                 "reason": "No anomalies to analyze"
             }
         }
-    
-    return response_data
+
+    print(f"Anomaly timestamps: {payload.anomaly_timestamps[:5]}...")  # Show first 5
+
+    try:
+        job = job_queue.submit(
+            {"data": payload.data, "anomaly_timestamps": payload.anomaly_timestamps},
+            meta={
+                "batch_time": payload.time,
+                "anomaly_count": len(payload.anomaly_timestamps),
+                "data_points_count": len(payload.data),
+            },
+        )
+    except QueueFullError as e:
+        # Backpressure: tell the edge client to retry instead of piling up work.
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "30"},
+            content={"message": str(e), **job_queue.stats()},
+        )
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "message": "Anomaly data accepted for processing",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "anomaly_count": len(payload.anomaly_timestamps),
+            "data_points_count": len(payload.data),
+            "queue_depth": job_queue.depth(),
+        },
+    )
+
+
+def process_backlog_drain(job, payload):
+    """Worker-side classification of anomalies deferred by the LLM budget."""
+    with _tree_lock:
+        with job.stage("tree_generation"):
+            result = drain_anomaly_backlog(payload["backlog_path"], request_id=job.id)
+        if result is not None:
+            _store_history(job, "classified", result["csv_df"])
+    if result is None:
+        return {"message": "Backlog is empty", "classified": 0, "deferred": 0}
+    return {
+        "message": "Backlog processed",
+        "classified": len(result["csv_df"]),
+        "deferred": result["deferred"],
+    }
+
+
+@app.get("/anomaly_backlog")
+async def get_anomaly_backlog():
+    import pandas as pd
+
+    backlog_path = "anomaly_backlog.csv"
+    if not os.path.exists(backlog_path):
+        return {"pending": 0}
+    try:
+        return {"pending": len(pd.read_csv(backlog_path))}
+    except pd.errors.EmptyDataError:
+        return {"pending": 0}
+
+
+@app.post("/anomaly_backlog/drain")
+async def drain_backlog():
+    try:
+        job = job_queue.submit(
+            {"backlog_path": "anomaly_backlog.csv"},
+            meta={"kind": "backlog_drain"},
+            handler=process_backlog_drain,
+        )
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "30"},
+            content={"message": str(e), **job_queue.stats()},
+        )
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Backlog drain accepted", "job_id": job.id, "status_url": f"/jobs/{job.id}"},
+    )
+
+
+def process_tree_compaction(job, payload):
+    """Worker-side tree maintenance: retention, depth/fan-out caps, sparse-leaf merging."""
+    with _tree_lock:
+        with job.stage("compaction"):
+            return compact_tree()
+
+
+def _submit_compaction(meta_kind="tree_compaction"):
+    return job_queue.submit({}, meta={"kind": meta_kind}, handler=process_tree_compaction)
+
+
+@app.post("/tree/compact")
+async def compact_tree_endpoint():
+    try:
+        job = _submit_compaction()
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "30"},
+            content={"message": str(e), **job_queue.stats()},
+        )
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Tree compaction accepted", "job_id": job.id, "status_url": f"/jobs/{job.id}"},
+    )
+
+
+def _compaction_timer(interval_s):
+    """Queue a compaction job every `interval_s` seconds (daemon thread)."""
+    def tick():
+        try:
+            _submit_compaction(meta_kind="scheduled_tree_compaction")
+        except QueueFullError:
+            print("[compaction] job queue full; skipping this scheduled run")
+        _compaction_timer(interval_s)
+    timer = threading.Timer(interval_s, tick)
+    timer.daemon = True
+    timer.start()
+
+
+_compaction_interval = float(os.environ.get("ANOMALY_TREE_COMPACT_INTERVAL_S", "0"))
+if _compaction_interval > 0:
+    _compaction_timer(_compaction_interval)
+
+
+@app.get("/jobs")
+async def get_jobs():
+    return job_queue.stats()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    return job.to_dict()
+
+
+@app.get("/llm/usage")
+async def get_llm_usage():
+    """LLM calls, tokens, latency and cost attributed to each request (job id), device and model."""
+    return llm_usage()
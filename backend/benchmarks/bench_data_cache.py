@@ -0,0 +1,135 @@
+# bench_data_cache.py
+"""
+/get_data and /get_time_range latency with the time-indexed data cache vs. the
+previous per-request read_csv + to_datetime + boolean mask, on a generated
+normal_data.csv of --rows rows (1 Hz, tz-aware Pacific timestamps) plus an
+anomaly CSV of --anomalies rows.
+
+Each /get_data request asks for a random --window-s window; both variants
+build the same record dicts. Reported per variant: p50/p99 over the requests
+(the cached variant's first load is reported separately).
+
+    python benchmarks/bench_data_cache.py --rows 2000000 --legacy-requests 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from data_cache import TimeSeriesCache, LOCAL_TZ  # noqa: E402
+
+ANOMALY_COLUMNS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0", "ts"]
+
+
+def make_csvs(workdir, rows, anomalies, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2025-01-06 00:00:00", periods=rows, freq="s", tz=LOCAL_TZ)
+    df = pd.DataFrame({c: rng.normal(25.0, 2.0, rows).round(3) for c in ANOMALY_COLUMNS[:-1]})
+    df["ts"] = ts.strftime("%Y-%m-%d %H:%M:%S%z").str.replace(r"(\d\d)(\d\d)$", r"\1:\2", regex=True)
+    normal_path = os.path.join(workdir, "normal_data.csv")
+    df.to_csv(normal_path, index=False)
+    picked = df.iloc[np.sort(rng.choice(rows, size=min(anomalies, rows), replace=False))].copy()
+    picked["classification"] = "sensor/temperature"
+    anomaly_path = os.path.join(workdir, "anomaly_results_classified.csv")
+    picked.to_csv(anomaly_path, index=False)
+    return normal_path, anomaly_path, ts
+
+
+def legacy_get_data(normal_path, anomaly_path, start, end):
+    df = pd.read_csv(normal_path)
+    df["ts"] = pd.to_datetime(df["ts"])
+    start_dt = pd.Timestamp(start).tz_localize(LOCAL_TZ)
+    end_dt = pd.Timestamp(end).tz_localize(LOCAL_TZ)
+    data = df[(df["ts"] >= start_dt) & (df["ts"] <= end_dt)].to_dict(orient="records")
+    an = pd.read_csv(anomaly_path)[ANOMALY_COLUMNS].copy()
+    an["ts"] = pd.to_datetime(an["ts"], errors="coerce")
+    anomaly_data = an[(an["ts"] >= start_dt) & (an["ts"] <= end_dt)].to_dict(orient="records")
+    return data, anomaly_data
+
+
+def legacy_get_time_range(normal_path):
+    df = pd.read_csv(normal_path)
+    df["ts"] = pd.to_datetime(df["ts"])
+    return df["ts"].min().strftime("%Y-%m-%d %H:%M:%S"), df["ts"].max().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def cached_get_data(normal_cache, anomaly_cache, start, end):
+    data = normal_cache.get().between(start, end).to_dict(orient="records")
+    anomaly_data = anomaly_cache.get().between(start, end).to_dict(orient="records")
+    return data, anomaly_data
+
+
+def cached_get_time_range(normal_cache):
+    lo, hi = normal_cache.get().time_range()
+    return lo.strftime("%Y-%m-%d %H:%M:%S"), hi.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def fmt(samples):
+    return f"p50={np.percentile(samples, 50) * 1000:10.2f}ms p99={np.percentile(samples, 99) * 1000:10.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--anomalies", type=int, default=20_000)
+    parser.add_argument("--window-s", type=int, default=3600, help="queried range per /get_data request")
+    parser.add_argument("--requests", type=int, default=200, help="requests per cached variant")
+    parser.add_argument("--legacy-requests", type=int, default=5, help="requests per legacy variant")
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        normal_path, anomaly_path, ts = make_csvs(workdir, args.rows, args.anomalies)
+        size_mb = os.path.getsize(normal_path) / 1e6
+
+        def window():
+            i = rnd.randrange(0, max(1, args.rows - args.window_s))
+            start = ts[i].tz_localize(None)
+            return str(start), str(start + pd.Timedelta(seconds=args.window_s))
+
+        print(f"rows={args.rows} ({size_mb:.0f} MB) anomalies={args.anomalies} window={args.window_s}s")
+        legacy_data = timed(lambda: legacy_get_data(normal_path, anomaly_path, *window()), args.legacy_requests)
+        legacy_range = timed(lambda: legacy_get_time_range(normal_path), args.legacy_requests)
+
+        normal_cache = TimeSeriesCache(normal_path)
+        anomaly_cache = TimeSeriesCache(anomaly_path, columns=ANOMALY_COLUMNS, coerce=True)
+        started = time.perf_counter()
+        normal_cache.get(), anomaly_cache.get()
+        first_load = time.perf_counter() - started
+        cached_data = timed(lambda: cached_get_data(normal_cache, anomaly_cache, *window()), args.requests)
+        cached_range = timed(lambda: cached_get_time_range(normal_cache), args.requests)
+
+        start, end = window()
+        assert legacy_get_data(normal_path, anomaly_path, start, end) == \
+            cached_get_data(normal_cache, anomaly_cache, start, end)
+        assert legacy_get_time_range(normal_path) == cached_get_time_range(normal_cache)
+
+    print(f"{'/get_data legacy':<24} {fmt(legacy_data)}  (n={len(legacy_data)})")
+    print(f"{'/get_data cached':<24} {fmt(cached_data)}  (n={len(cached_data)})")
+    print(f"{'/get_time_range legacy':<24} {fmt(legacy_range)}  (n={len(legacy_range)})")
+    print(f"{'/get_time_range cached':<24} {fmt(cached_range)}  (n={len(cached_range)})")
+    print(f"cache first load: {first_load:.2f}s (paid once per file change)")
+    print(f"/get_data p50 speedup: {np.percentile(legacy_data, 50) / np.percentile(cached_data, 50):.0f}x, "
+          f"/get_time_range p50 speedup: {np.percentile(legacy_range, 50) / np.percentile(cached_range, 50):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
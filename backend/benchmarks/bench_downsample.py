@@ -0,0 +1,83 @@
+# bench_downsample.py
+"""
+/get_data response size and latency over 1h, 1d and 30d ranges: every raw
+row vs. max_points downsampling ("minmax" and "lttb"), on a generated 1 Hz
+sensor history with --spikes one-sample spikes in t_ch0.
+
+Latency covers what the handler does after the range lookup: slice,
+downsample, to_dict, and JSON encoding (json.dumps, str for timestamps).
+"spikes kept" counts injected spikes still present without the anomaly
+keep-mask, i.e. what the sampling itself preserves.
+
+    python benchmarks/bench_downsample.py --days 30 --max-points 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from data_cache import LOCAL_TZ, TimeIndexedFrame  # noqa: E402
+from downsample import downsample, METHODS  # noqa: E402
+
+CHANNELS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0"]
+RANGES = {"1h": pd.Timedelta(hours=1), "1d": pd.Timedelta(days=1), "30d": pd.Timedelta(days=30)}
+
+
+def make_frame(days, spikes, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(days * 86400)
+    ts = pd.Series(pd.date_range("2025-01-06 00:00:00", periods=n, freq="s", tz=LOCAL_TZ))
+    df = pd.DataFrame({"ts": ts, **{c: (25.0 + np.sin(np.arange(n) / 3600.0) + rng.normal(0, 0.2, n)).round(3)
+                                    for c in CHANNELS}})
+    spike_rows = np.sort(rng.choice(n, size=spikes, replace=False))
+    df.loc[spike_rows, "t_ch0"] += 15.0
+    return TimeIndexedFrame(df, "ts", stat=None), spike_rows
+
+
+def serve(frame, start, end, max_points, method):
+    df = frame.between(start, end)
+    if max_points:
+        df = downsample(df, max_points, method=method)
+    body = json.dumps({"data": df.to_dict(orient="records")}, default=str)
+    return df, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--max-points", type=int, default=2000)
+    parser.add_argument("--spikes", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    frame, spike_rows = make_frame(args.days, args.spikes)
+    spike_ts = set(frame.df["ts"].iloc[spike_rows])
+    first = frame.df["ts"].iloc[0].tz_localize(None)
+    print(f"rows={len(frame)} ({args.days:g} days at 1 Hz, {len(CHANNELS)} channels) "
+          f"max_points={args.max_points} spikes={args.spikes}")
+    print(f"{'range':>5} {'variant':>7} {'points':>9} {'JSON MB':>9} {'p50 ms':>9} {'spikes kept':>12}")
+    for label, span in RANGES.items():
+        start, end = str(first), str(first + span - pd.Timedelta(seconds=1))
+        for method in (None,) + METHODS:
+            samples = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                df, body = serve(frame, start, end, args.max_points if method else None, method)
+                samples.append(time.perf_counter() - started)
+            in_range = sum(1 for t in spike_ts if pd.Timestamp(start).tz_localize(LOCAL_TZ) <= t
+                           <= pd.Timestamp(end).tz_localize(LOCAL_TZ))
+            kept = int(df["ts"].isin(spike_ts).sum())
+            print(f"{label:>5} {method or 'raw':>7} {len(df):>9} {len(body) / 1e6:>9.2f} "
+                  f"{np.median(samples) * 1000:>9.1f} {f'{kept}/{in_range}':>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench_history_store.py
+"""
+Flat CSV vs. the day/device-partitioned Parquet history store: on-disk
+footprint and scan time for typical reads of a generated sensor history of
+--rows rows (1 Hz per device, --devices devices, tz-aware Pacific timestamps).
+
+CSV reads are what the backend did per request: read_csv, parse ts, mask.
+Store reads go through HistoryStore.read (partition pruning, column
+projection, row-group statistics). Median of --repeats runs each.
+
+    python benchmarks/bench_history_store.py --rows 2000000 --devices 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from data_cache import LOCAL_TZ  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+from migrate_history import migrate  # noqa: E402
+
+CHANNELS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0"]
+
+
+def make_csv(path, rows, devices, seed=0):
+    rng = np.random.default_rng(seed)
+    per_device = rows // devices
+    ts = pd.date_range("2025-01-06 00:00:00", periods=per_device, freq="s", tz=LOCAL_TZ)
+    ts_str = ts.strftime("%Y-%m-%d %H:%M:%S%z").str.replace(r"(\d\d)(\d\d)$", r"\1:\2", regex=True)
+    df = pd.DataFrame({
+        "ts": np.tile(ts_str, devices),
+        "device": np.repeat([f"edge-{i}" for i in range(devices)], per_device),
+        **{c: rng.normal(25.0, 2.0, per_device * devices).round(3) for c in CHANNELS},
+    })
+    df.sort_values("ts", kind="stable").to_csv(path, index=False)
+    return ts
+
+
+def csv_read(path, start=None, end=None, device=None, columns=None):
+    df = pd.read_csv(path)
+    df["ts"] = pd.to_datetime(df["ts"])
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= (df["ts"] >= pd.Timestamp(start).tz_localize(LOCAL_TZ)) & \
+                (df["ts"] <= pd.Timestamp(end).tz_localize(LOCAL_TZ))
+    if device is not None:
+        mask &= df["device"] == device
+    df = df[mask]
+    return df[columns] if columns else df
+
+
+def median_s(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "normal_data.csv")
+        ts = make_csv(csv_path, args.rows, args.devices)
+        store = HistoryStore(os.path.join(workdir, "history_store"))
+        started = time.perf_counter()
+        migrate(store, "sensor", csv_path)
+        migrate_s = time.perf_counter() - started
+        files, store_bytes = store.footprint("sensor")
+        csv_bytes = os.path.getsize(csv_path)
+
+        mid = ts[len(ts) // 2].tz_localize(None)
+        hour = (str(mid), str(mid + pd.Timedelta(hours=1)))
+        day = (str(mid.normalize()), str(mid.normalize() + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)))
+        cases = [
+            ("full scan", lambda: csv_read(csv_path), lambda: store.read("sensor")),
+            ("1 hour, all devices", lambda: csv_read(csv_path, *hour), lambda: store.read("sensor", *hour)),
+            ("1 day, 1 device, 2 cols",
+             lambda: csv_read(csv_path, *day, device="edge-0", columns=["ts", "t_ch0"]),
+             lambda: store.read("sensor", *day, devices=["edge-0"], columns=["ts", "t_ch0"])),
+            ("time range",
+             lambda: (lambda s: (s.min(), s.max()))(pd.to_datetime(pd.read_csv(csv_path, usecols=["ts"])["ts"])),
+             lambda: store.time_range("sensor")),
+        ]
+        assert len(csv_read(csv_path, *hour)) == len(store.read("sensor", *hour))
+
+        print(f"rows={args.rows} devices={args.devices} span={len(ts) / 86400:.1f} days")
+        print(f"footprint: CSV {csv_bytes / 1e6:.1f} MB, store {store_bytes / 1e6:.1f} MB in {files} files "
+              f"({store_bytes / csv_bytes:.1%} of CSV); migration {migrate_s:.1f}s")
+        print(f"{'read':<26} {'CSV s':>9} {'store s':>9} {'speedup':>8}")
+        for name, csv_fn, store_fn in cases:
+            a, b = median_s(csv_fn, args.repeats), median_s(store_fn, args.repeats)
+            print(f"{name:<26} {a:>9.3f} {b:>9.3f} {a / b:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
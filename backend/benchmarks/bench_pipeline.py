@@ -0,0 +1,96 @@
+# bench_pipeline.py
+"""
+Throughput of AnomalyTreeBuilder.run() sequentially vs. with the concurrent
+template-extraction pipeline, against the local fake LLM server (--backend
+openai) or the in-process fake backend (--backend fake, which can also inject
+failures to exercise retries).
+
+    python benchmarks/bench_pipeline.py --records 40 --latency 0.2 --concurrency 1 4 8
+    python benchmarks/bench_pipeline.py --backend fake --failure-rate 0.05
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import start_server  # noqa: E402
+from generate_tree import pipeline_prompts  # noqa: E402
+
+SENSORS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0"]
+
+
+def make_contribution_csv(path, n_records, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"ts": pd.date_range("2024-01-01", periods=n_records, freq="10min").astype(str)})
+    for s in SENSORS:
+        df[f"contribution_{s}"] = rng.random(n_records).round(4)
+    df["overall_anomaly_score"] = rng.random(n_records).round(4)
+    df.to_csv(path, index=False)
+    return path
+
+
+def run_once(csv_path, workdir, concurrency):
+    from lib.anomaly_tree_builder import AnomalyTreeBuilder
+
+    builder = AnomalyTreeBuilder(
+        csv_path=csv_path, prompts=pipeline_prompts(),
+        base_path=os.path.join(workdir, "templates_storage"), reset_tree=True,
+    )
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = builder.run(out_path=os.path.join(workdir, "classified.csv"), concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(out["csv_df"]), builder.agent.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency per call (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backend", choices=("openai", "fake"), default="openai",
+                        help="openai: OpenAI client against the fake HTTP server; fake: in-process, no sockets")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="injected transient failures (fake only)")
+    args = parser.parse_args()
+
+    server = None
+    os.environ["LLM_BACKEND"] = args.backend
+    if args.backend == "fake":
+        os.environ["LLM_FAKE_LATENCY_S"] = str(args.latency)
+        os.environ["LLM_FAKE_FAILURE_RATE"] = str(args.failure_rate)
+        os.environ.setdefault("LLM_RETRY_BASE_S", "0.05")
+        target = "in-process fake backend"
+    else:
+        server, base_url = start_server(latency=args.latency)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        target = f"fake server={base_url}"
+
+    print(f"records={args.records} latency={args.latency}s {target}")
+    print(f"{'concurrency':>11} {'seconds':>9} {'records/s':>10} {'llm calls':>10} {'speedup':>8}")
+    baseline = None
+    try:
+        for c in args.concurrency:
+            with tempfile.TemporaryDirectory() as workdir:
+                csv_path = make_contribution_csv(os.path.join(workdir, "contrib.csv"), args.records)
+                elapsed, n, calls = run_once(csv_path, workdir, c)
+            baseline = baseline or elapsed
+            print(f"{c:>11} {elapsed:>9.2f} {n / elapsed:>10.2f} {calls:>10} {baseline / elapsed:>7.2f}x")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
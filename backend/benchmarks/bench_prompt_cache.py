@@ -0,0 +1,105 @@
+# bench_prompt_cache.py
+"""
+Provider prompt-cache hit ratio with the canonical prompt tree vs. the legacy
+serialization (children in insertion order, exemplars seeded with the newest
+template, exact "(+N more)" counts), on the same records.
+
+Runs on the in-process fake backend, which reports cached_tokens like
+provider prefix caching (>= 1024-token prefix, 128-token steps). Against the
+real API the same ratios come from usage.input_tokens_details.cached_tokens
+and are printed per stage as [llm-stage] ... of input cached.
+
+    python benchmarks/bench_prompt_cache.py --records 80
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import make_contribution_csv  # noqa: E402
+from generate_tree import pipeline_prompts  # noqa: E402
+from lib.anomaly_tree_builder import AnomalyTreeBuilder  # noqa: E402
+from lib.exemplars import template_signature, jaccard_distance  # noqa: E402
+from lib.llm_backends import FakeBackend  # noqa: E402
+from lib.template_tree_manager import TemplateTreeManager  # noqa: E402
+
+def legacy_select_diverse(templates, k):
+    """Previous exemplar pick: farthest-point selection seeded with the newest template."""
+    n = len(templates)
+    if k <= 0 or n == 0:
+        return []
+    if n <= k:
+        return list(templates)
+    sigs = [template_signature(t) for t in templates]
+    chosen = [n - 1]
+    nearest = [jaccard_distance(sigs[i], sigs[n - 1]) for i in range(n)]
+    while len(chosen) < k:
+        best, best_d = None, -1.0
+        for i in range(n - 1, -1, -1):
+            if nearest[i] > best_d:
+                best, best_d = i, nearest[i]
+        if best is None or best_d <= 0.0:
+            break
+        chosen.append(best)
+        for i in range(n):
+            nearest[i] = min(nearest[i], jaccard_distance(sigs[i], sigs[best]))
+    return [templates[i] for i in sorted(chosen)]
+
+
+class LegacyPromptTreeManager(TemplateTreeManager):
+    def prompt_tree(self, node):
+        if node.is_leaf():
+            shown = legacy_select_diverse(node.exemplars.items(), self.prompt_exemplars)
+            hidden = node.template_count - len(shown)
+            return shown + ([f"(+{hidden} more)"] if hidden > 0 else [])
+        return {k: self.prompt_tree(v) for k, v in node.children.items()}
+
+
+def run_once(csv_path, workdir, manager_cls, label):
+    manager = manager_cls(base_path=os.path.join(workdir, f"templates_storage_{label}"), reset=True)
+    builder = AnomalyTreeBuilder(csv_path=csv_path, prompts=pipeline_prompts(), tree_manager=manager,
+                                 llm_backend=FakeBackend())
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.run(out_path=os.path.join(workdir, f"classified_{label}.csv"))
+    return builder.agent.stage_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=80)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = make_contribution_csv(os.path.join(workdir, "contrib.csv"), args.records)
+        results = {
+            "legacy": run_once(csv_path, workdir, LegacyPromptTreeManager, "legacy"),
+            "canonical": run_once(csv_path, workdir, TemplateTreeManager, "canonical"),
+        }
+
+    print(f"records={args.records} (fake backend, simulated prefix cache)")
+    print(f"{'layout':>10} {'stage':>10} {'calls':>6} {'input tokens':>12} {'cached':>9} {'ratio':>7} {'uncached':>9}")
+    uncached = {}
+    for label, stages in results.items():
+        total_in = total_cached = 0
+        for stage, st in sorted(stages.items()):
+            total_in += st["input_tokens"]
+            total_cached += st["cached_tokens"]
+            print(f"{label:>10} {stage:>10} {st['llm_calls']:>6} {st['input_tokens']:>12} "
+                  f"{st['cached_tokens']:>9} {st['cached_ratio']:>7.1%} {st['input_tokens'] - st['cached_tokens']:>9}")
+        uncached[label] = total_in - total_cached
+        print(f"{label:>10} {'all':>10} {'':>6} {total_in:>12} {total_cached:>9} "
+              f"{total_cached / total_in if total_in else 0.0:>7.1%} {uncached[label]:>9}")
+    if uncached["legacy"]:
+        print(f"uncached (full-price) input tokens: {1 - uncached['canonical'] / uncached['legacy']:.1%} fewer "
+              f"with the canonical layout")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench_prompt_size.py
+"""
+Routing-prompt size as the template tree grows: the full pretty-printed tree
+(every stored template, indent=2) vs. the bounded compact view used now.
+
+    python benchmarks/bench_prompt_size.py --sizes 10 100 1000 10000 --exemplars 3
+
+Token counts use tiktoken (o200k_base) when installed, else ~4 chars/token.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from lib.my_prompts import ROUTE_SELECTION_FEW_SHOT  # noqa: E402
+from lib.template_tree_manager import TemplateTreeManager  # noqa: E402
+
+LEAVES = {
+    "Temp-related": ["SingleSensorDrift", "PartialGroupDrift", "UniformGroupDrift"],
+    "Volt-related": ["SingleSensorDrift"],
+    "Cross-domain": ["TempVoltBalance"],
+}
+SENSORS = {"Temp-related": ["t_ch0", "t_ch1", "t_ch2", "t_ch3"], "Volt-related": ["v_ch0"],
+           "Cross-domain": ["t_ch0", "t_ch2", "v_ch0"]}
+
+
+def count_tokens_fn():
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(enc.encode(text)), "tiktoken"
+    except Exception:
+        return lambda text: len(text) // 4, "chars/4"
+
+
+def random_template(rng, domain):
+    sensors = rng.sample(SENSORS[domain], k=rng.randint(1, len(SENSORS[domain])))
+    vals = ", ".join(f"~{rng.uniform(0.5, 1.0):.2f}" for _ in sensors)
+    return f"{' and '.join(sensors)} are elevated ({vals}) while others remain low (~{rng.uniform(0, 0.4):.2f})."
+
+
+def build_tree(base, n_templates, seed=0):
+    rng = random.Random(seed)
+    manager = TemplateTreeManager(base_path=base, reset=True)
+    leaves = []
+    for domain, subs in LEAVES.items():
+        parent = manager.create_child(manager.tree, domain)
+        for sub in subs:
+            leaves.append((domain, manager.create_child(parent, sub)))
+    for i in range(n_templates):
+        domain, leaf = leaves[i % len(leaves)]
+        manager.add_template(leaf, random_template(rng, domain), ts=f"{i:08d}")
+    manager.close()
+    return manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--exemplars", type=int, default=3)
+    args = parser.parse_args()
+    count, method = count_tokens_fn()
+    template = "t_ch1 and t_ch2 are elevated (~0.81, ~0.77) while others remain low (~0.12)."
+
+    print(f"token counting: {method}; exemplars per leaf: {args.exemplars}")
+    print(f"{'templates':>9} {'full tokens':>12} {'compact tokens':>15} {'reduction':>10} {'compact build ms':>17}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = build_tree(os.path.join(tmp, "templates_storage"), n)
+            manager.prompt_exemplars = args.exemplars
+            full = ROUTE_SELECTION_FEW_SHOT + "Error Tree:\n" + json.dumps(
+                manager.tree_structure(manager.tree, for_display=False), indent=2, ensure_ascii=False
+            ) + f"\n\nTemplate:\n{template}\n"
+            started = time.perf_counter()
+            compact = ROUTE_SELECTION_FEW_SHOT + manager.prompt_tree_section(manager.tree) + \
+                f"\n\nTemplate:\n{template}\n"
+            build_ms = (time.perf_counter() - started) * 1000
+            full_t, compact_t = count(full), count(compact)
+            print(f"{n:>9} {full_t:>12} {compact_t:>15} {full_t / compact_t:>9.1f}x {build_ms:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_route_batch.py
+"""
+Batched routing vs. one route call per template: LLM calls, route prompt
+tokens and wall-clock for the same records, on the in-process fake backend
+(latency per call plus per output token, so longer batched answers cost more).
+
+The tree is first grown from --warmup records (unbatched, not measured), so
+the measured batch runs against a mostly settled tree as in steady state;
+--warmup 0 measures the cold start, where most routes go stale.
+
+    python benchmarks/bench_route_batch.py --records 60 --batch-sizes 1 4 8 --concurrency 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import make_contribution_csv  # noqa: E402
+from generate_tree import pipeline_prompts  # noqa: E402
+from lib.anomaly_tree_builder import AnomalyTreeBuilder  # noqa: E402
+from lib.llm_backends import FakeBackend  # noqa: E402
+
+def _builder(csv_path, base_path, batch_size, latency, output_token_s, reset):
+    return AnomalyTreeBuilder(
+        csv_path=csv_path, prompts=pipeline_prompts(), base_path=base_path, reset_tree=reset,
+        llm_backend=FakeBackend(latency_s=latency, output_token_s=output_token_s),
+        route_batch_size=batch_size,
+    )
+
+
+def run_once(csv_path, warmup_csv, workdir, batch_size, concurrency, latency, output_token_s):
+    base_path = os.path.join(workdir, f"templates_storage_{batch_size}")
+    if warmup_csv:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _builder(warmup_csv, base_path, 1, 0.0, 0.0, reset=True).run(
+                out_path=os.path.join(workdir, f"warmup_{batch_size}.csv"), concurrency=concurrency)
+    builder = _builder(csv_path, base_path, batch_size, latency, output_token_s, reset=not warmup_csv)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = builder.run(out_path=os.path.join(workdir, f"classified_{batch_size}.csv"), concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    stages = builder.agent.stage_stats()
+    routing = [stages[s] for s in ("route", "route_batch") if s in stages]
+    return {
+        "seconds": elapsed,
+        "records": len(out["csv_df"]),
+        "calls": builder.agent.calls,
+        "route_calls": sum(s["llm_calls"] for s in routing),
+        "route_tokens": sum(s["input_tokens"] for s in routing),
+        "input_tokens": sum(s["input_tokens"] for s in stages.values()),
+        "rerouted": builder.route_stats["stale"],
+        "fallbacks": builder.route_stats.get("fallbacks", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=60)
+    parser.add_argument("--warmup", type=int, default=60, help="records used to grow the tree first")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency per call (s)")
+    parser.add_argument("--output-token-s", type=float, default=0.002, help="fake latency per output token (s)")
+    args = parser.parse_args()
+
+    print(f"records={args.records} warmup={args.warmup} concurrency={args.concurrency} latency={args.latency}s "
+          f"+{args.output_token_s * 1000:.1f}ms/output token (in-process fake backend)")
+    print(f"{'batch':>5} {'seconds':>8} {'calls':>6} {'route calls':>11} {'route tokens':>12} "
+          f"{'all in tokens':>13} {'re-routed':>9} {'fallbacks':>9}")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = make_contribution_csv(os.path.join(workdir, "contrib.csv"), args.records)
+        warmup_csv = make_contribution_csv(os.path.join(workdir, "warmup.csv"), args.warmup, seed=1) \
+            if args.warmup else None
+        for b in args.batch_sizes:
+            r = results[b] = run_once(csv_path, warmup_csv, workdir, b, args.concurrency, args.latency,
+                                      args.output_token_s)
+            print(f"{b:>5} {r['seconds']:>8.2f} {r['calls']:>6} {r['route_calls']:>11} {r['route_tokens']:>12} "
+                  f"{r['input_tokens']:>13} {r['rerouted']:>9} {r['fallbacks']:>9}")
+    base = results[args.batch_sizes[0]]
+    for b in args.batch_sizes[1:]:
+        r = results[b]
+        print(f"batch {b} vs {args.batch_sizes[0]}: "
+              f"{1 - r['calls'] / base['calls']:.1%} fewer calls, "
+              f"{1 - r['route_tokens'] / base['route_tokens']:.1%} fewer route tokens, "
+              f"{1 - r['input_tokens'] / base['input_tokens']:.1%} fewer input tokens, "
+              f"{base['seconds'] / r['seconds']:.2f}x wall-clock")
+
+
+if __name__ == "__main__":
+    main()
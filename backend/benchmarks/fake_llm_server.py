@@ -0,0 +1,94 @@
+# fake_llm_server.py
+"""
+Local stand-in for the OpenAI Responses API, used by the benchmarks.
+
+Answers POST /v1/responses with prompt-compliant outputs for the four prompts
+in lib/my_prompts.py (lib.llm_backends.fake_completion) after an injected
+delay, so the tree pipeline can be exercised over HTTP without API cost.
+Point the OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+For runs without any sockets use LLM_BACKEND=fake instead.
+
+Run standalone:  python benchmarks/fake_llm_server.py --port 8765 --latency 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.llm_backends import fake_completion  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = body.get("input", "")
+        if isinstance(prompt, list):
+            prompt = "\n".join(str(m.get("content", "")) for m in prompt)
+        time.sleep(self.latency)
+        text = fake_completion(prompt)
+        payload = {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "fake"),
+            "status": "completed",
+            "output": [{
+                "id": f"msg_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": len(prompt) // 4,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": len(text) // 4,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": len(prompt) // 4 + len(text) // 4,
+            },
+        }
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(port: int = 0, latency: float = 0.2):
+    """Start the server on a background thread; returns (server, base_url)."""
+    handler = type("FakeLLMHandler", (_Handler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI Responses API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every response")
+    args = parser.parse_args()
+    srv, url = start_server(args.port, args.latency)
+    print(f"Fake LLM server listening on {url} (latency {args.latency}s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,144 @@
+# data_cache.py
+"""
+In-memory, time-indexed cache of the CSVs served by /get_data and /get_time_range.
+
+Each file is parsed once into a frame sorted by its timestamp column, next to
+an int64 nanosecond key array. Range queries are two `searchsorted` calls and
+a positional slice instead of a re-read, re-parse and boolean mask per request;
+the time range is the first and last key. A file is reloaded when its mtime or
+size changes, or on an explicit reload().
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Naive query bounds are taken as wall time in the timezone the edge devices log in.
+LOCAL_TZ = "America/Los_Angeles"
+
+
+def parse_timestamps(raw, coerce=False):
+    """Parse a timestamp column, keeping its timezone (or lack of one)."""
+    errors = "coerce" if coerce else "raise"
+    try:
+        ts = pd.to_datetime(raw, errors=errors)
+    except ValueError:
+        ts = None
+    if ts is None or ts.dtype == object:
+        # Mixed UTC offsets (e.g. across a DST change) don't fit one dtype; normalize to LOCAL_TZ.
+        ts = pd.to_datetime(raw, utc=True, errors=errors).dt.tz_convert(LOCAL_TZ)
+    return ts
+
+
+class TimeIndexedFrame:
+    """One loaded file: rows sorted by timestamp (unparseable ones last) and their keys."""
+
+    def __init__(self, df, ts_column, stat):
+        self.ts_column = ts_column
+        self.stat = stat
+        self.tz = None
+        self.keys = np.empty(0, dtype=np.int64)
+        if ts_column in df.columns:
+            valid = int(df[ts_column].notna().sum())
+            if valid < len(df) or not df[ts_column].is_monotonic_increasing:
+                df = df.sort_values(ts_column, kind="stable", na_position="last").reset_index(drop=True)
+            ts = df[ts_column].iloc[:valid]
+            self.tz = ts.dt.tz
+            # UTC ns for tz-aware columns, wall-clock ns for naive ones; NaT rows are not indexed.
+            if self.tz is not None:
+                ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+            self.keys = ts.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        self.df = df
+
+    def __len__(self):
+        return len(self.df)
+
+    def _key(self, value):
+        ts = pd.Timestamp(value)
+        if self.tz is not None:
+            if ts.tz is None:
+                ts = ts.tz_localize(LOCAL_TZ, ambiguous=False, nonexistent="shift_forward")
+            return ts.tz_convert("UTC").tz_localize(None).value
+        return (ts.tz_convert(LOCAL_TZ).tz_localize(None) if ts.tz is not None else ts).value
+
+    def between(self, start, end):
+        """Rows with start <= ts <= end (both inclusive), in time order."""
+        lo = int(np.searchsorted(self.keys, self._key(start), side="left"))
+        hi = int(np.searchsorted(self.keys, self._key(end), side="right"))
+        return self.df.iloc[lo:max(lo, hi)]
+
+    def time_range(self):
+        """(earliest, latest) timestamp, or None when nothing is indexed."""
+        if not len(self.keys):
+            return None
+        col = self.df[self.ts_column]
+        return col.iloc[0], col.iloc[len(self.keys) - 1]
+
+
+class TimeSeriesCache:
+    """Thread-safe cache of one CSV as a TimeIndexedFrame, refreshed when the file changes.
+
+    `columns` restricts the columns kept (missing ones are ignored); `coerce`
+    turns unparseable timestamps into NaT instead of failing the load.
+    """
+
+    def __init__(self, path, ts_column="ts", columns=None, coerce=False):
+        self.path = path
+        self.ts_column = ts_column
+        self.columns = columns
+        self.coerce = coerce
+        self._frame = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self):
+        """Current TimeIndexedFrame, or None if the file does not exist."""
+        stat = self._stat()
+        frame = self._frame
+        if stat is None:
+            return None
+        if frame is not None and frame.stat == stat:
+            return frame
+        with self._lock:
+            if self._frame is None or self._frame.stat != stat:
+                self._frame = self._load(stat)
+            return self._frame
+
+    def reload(self):
+        """Drop the cached frame; the next get() re-reads the file."""
+        with self._lock:
+            self._frame = None
+
+    def _load(self, stat):
+        started = time.perf_counter()
+        usecols = (lambda c: c in self.columns) if self.columns else None
+        df = pd.read_csv(self.path, usecols=usecols)
+        if self.ts_column in df.columns:
+            df[self.ts_column] = parse_timestamps(df[self.ts_column], coerce=self.coerce)
+        frame = TimeIndexedFrame(df, self.ts_column, stat)
+        elapsed = time.perf_counter() - started
+        self.loads += 1
+        self.load_seconds += elapsed
+        print(f"[data-cache] loaded {self.path}: {len(frame)} rows in {elapsed:.2f}s")
+        return frame
+
+    def stats(self):
+        frame = self._frame
+        return {
+            "path": self.path,
+            "rows": len(frame) if frame is not None else 0,
+            "loaded": frame is not None,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3),
+        }
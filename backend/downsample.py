@@ -0,0 +1,93 @@
+# downsample.py
+"""
+Point-budget downsampling of sensor rows for chart queries.
+
+Each numeric channel picks its own points, and the rows kept are the union,
+so a spike in any channel survives even when the others are flat:
+
+- "minmax": the min and max of each equal-count bucket (spikes always kept);
+- "lttb": Largest-Triangle-Three-Buckets, the point per bucket that best
+  preserves the line's visual shape.
+
+Rows of different devices are downsampled separately, and rows flagged in
+`keep` (e.g. at anomaly timestamps) are always returned.
+"""
+
+import numpy as np
+
+from lib.columns import DEVICE_COLUMNS
+
+METHODS = ("minmax", "lttb")
+
+
+def minmax_indices(y, n_out):
+    """Positions of the min and max of each of ~n_out/2 buckets, plus the first and last point."""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    lo = np.where(np.isnan(y), np.inf, y)
+    hi = np.where(np.isnan(y), -np.inf, y)
+    edges = np.linspace(1, n - 1, max(1, (n_out - 2) // 2) + 1).astype(np.int64)
+    picked = [0, n - 1]
+    for a, b in zip(edges[:-1], edges[1:]):
+        if b > a:
+            picked.append(a + int(np.argmin(lo[a:b])))
+            picked.append(a + int(np.argmax(hi[a:b])))
+    return np.unique(picked)
+
+
+def lttb_indices(x, y, n_out):
+    """Positions chosen by Largest-Triangle-Three-Buckets (first and last point always kept)."""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+    x = x.astype(np.float64) - float(x[0])
+    fill = np.nanmean(y) if np.isfinite(y).any() else 0.0
+    y = np.where(np.isnan(y), fill, y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:nxt_hi].mean(), y[hi:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def downsample(df, max_points, method="minmax", ts_column="ts", keep=None):
+    """Rows of `df` (sorted by ts) reduced to about `max_points`, in time order.
+
+    The budget is split evenly across devices and then across numeric
+    channels. `keep` is a boolean array of rows that are always returned.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown downsampling method {method!r}; expected one of {METHODS}")
+    if not max_points or len(df) <= max_points:
+        return df
+    dev_col = next((c for c in DEVICE_COLUMNS if c in df.columns), None)
+    groups = [np.arange(len(df))] if dev_col is None else \
+        [np.asarray(rows) for rows in df.groupby(dev_col, sort=False, dropna=False).indices.values()]
+    channels = [c for c in df.select_dtypes("number").columns if c not in (ts_column, dev_col)]
+    x = df[ts_column].to_numpy(dtype="datetime64[ns]").view(np.int64) if ts_column in df.columns \
+        else np.arange(len(df), dtype=np.int64)
+
+    budget = max(3, max_points // len(groups))
+    per_channel = max(3, budget // max(1, len(channels)))
+    selected = [np.flatnonzero(keep)] if keep is not None else []
+    for rows in groups:
+        if len(rows) <= budget:
+            selected.append(rows)
+            continue
+        if not channels:
+            selected.append(rows[np.linspace(0, len(rows) - 1, budget).astype(np.int64)])
+        for c in channels:
+            y = df[c].to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+            picked = minmax_indices(y, per_channel) if method == "minmax" else lttb_indices(x[rows], y, per_channel)
+            selected.append(rows[picked])
+    return df.iloc[np.unique(np.concatenate(selected))]
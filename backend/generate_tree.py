@@ -1,6 +1,19 @@
 # main.py
 import os
+import threading
 from lib.anomaly_tree_builder import AnomalyTreeBuilder
+from lib.anomaly_scheduler import AnomalyScheduler, LLMBudget, RateLimiter, load_device_priority
+from lib.episode_builder import EpisodeBuilder
+from lib.signature_cache import SignatureCache
+from lib.response_cache import ResponseCache
+from lib.similarity_index import SimilarityIndex
+from lib.template_tree_manager import TemplateTreeManager
+from lib.processed_ledger import ProcessedLedger
+from lib.tree_compactor import TreeCompactor
+from lib.record_builder import RecordBuilder
+from lib.gpt_agent import load_model_tiers
+from lib.llm_backends import backend_name
+from lib.llm_usage import UsageMeter, cost_scope
 
 from lib.my_prompts import (
     Contribution_Score_Analysis_Prompt,
@@ -9,30 +22,123 @@ from lib.my_prompts import (
     ROUTE_SELECTION_FEW_SHOT,
 )
 
+# One budget per process so the per-minute/per-hour limits span consecutive batches.
+_llm_budget = LLMBudget.from_env()
+# Token-bucket pacing shared by every worker and batch (LLM_RATE_LIMIT_* env vars).
+_rate_limiter = RateLimiter.from_env()
+# Per-call LLM latency/token accounting by request and device (LLM_USAGE_LOG, LLM_PRICES).
+_usage_meter = UsageMeter.from_env()
+# Shared on-disk LLM response cache (reruns and retries of the same CSV hit it); opened on
+# first use, so importing this module (e.g. for pipeline_prompts()) creates no files.
+_response_cache = None
+_response_cache_lock = threading.Lock()
+# (device, ts) of every row already classified; re-uploads and retries skip them.
+_processed_ledger = ProcessedLedger(
+    path=os.environ.get("ANOMALY_LEDGER_PATH", os.path.join("templates_storage", "processed_rows.jsonl"))
+)
+# The template tree is loaded once and kept in memory across batches and API reads.
+_tree_manager = None
+_tree_manager_lock = threading.Lock()
+
+
+def get_tree_manager():
+    global _tree_manager
+    with _tree_manager_lock:
+        if _tree_manager is None:
+            _tree_manager = TemplateTreeManager(base_path="templates_storage")
+        return _tree_manager
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache.from_env()
+        return _response_cache
+
+
+def tree_export():
+    """(version, JSON bytes) of the current simple tree, served from the manager's cache."""
+    return get_tree_manager().tree_export()
+
+
+def _make_scheduler(csv_path):
+    backlog_path = os.path.join(os.path.dirname(csv_path) or ".", "anomaly_backlog.csv")
+    # Devices listed in ANOMALY_DEVICE_PRIORITY are classified (and kept out of the backlog) first.
+    return AnomalyScheduler(budget=_llm_budget, backlog_path=backlog_path, device_priority=load_device_priority())
+
+
+def pipeline_prompts():
+    """Prompt per pipeline stage, as AnomalyTreeBuilder expects them."""
+    return {
+        "contribution": Contribution_Score_Analysis_Prompt,
+        "horizontal": horizontal_expansion_few_shot,
+        "vertical": VERTICAL_EXPANSION_FEW_SHOT,
+        "route": ROUTE_SELECTION_FEW_SHOT,
+    }
+
+
+def llm_usage():
+    """LLM calls, tokens, latency and cost so far, by request_id, device and model."""
+    return _usage_meter.summary()
+
+
 def generate_anomaly_tree(
     csv_path="backend_anomaly_contribution_results.csv",
+    request_id=None,
 ):
     """
     Run the anomaly tree builder with the provided CSV and prompts.
     This function can be imported and called programmatically.
     """
-    openai_api_key = os.environ.get("OPENAI_API_KEY")
-    if not openai_api_key:
+    # Only the OpenAI backend needs a key; LLM_BACKEND=http|fake run without one.
+    if backend_name() == "openai" and not os.environ.get("OPENAI_API_KEY"):
         raise ValueError("OPENAI_API_KEY environment variable not set")
-    """
-    Run the anomaly tree builder with the provided CSV and prompts.
-    This function can be imported and called programmatically.
-    """
-    os.environ["OPENAI_API_KEY"] = openai_api_key
-    prompts = {
-        "contribution": Contribution_Score_Analysis_Prompt,
-        "horizontal": horizontal_expansion_few_shot,
-        "vertical": VERTICAL_EXPANSION_FEW_SHOT,
-        "route": ROUTE_SELECTION_FEW_SHOT,
-    }
-
     builder = AnomalyTreeBuilder(
         csv_path=csv_path,
-        prompts=prompts
+        prompts=pipeline_prompts(),
+        scheduler=_make_scheduler(csv_path),
+        episode_builder=EpisodeBuilder(
+            max_gap_seconds=float(os.environ.get("ANOMALY_EPISODE_GAP_SECONDS", "60"))
+        ),
+        signature_cache=SignatureCache(path=os.path.join("templates_storage", "signature_cache.json")),
+        # "local" renders templates without the contribution LLM call.
+        template_mode=os.environ.get("ANOMALY_TEMPLATE_MODE", "llm"),
+        response_cache=get_response_cache(),
+        similarity_index=SimilarityIndex(
+            threshold=float(os.environ.get("ANOMALY_ROUTE_SIMILARITY", "0.9"))
+        ),
+        tree_manager=get_tree_manager(),
+        ledger=_processed_ledger,
+        # Sensor -> domain rules; ANOMALY_DOMAIN_RULES points at a JSON rule table.
+        record_builder=RecordBuilder.from_env(),
+        # Per-stage cheapest-first model lists (LLM_MODEL_TIERS); escalate on bad output.
+        model_tiers=load_model_tiers(),
+        rate_limiter=_rate_limiter,
+        usage_hook=_usage_meter,
+        # Templates routed per LLM call in the pipeline; 1 routes each on its own.
+        route_batch_size=int(os.environ.get("ANOMALY_ROUTE_BATCH_SIZE", "1")),
     )
-    builder.run()
+    with cost_scope(request_id=request_id):
+        return builder.run(concurrency=int(os.environ.get("ANOMALY_LLM_CONCURRENCY", "4")))
+
+
+def compact_tree():
+    """
+    Apply retention, depth/fan-out caps and sparse-leaf merging to the shared
+    tree (limits from ANOMALY_TREE_* env vars) and return the before/after report.
+    """
+    manager = get_tree_manager()
+    report = TreeCompactor.from_env(manager).run()
+    manager.export_tree_simple_json("anomaly_results_classified_tree.json")
+    return report
+
+
+def drain_anomaly_backlog(backlog_path="anomaly_backlog.csv", request_id=None):
+    """
+    Classify anomalies deferred by the LLM budget (or an unavailable API), most
+    severe first. Rows that still do not fit in the budget stay in the backlog.
+    """
+    if not os.path.exists(backlog_path):
+        return None
+    return generate_anomaly_tree(csv_path=backlog_path, request_id=request_id)
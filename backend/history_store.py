@@ -0,0 +1,219 @@
+# history_store.py
+"""
+Append-only, partitioned Parquet store for sensor, contribution and
+classified-anomaly history.
+
+    <root>/<dataset>/day=YYYY-MM-DD/device=<id>/part-<ns>-<uuid>.parquet
+
+Days are UTC dates; device ids are URI-escaped ("" when the rows carry no
+device column). Every append writes new files (temp name, then rename), so
+readers never see partial files and nothing is rewritten. Reads list only
+the day/device directories that can match, and read only the requested
+columns and the row groups whose ts statistics overlap the range.
+
+Rows are unique per (device, ts): edge batches overlap, so an append keeps
+the last row per ts of its batch and a read keeps the most recently written
+one (file names sort in write order).
+"""
+
+import os
+import time
+import uuid
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_cache import LOCAL_TZ, parse_timestamps
+from lib.columns import DEVICE_COLUMNS
+
+TS_TYPE = pa.timestamp("us", tz="UTC")
+
+
+def _utc(value):
+    """Query bound as a UTC Timestamp; naive values are US Pacific wall time."""
+    ts = pd.Timestamp(value)
+    if ts.tz is None:
+        ts = ts.tz_localize(LOCAL_TZ, ambiguous=False, nonexistent="shift_forward")
+    return ts.tz_convert("UTC")
+
+
+class HistoryStore:
+    DATASETS = ("sensor", "contributions", "classified")
+
+    def __init__(self, root, ts_column="ts", compression="zstd", row_group_size=128 * 1024):
+        self.root = root
+        self.ts_column = ts_column
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    @classmethod
+    def from_env(cls):
+        """ANOMALY_HISTORY_STORE (store directory); None when unset."""
+        root = os.environ.get("ANOMALY_HISTORY_STORE")
+        return cls(root) if root else None
+
+    def _dataset_dir(self, dataset):
+        if dataset not in self.DATASETS:
+            raise ValueError(f"unknown dataset {dataset!r}; expected one of {self.DATASETS}")
+        return os.path.join(self.root, dataset)
+
+    @staticmethod
+    def _device_column(df):
+        for c in DEVICE_COLUMNS:
+            if c in df.columns:
+                return c
+        return None
+
+    def append(self, dataset, rows):
+        """Write `rows` (DataFrame or list of dicts) as new files; returns the number of rows stored."""
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if df.empty or self.ts_column not in df.columns:
+            return 0
+        df = df.copy()
+        ts = parse_timestamps(df[self.ts_column], coerce=True)
+        if ts.dt.tz is None:
+            ts = ts.dt.tz_localize(LOCAL_TZ, ambiguous="NaT", nonexistent="shift_forward")
+        df[self.ts_column] = ts.dt.tz_convert("UTC").dt.as_unit("us")
+        dropped = int(df[self.ts_column].isna().sum())
+        if dropped:
+            print(f"[history-store] {dataset}: skipping {dropped} rows without a parseable {self.ts_column}")
+            df = df[df[self.ts_column].notna()]
+        dev_col = self._device_column(df)
+        days = df[self.ts_column].dt.strftime("%Y-%m-%d")
+        devices = df[dev_col].map(lambda d: "" if pd.isna(d) else str(d).strip()) if dev_col else pd.Series("", index=df.index)
+
+        base = self._dataset_dir(dataset)
+        stored = 0
+        for (day, device), part in df.groupby([days, devices], sort=False):
+            part_dir = os.path.join(base, f"day={day}", f"device={quote(device, safe='')}")
+            os.makedirs(part_dir, exist_ok=True)
+            part = part.drop_duplicates(subset=[self.ts_column], keep="last")
+            table = pa.Table.from_pandas(part.sort_values(self.ts_column, kind="stable"), preserve_index=False)
+            path = os.path.join(part_dir, f"part-{time.time_ns():020d}-{uuid.uuid4().hex}.parquet")
+            pq.write_table(table, path + ".tmp", compression=self.compression, row_group_size=self.row_group_size)
+            os.replace(path + ".tmp", path)
+            stored += len(part)
+        return stored
+
+    def _partition_dirs(self, dataset, first_day=None, last_day=None, devices=None):
+        base = self._dataset_dir(dataset)
+        if not os.path.isdir(base):
+            return []
+        wanted = None if devices is None else {str(d) for d in devices}
+        dirs = []
+        for day_entry in sorted(os.listdir(base)):
+            if not day_entry.startswith("day="):
+                continue
+            day = day_entry[4:]
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            day_dir = os.path.join(base, day_entry)
+            for dev_entry in sorted(os.listdir(day_dir)):
+                if dev_entry.startswith("device=") and (wanted is None or unquote(dev_entry[7:]) in wanted):
+                    dirs.append((day, os.path.join(day_dir, dev_entry)))
+        return dirs
+
+    @staticmethod
+    def _files(dirs):
+        return [os.path.join(d, f) for _, d in dirs for f in sorted(os.listdir(d)) if f.endswith(".parquet")]
+
+    def read(self, dataset, start=None, end=None, devices=None, columns=None):
+        """Rows with start <= ts <= end (inclusive; either bound may be None), sorted by ts in LOCAL_TZ.
+
+        `devices` limits the device partitions read; `columns` the columns
+        returned (missing ones are ignored). A (device, ts) written more than
+        once is returned once, as last written.
+        """
+        lo = _utc(start) if start is not None else None
+        hi = _utc(end) if end is not None else None
+        files = self._files(self._partition_dirs(
+            dataset,
+            first_day=lo.strftime("%Y-%m-%d") if lo is not None else None,
+            last_day=hi.strftime("%Y-%m-%d") if hi is not None else None,
+            devices=devices,
+        ))
+        if not files:
+            return pd.DataFrame(columns=list(columns) if columns else [self.ts_column])
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options="permissive")
+        dataset_ = ds.dataset(files, schema=schema, format="parquet")
+        predicate = None
+        if lo is not None:
+            predicate = ds.field(self.ts_column) >= pa.scalar(lo, type=TS_TYPE)
+        if hi is not None:
+            upper = ds.field(self.ts_column) <= pa.scalar(hi, type=TS_TYPE)
+            predicate = upper if predicate is None else predicate & upper
+        names = [c for c in columns if c in schema.names] if columns else None
+        dev_col = next((c for c in DEVICE_COLUMNS if c in schema.names), None)
+        keys = [c for c in (dev_col, self.ts_column) if c is not None and c in schema.names]
+        # to_table keeps file order, i.e. write order within each partition.
+        df = dataset_.to_table(columns=None if names is None else names + [c for c in keys if c not in names],
+                               filter=predicate).to_pandas()
+        if self.ts_column in df.columns:
+            df = df.drop_duplicates(subset=keys, keep="last")
+            df[self.ts_column] = df[self.ts_column].dt.tz_convert(LOCAL_TZ)
+            df = df.sort_values(self.ts_column, kind="stable").reset_index(drop=True)
+        return df if names is None else df[names]
+
+    def merge(self, *frames):
+        """Concatenate row frames of one dataset (e.g. a read() and the live CSV's rows; None is
+        skipped) into one row per (device, ts), later frames winning, sorted by ts in LOCAL_TZ."""
+        parts = []
+        for df in frames:
+            if df is None or self.ts_column not in df.columns:
+                continue
+            df = df.copy()
+            ts = parse_timestamps(df[self.ts_column], coerce=True)
+            if ts.dt.tz is None:
+                ts = ts.dt.tz_localize(LOCAL_TZ, ambiguous="NaT", nonexistent="shift_forward")
+            df[self.ts_column] = ts.dt.tz_convert(LOCAL_TZ)
+            parts.append(df)
+        if not parts:
+            return None
+        df = pd.concat(parts, ignore_index=True)
+        keys = [c for c in (self._device_column(df), self.ts_column) if c is not None]
+        df = df.drop_duplicates(subset=keys, keep="last")
+        return df.sort_values(self.ts_column, kind="stable").reset_index(drop=True)
+
+    def _ts_bound(self, files, pick):
+        """min (pick=min) or max (pick=max) ts over `files`, from row-group statistics where present."""
+        values = []
+        for f in files:
+            pf = pq.ParquetFile(f)
+            col = pf.schema_arrow.get_field_index(self.ts_column)
+            if col < 0:
+                continue
+            stats = [pf.metadata.row_group(i).column(col).statistics for i in range(pf.metadata.num_row_groups)]
+            if stats and all(s is not None and s.has_min_max for s in stats):
+                for s in stats:
+                    v = pd.Timestamp(s.min if pick is min else s.max)
+                    values.append(v.tz_localize("UTC") if v.tz is None else v)
+            else:
+                ts = pf.read(columns=[self.ts_column]).column(0).to_pandas().dropna()
+                if len(ts):
+                    values.append(pick(ts))
+        return pick(values) if values else None
+
+    def time_range(self, dataset):
+        """(earliest, latest) ts in LOCAL_TZ from the first and last day's file footers, or None."""
+        dirs = self._partition_dirs(dataset)
+        days = sorted({day for day, _ in dirs})
+        lo = hi = None
+        for day in days:
+            lo = self._ts_bound(self._files([d for d in dirs if d[0] == day]), min)
+            if lo is not None:
+                break
+        for day in reversed(days):
+            hi = self._ts_bound(self._files([d for d in dirs if d[0] == day]), max)
+            if hi is not None:
+                break
+        if lo is None or hi is None:
+            return None
+        return lo.tz_convert(LOCAL_TZ), hi.tz_convert(LOCAL_TZ)
+
+    def footprint(self, dataset):
+        """(files, bytes) stored for `dataset`."""
+        files = self._files(self._partition_dirs(dataset))
+        return len(files), sum(os.path.getsize(f) for f in files)
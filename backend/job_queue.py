@@ -0,0 +1,172 @@
+# job_queue.py
+"""
+Bounded background job queue for the anomaly processing pipeline.
+
+/anomaly_data used to run contribution analysis (LSTM training) and tree
+generation (several LLM round-trips) inside the event loop. Jobs are now
+submitted here, processed by a small pool of worker threads, and polled
+through /jobs/{id}.
+"""
+
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """State of a single submitted job, including per-stage timings."""
+
+    def __init__(self, payload, meta=None, handler=None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.handler = handler
+        self.meta = meta or {}
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = OrderedDict()
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a processing stage; usage: `with job.stage("tree_generation"): ...`."""
+        start = time.perf_counter()
+        with self._lock:
+            self.stages[name] = {"status": "running", "started_at": datetime.now().isoformat()}
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.stages[name]["status"] = "failed"
+            raise
+        else:
+            with self._lock:
+                self.stages[name]["status"] = "completed"
+        finally:
+            with self._lock:
+                self.stages[name]["duration_s"] = round(time.perf_counter() - start, 3)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "meta": dict(self.meta),
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobQueue:
+    """
+    Fixed-size worker pool fed by a bounded FIFO queue.
+
+    `handler(job, payload)` runs on a worker thread and its return value becomes
+    `job.result`. Submitting while `max_queue_size` jobs are already waiting
+    raises QueueFullError so the API can apply backpressure.
+    """
+
+    def __init__(self, handler, num_workers: int = 2, max_queue_size: int = 8, max_finished_jobs: int = 200):
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.max_finished_jobs = max_finished_jobs
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._running = 0
+        self._workers = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker_loop, name=f"anomaly-job-worker-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+            self._started = True
+
+    def submit(self, payload, meta=None, handler=None) -> Job:
+        """Enqueue a job; `handler` overrides the queue's default handler for this job."""
+        self.start()
+        job = Job(payload, meta=meta, handler=handler)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError(
+                f"Job queue is full ({self.max_queue_size} jobs waiting); retry later"
+            )
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        return job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._jobs_lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            running = self._running
+        return {
+            "queue_depth": self.depth(),
+            "max_queue_size": self.max_queue_size,
+            "workers": self.num_workers,
+            "running": running,
+            "jobs_by_status": counts,
+        }
+
+    def _evict_finished(self):
+        # Keep memory bounded: drop the oldest finished jobs beyond the retention limit.
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for jid in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[jid]
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            with self._jobs_lock:
+                self._running += 1
+            job.status = "running"
+            job.started_at = datetime.now().isoformat()
+            try:
+                job.result = (job.handler or self.handler)(job, job.payload)
+                job.status = "succeeded"
+            except Exception as e:
+                print(f"[job {job.id}] failed: {e}")
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                # Release the payload; only the result is needed for polling.
+                job.payload = None
+                with self._jobs_lock:
+                    self._running -= 1
+                    self._evict_finished()
+                self._queue.task_done()
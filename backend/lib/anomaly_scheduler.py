@@ -0,0 +1,242 @@
+# anomaly_scheduler.py
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+import pandas as pd
+from .columns import DEVICE_COLUMNS
+
+
+class LLMBudget:
+    """Sliding-window LLM call/token budget (per minute and per hour).
+
+    Limits left as None are not enforced. The budget is thread-safe so a single
+    instance can be shared by every builder running in the process.
+    """
+
+    WINDOWS = {"minute": 60.0, "hour": 3600.0}
+
+    def __init__(self, calls_per_minute=None, calls_per_hour=None,
+                 tokens_per_minute=None, tokens_per_hour=None, clock=time.monotonic):
+        self.limits = {
+            "minute": {"calls": calls_per_minute, "tokens": tokens_per_minute},
+            "hour": {"calls": calls_per_hour, "tokens": tokens_per_hour},
+        }
+        self.clock = clock
+        self._events = deque()  # (timestamp, calls, tokens)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a budget from LLM_{CALLS,TOKENS}_PER_{MINUTE,HOUR} environment variables."""
+        def _get(name):
+            val = os.environ.get(name)
+            return int(val) if val else None
+        return cls(
+            calls_per_minute=_get("LLM_CALLS_PER_MINUTE"),
+            calls_per_hour=_get("LLM_CALLS_PER_HOUR"),
+            tokens_per_minute=_get("LLM_TOKENS_PER_MINUTE"),
+            tokens_per_hour=_get("LLM_TOKENS_PER_HOUR"),
+        )
+
+    def _prune(self, now):
+        horizon = now - self.WINDOWS["hour"]
+        while self._events and self._events[0][0] <= horizon:
+            self._events.popleft()
+
+    def _used(self, now, window):
+        since = now - self.WINDOWS[window]
+        calls = tokens = 0
+        for t, c, k in self._events:
+            if t > since:
+                calls += c
+                tokens += k
+        return calls, tokens
+
+    def can_afford(self, calls=1, tokens=0) -> bool:
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            for window, limit in self.limits.items():
+                used_calls, used_tokens = self._used(now, window)
+                if limit["calls"] is not None and used_calls + calls > limit["calls"]:
+                    return False
+                if limit["tokens"] is not None and used_tokens + tokens > limit["tokens"]:
+                    return False
+            return True
+
+    def record(self, calls=1, tokens=0):
+        with self._lock:
+            now = self.clock()
+            self._events.append((now, calls, tokens))
+            self._prune(now)
+
+    def usage(self):
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            out = {}
+            for window, limit in self.limits.items():
+                used_calls, used_tokens = self._used(now, window)
+                out[window] = {"calls": used_calls, "tokens": used_tokens,
+                               "call_limit": limit["calls"], "token_limit": limit["tokens"]}
+            return out
+
+
+class RateLimiter:
+    """Client-side token-bucket limiter for LLM requests (and optionally tokens).
+
+    Requests refill at `requests_per_second` up to `burst`; tokens, when
+    `tokens_per_second` is set, refill up to `token_burst` (default: one
+    second's worth). A caller reserves capacity with reserve() and sleeps for
+    the returned delay outside the lock, so a single instance can be shared
+    by worker threads and event loops alike. Unset rates are not enforced.
+    """
+
+    def __init__(self, requests_per_second=None, burst=None, tokens_per_second=None, token_burst=None,
+                 clock=time.monotonic):
+        self.rates = {"requests": requests_per_second, "tokens": tokens_per_second}
+        self.capacity = {
+            "requests": burst or max(1.0, requests_per_second or 0),
+            "tokens": token_burst or (tokens_per_second or 0),
+        }
+        self.clock = clock
+        self._level = dict(self.capacity)
+        self._stamp = clock()
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from LLM_RATE_LIMIT_{RPS,BURST,TPS,TOKEN_BURST} environment variables."""
+        def _get(name):
+            val = os.environ.get(name)
+            return float(val) if val else None
+        return cls(
+            requests_per_second=_get("LLM_RATE_LIMIT_RPS"),
+            burst=_get("LLM_RATE_LIMIT_BURST"),
+            tokens_per_second=_get("LLM_RATE_LIMIT_TPS"),
+            token_burst=_get("LLM_RATE_LIMIT_TOKEN_BURST"),
+        )
+
+    @property
+    def enabled(self):
+        return any(self.rates.values())
+
+    def reserve(self, tokens=0) -> float:
+        """Take one request (and `tokens`) from the buckets; return seconds to wait first."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            elapsed, self._stamp = now - self._stamp, now
+            wait = 0.0
+            for kind, need in (("requests", 1), ("tokens", tokens)):
+                rate = self.rates[kind]
+                if not rate:
+                    continue
+                # Buckets may go negative: later callers queue behind earlier reservations.
+                level = min(self.capacity[kind], self._level[kind] + elapsed * rate) - min(need, self.capacity[kind])
+                self._level[kind] = level
+                if level < 0:
+                    wait = max(wait, -level / rate)
+            self.waited_s += wait
+            return wait
+
+    def acquire(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def load_device_priority():
+    """
+    Per-device priority from ANOMALY_DEVICE_PRIORITY: inline JSON or a path to a
+    JSON file, e.g. {"edge-3": 10, "edge-7": 5}. Higher goes first; unlisted
+    devices are 0.
+    """
+    raw = os.environ.get("ANOMALY_DEVICE_PRIORITY", "").strip()
+    if not raw:
+        return {}
+    if not raw.startswith("{"):
+        with open(raw, "r", encoding="utf-8") as f:
+            raw = f.read()
+    return {str(device): float(prio) for device, prio in json.loads(raw).items()}
+
+
+class AnomalyScheduler:
+    """Orders pending anomalies by severity and defers what the LLM budget cannot cover.
+
+    Pending rows are ranked by `overall_anomaly_score` (highest first), optionally
+    after a per-device priority. Rows that do not fit in the budget are written to
+    a backlog CSV and merged back into the queue on the next run, where fresh
+    high-severity rows still sort ahead of them.
+    """
+
+    DEVICE_COLUMNS = DEVICE_COLUMNS
+
+    def __init__(self, budget: LLMBudget = None, backlog_path="anomaly_backlog.csv",
+                 device_priority: dict = None, score_column="overall_anomaly_score"):
+        self.budget = budget or LLMBudget()
+        self.backlog_path = backlog_path
+        self.device_priority = device_priority or {}
+        self.score_column = score_column
+
+    def device_column(self, df: pd.DataFrame):
+        for c in self.DEVICE_COLUMNS:
+            if c in df.columns:
+                return c
+        return None
+
+    def load_backlog(self) -> pd.DataFrame:
+        if self.backlog_path and os.path.exists(self.backlog_path):
+            try:
+                return pd.read_csv(self.backlog_path)
+            except pd.errors.EmptyDataError:
+                pass
+        return pd.DataFrame()
+
+    def save_backlog(self, df: pd.DataFrame):
+        if not self.backlog_path:
+            return
+        if df is None or df.empty:
+            if os.path.exists(self.backlog_path):
+                os.remove(self.backlog_path)
+            return
+        df.to_csv(self.backlog_path, index=False)
+
+    def pending(self, df_new: pd.DataFrame) -> pd.DataFrame:
+        """Merge the deferred backlog with newly arrived rows (duplicates dropped)."""
+        backlog = self.load_backlog()
+        if backlog.empty:
+            return df_new.reset_index(drop=True)
+        merged = pd.concat([backlog, df_new], ignore_index=True)
+        key = ["ts"] + ([self.device_column(merged)] if self.device_column(merged) else [])
+        return merged.drop_duplicates(subset=key, keep="last").reset_index(drop=True)
+
+    def order(self, df: pd.DataFrame):
+        """Return positional indices of `df` in processing order."""
+        if df.empty:
+            return []
+        scores = (pd.to_numeric(df[self.score_column], errors="coerce").fillna(0.0)
+                  if self.score_column in df.columns else pd.Series(0.0, index=df.index))
+        dev_col = self.device_column(df)
+        if dev_col and self.device_priority:
+            # Device ids read from CSV may be numeric; priorities from JSON are keyed by string.
+            prio = df[dev_col].map(
+                lambda d: self.device_priority.get(d, self.device_priority.get(str(d).strip(), 0))
+            ).astype(float)
+        else:
+            prio = pd.Series(0.0, index=df.index)
+        keys = pd.DataFrame({"prio": prio.values, "score": scores.values, "pos": range(len(df))})
+        keys = keys.sort_values(["prio", "score", "pos"], ascending=[False, False, True], kind="mergesort")
+        return keys["pos"].tolist()
@@ -1,20 +1,68 @@
 # anomaly_tree_builder.py
+import asyncio
 import json
 import re
+import time
 import pandas as pd
-from .gpt_agent import GPTAgent
+from .gpt_agent import GPTAgent, OutputRejected, LLMUnavailable
+from .columns import DEVICE_COLUMNS
+from .llm_usage import cost_scope
+from .route_batcher import RouteBatcher
+from .my_prompts import ROUTE_BATCH_INSTRUCTIONS
 from .record_builder import RecordBuilder
 from .template_tree_manager import  TemplateTreeManager
+from .template_renderer import render_template
 import os
 class AnomalyTreeBuilder:
     """High-level orchestrator for building and updating anomaly trees."""
 
-    def __init__(self, csv_path, prompts, base_path="templates_storage", reset_tree=False):
+    # Template extraction + routing + (horizontal or vertical) expansion.
+    CALLS_PER_RECORD = 3
+
+    def __init__(self, csv_path, prompts, base_path="templates_storage", reset_tree=False,
+                 scheduler=None, episode_builder=None, signature_cache=None, template_mode="llm",
+                 response_cache=None, similarity_index=None, tree_manager=None, ledger=None,
+                 record_builder=None, model_tiers=None, rate_limiter=None, usage_hook=None,
+                 llm_backend=None, route_batch_size=1):
+        if template_mode not in ("llm", "local"):
+            raise ValueError(f"Unknown template_mode '{template_mode}' (expected 'llm' or 'local')")
         self.csv_path = csv_path
+        self.template_mode = template_mode
         self.prompts = prompts
-        self.agent = GPTAgent()
-        self.tree_manager = TemplateTreeManager(base_path=base_path, reset=reset_tree)
-        self.record_builder = RecordBuilder()
+        self.scheduler = scheduler
+        self.episode_builder = episode_builder
+        self.agent = GPTAgent(budget=scheduler.budget if scheduler is not None else None, cache=response_cache,
+                              tiers=model_tiers, limiter=rate_limiter, usage_hook=usage_hook,
+                              backend=llm_backend)
+        # A long-lived manager can be passed in so its in-memory tree and export cache survive batches.
+        self.tree_manager = tree_manager or TemplateTreeManager(base_path=base_path, reset=reset_tree)
+        self.record_builder = record_builder or RecordBuilder()
+        self.signature_cache = signature_cache
+        # Listeners this builder registered; removed again by detach() so a shared
+        # manager does not accumulate them across batches.
+        self._listeners = []
+        if signature_cache is not None:
+            self._listeners.append(signature_cache.invalidate_path)
+        self.similarity_index = similarity_index
+        # ProcessedLedger: rows already classified are skipped on later runs.
+        self.ledger = ledger
+        # Pipeline routes computed on a tree snapshot: used as-is, re-routed at commit, or unused.
+        self.route_stats = {"prefetched": 0, "stale": 0, "unused": 0}
+        # >1: the pipeline routes this many templates per LLM call (RouteBatcher).
+        self.route_batch_size = max(1, int(route_batch_size or 1))
+        if similarity_index is not None:
+            similarity_index.rebuild(self.tree_manager.tree)
+            # A split moves the leaf's templates one level down; re-index them.
+            self._listeners.append(lambda _path: similarity_index.rebuild(self.tree_manager.tree))
+        self.tree_manager.split_listeners.extend(self._listeners)
+
+    def detach(self):
+        """Unregister this builder's tree listeners (the manager may outlive it)."""
+        for listener in self._listeners:
+            if listener in self.tree_manager.split_listeners:
+                self.tree_manager.split_listeners.remove(listener)
+        self._listeners = []
+
     def parse_found_line(self, response):
         m = re.search(r"Found:\s*(YES|NO|True|False)", response, flags=re.I)
         if not m:
@@ -28,14 +76,81 @@ class AnomalyTreeBuilder:
             raise RuntimeError(f"Failed to parse route from:\n{response}")
         return [p.strip() for p in m.group(1).split("->") if p.strip()]
 
+    def _route_prompt(self, tree, template):
+        return self.prompts["route"] + self.tree_manager.prompt_tree_section(tree) + \
+            f"\n\nTemplate:\n{template}\n"
+
+    def _check_route(self, tree, response):
+        """Escalation check: the route must parse, and a "Found: YES" path must exist."""
+        parts = self.parse_route_line(response)
+        if self.parse_found_line(response):
+            node = tree
+            for seg in parts:
+                node = node.children.get(seg)
+                if node is None:
+                    # Soft: _resolve_route() can still demote it to a not-found route.
+                    raise OutputRejected(f"route {' -> '.join(parts)} marked found but missing", soft=True)
+
     def route_from_llm(self, tree, template):
-        prompt = self.prompts["route"] + "Error Tree:\n" + json.dumps(
-            self.tree_manager.tree_structure(tree, for_display=False), indent=2, ensure_ascii=False
-        ) + f"\n\nTemplate:\n{template}\n"
+        response = self.agent.run(self._route_prompt(tree, template), stage="route",
+                                  validate=lambda r: self._check_route(tree, r))
+        print("ROUTE_SELECTION response:\n", response)
+        return self._resolve_route(tree, response)
 
-        response = self.agent.run(prompt)
+    async def aroute_from_llm(self, tree, template):
+        response = await self.agent.arun(self._route_prompt(tree, template), stage="route",
+                                         validate=lambda r: self._check_route(tree, r))
         print("ROUTE_SELECTION response:\n", response)
+        return self._resolve_route(tree, response)
+
+    def _route_batch_prompt(self, tree, templates):
+        items = "\n".join(f"[{i}] {' '.join(t.split())}" for i, t in enumerate(templates, 1))
+        return self.prompts["route"] + self.prompts.get("route_batch", ROUTE_BATCH_INSTRUCTIONS) + \
+            self.tree_manager.prompt_tree_section(tree) + f"\n\nTemplates:\n{items}\n"
 
+    @staticmethod
+    def parse_route_batch(response, n):
+        """{item number: answer block} for the `[k]` sections (1..n) of a batched answer."""
+        parts = re.split(r"^\s*\[(\d+)\]\s*$", response, flags=re.M)
+        blocks = {}
+        for num, body in zip(parts[1::2], parts[2::2]):
+            k = int(num)
+            if 1 <= k <= n and k not in blocks:
+                blocks[k] = body
+        return blocks
+
+    def _check_route_batch(self, tree, response, n):
+        blocks = self.parse_route_batch(response, n)
+        bad = n - len(blocks)
+        for body in blocks.values():
+            try:
+                self._check_route(tree, body)
+            except Exception:
+                bad += 1
+        if bad:
+            # Soft: the good items are used and the rest are routed one by one.
+            raise OutputRejected(f"{bad} of {n} batched routes missing or invalid", soft=True)
+
+    async def aroute_batch_from_llm(self, tree, templates):
+        """
+        Route several templates in one call against `tree`. Returns one
+        (route_str, path_found) per template, or None where the answer has no
+        usable entry (the caller routes those individually).
+        """
+        n = len(templates)
+        response = await self.agent.arun(self._route_batch_prompt(tree, templates), stage="route_batch",
+                                         validate=lambda r: self._check_route_batch(tree, r, n))
+        print("ROUTE_SELECTION batch response:\n", response)
+        blocks = self.parse_route_batch(response, n)
+        routes = []
+        for k in range(1, n + 1):
+            try:
+                routes.append(self._resolve_route(tree, blocks[k]) if k in blocks else None)
+            except RuntimeError:
+                routes.append(None)
+        return routes
+
+    def _resolve_route(self, tree, response):
         parts = self.parse_route_line(response)
         found_flag = self.parse_found_line(response)
 
@@ -64,9 +179,11 @@ class AnomalyTreeBuilder:
 
         return ":".join(parts), path_found
 
-    def extract_template_from_llm(self, record):
-        prompt = self.prompts["contribution"] + "\nThis is the per-row data (JSON):\n" + json.dumps(record)
-        raw = self.agent.run(prompt)
+    def _template_prompt(self, record):
+        return self.prompts["contribution"] + "\nThis is the per-row data (JSON):\n" + json.dumps(record)
+
+    @staticmethod
+    def _parse_template_response(raw):
         start, end = raw.find("{"), raw.rfind("}")
         if start == -1 or end == -1 or end <= start:
             raise ValueError(f"Invalid JSON from LLM: {raw}")
@@ -76,50 +193,359 @@ class AnomalyTreeBuilder:
             raise ValueError("LLM JSON missing 'template'.")
         return template
 
-    def run(self, save_augmented_csv: bool = True, out_path: str = None):
-        df = pd.read_csv(self.csv_path)
-        records = self.record_builder.build_records_from_csv(df)
-        tree = self.tree_manager.tree
-        
-        classifications, templates = [], []
-
-        for idx, rec in enumerate(records):
-            template_text = self.extract_template_from_llm(rec)
-            print(template_text)
-            ts_val = df.iloc[idx]["ts"]
-            ev = {"template": template_text}
+    def extract_template_from_llm(self, record):
+        raw = self.agent.run(self._template_prompt(record), stage="template",
+                             validate=self._parse_template_response)
+        return self._parse_template_response(raw)
+
+    async def aextract_template_from_llm(self, record):
+        raw = await self.agent.arun(self._template_prompt(record), stage="template",
+                                    validate=self._parse_template_response)
+        return self._parse_template_response(raw)
+
+    def extract_template(self, record):
+        """Template for one record: rendered locally, or via the contribution prompt."""
+        if self.template_mode == "local":
+            return render_template(record)
+        return self.extract_template_from_llm(record)
+
+    async def aextract_template(self, record):
+        if self.template_mode == "local":
+            return render_template(record)
+        return await self.aextract_template_from_llm(record)
+
+    def _calls_per_record(self):
+        return self.CALLS_PER_RECORD - (1 if self.template_mode == "local" else 0)
+
+    def _estimate_record_tokens(self, record, tree_chars):
+        """Rough token estimate (~4 chars/token) for classifying one record."""
+        contribution_chars = 0 if self.template_mode == "local" else (
+            len(self.prompts["contribution"]) + len(json.dumps(record)))
+        chars = (contribution_chars
+                 + len(self.prompts["route"]) + tree_chars
+                 + max(len(self.prompts["horizontal"]) + tree_chars, len(self.prompts["vertical"])))
+        return chars // 4
+
+    def _within_budget(self, record, tree_chars, reserved_calls=0, reserved_tokens=0):
+        if self.scheduler is None:
+            return True
+        return self.scheduler.budget.can_afford(
+            calls=reserved_calls + self._calls_per_record(),
+            tokens=reserved_tokens + self._estimate_record_tokens(record, tree_chars),
+        )
+
+    def _commit_unit(self, tree, record, ts_val, template_text=None, route=None):
+        """
+        Single-writer step: route one record and apply the resulting tree mutation.
+        `template_text` may be pre-extracted (pipeline stage one); otherwise it is
+        produced here. `route` is an optional (route_str, path_found, structure_seq)
+        computed on a snapshot; it is used unless the tree changed under it.
+        Returns (path_segments, template_text, llm_calls, cache_hit).
+        """
+        hit = self.signature_cache.lookup(record, tree) if self.signature_cache is not None else None
+        if hit is not None:
+            # Recurring pattern: reuse the earlier template and leaf without the LLM.
+            entry, leaf = hit
+            self.tree_manager.add_template(leaf, entry["template"], ts=ts_val)
+            if route is not None:
+                self.route_stats["unused"] += 1
+            return list(entry["path"]), entry["template"], 0, True
+
+        calls = 0
+        if template_text is None:
+            template_text = self.extract_template(record)
+            calls += 0 if self.template_mode == "local" else 1
+        print(template_text)
+
+        guess = None
+        if self.similarity_index is not None:
+            path_segments, guess = self.similarity_index.route(template_text, tree)
+            if path_segments is not None:
+                # Near-duplicate of templates already filed under one leaf: skip routing.
+                self.tree_manager.add_template(self.tree_manager.node_at(path_segments), template_text, ts=ts_val)
+                self._remember(record, template_text, path_segments)
+                if route is not None:
+                    self.route_stats["unused"] += 1
+                return path_segments, template_text, calls, False
+
+        ev = {"template": template_text}
+        if route is not None and not self.tree_manager.route_is_stale(
+                route[0].split(":") if route[0] else [], route[1], route[2]):
+            route_str, path_found = route[0], route[1]
+        else:
+            if route is not None:
+                # Conflict: a node on the route (or, for a new category, anywhere) changed since the snapshot.
+                self.route_stats["stale"] += 1
             route_str, path_found = self.route_from_llm(tree, ev["template"])
-            ev["error_code"] = route_str
-            ev["path_found"] = path_found
-            ev["ts"] = ts_val
+            calls += 1
+        ev["error_code"] = route_str
+        ev["path_found"] = path_found
+        ev["ts"] = ts_val
+        # Exactly one horizontal or vertical expansion call, published as one tree version.
+        with self.tree_manager.transaction():
             self.tree_manager.update_sensor_tree(
                 tree, ev, self.agent, self.prompts["horizontal"], self.prompts["vertical"]
             )
+        calls += 1
+
 
+        # derive final classification path by searching where the template landed
+        path_segments = self.tree_manager.find_path_by_template(template_text)
+        if self.similarity_index is not None:
+            self.similarity_index.record_llm_route(guess, path_segments)
+        self._remember(record, template_text, path_segments)
+        return path_segments, template_text, calls, False
 
-            # derive final classification path by searching where the template landed
-            path_segments = self.tree_manager.find_path_by_template(template_text)
-            classifications.append(" -> ".join(path_segments))
-            templates.append(template_text)
+    def _remember(self, record, template_text, path_segments):
+        if self.signature_cache is not None:
+            self.signature_cache.store(record, template_text, path_segments)
+        if self.similarity_index is not None:
+            self.similarity_index.add(template_text, path_segments)
+
+    @staticmethod
+    def _unit_tags(units_df, idx):
+        """cost_scope() tags attributing a unit's LLM calls to its device and timestamp."""
+        row = units_df.iloc[idx]
+        device = next((row[c] for c in DEVICE_COLUMNS if c in units_df.columns), None)
+        return {"device": None if device is None or pd.isna(device) else str(device), "ts": str(row["ts"])}
+
+    @staticmethod
+    def _llm_unavailable(idx, err):
+        print(f"[llm] unit {idx} deferred: {err}")
+
+    def _classify_sequential(self, tree, units_df, records, order, tree_chars, on_result=None):
+        results, deferred, unit_calls = {}, [], {}
+        for idx in order:
+            rec = records[idx]
+            cached = self.signature_cache is not None and self.signature_cache.contains(rec)
+            if not cached and not self._within_budget(rec, tree_chars):
+                deferred.append(idx)
+                continue
+            started = time.perf_counter()
+            try:
+                with cost_scope(**self._unit_tags(units_df, idx)):
+                    path_segments, template_text, calls, hit = self._commit_unit(tree, rec, units_df.iloc[idx]["ts"])
+            except LLMUnavailable as e:
+                # Retries exhausted: keep the unit for a later run instead of failing the batch.
+                self._llm_unavailable(idx, e)
+                deferred.append(idx)
+                continue
+            if self.signature_cache is not None:
+                self.signature_cache.record_latency(time.perf_counter() - started, hit=hit)
+            results[idx] = (" -> ".join(path_segments), template_text)
+            unit_calls[idx] = calls
+            if on_result is not None:
+                on_result(idx, results[idx])
+        return results, deferred, unit_calls
+
+    async def _classify_pipeline(self, tree, units_df, records, order, tree_chars, concurrency, on_result=None):
+        """
+        Stage one extracts templates and routes them against the latest published
+        tree snapshot, for all records concurrently (bounded by `concurrency`).
+        Stage two applies the tree mutations one record at a time, in priority
+        order, on a worker thread; a route whose part of the tree changed since
+        its snapshot is recomputed there. With route_batch_size > 1 the stage-one
+        routes are coalesced into batched calls by a RouteBatcher.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        batcher = RouteBatcher(self, self.route_batch_size) if self.route_batch_size > 1 else None
+
+        async def extract(idx, rec):
+            with cost_scope(**self._unit_tags(units_df, idx)):
+                async with semaphore:
+                    started = time.perf_counter()
+                    template_text = await self.aextract_template(rec)
+                    snap = self.tree_manager.current()
+                    if self.similarity_index is not None and self.similarity_index.peek(template_text, snap.root):
+                        return template_text, None, time.perf_counter() - started
+                    if batcher is None:
+                        route_str, path_found = await self.aroute_from_llm(snap.root, template_text)
+                        return template_text, (route_str, path_found, snap.structure_seq), \
+                            time.perf_counter() - started
+                # Outside the semaphore, so a batch can fill beyond `concurrency` items.
+                route = await batcher.route(template_text)
+                return template_text, route, time.perf_counter() - started
+
+        plan, deferred = [], []
+        reserved_calls = reserved_tokens = 0
+        for idx in order:
+            rec = records[idx]
+            if self.signature_cache is not None and self.signature_cache.contains(rec):
+                plan.append((idx, None))
+                continue
+            # Nothing has been spent yet while planning, so reserve budget cumulatively.
+            if not self._within_budget(rec, tree_chars, reserved_calls, reserved_tokens):
+                deferred.append(idx)
+                continue
+            reserved_calls += self._calls_per_record()
+            reserved_tokens += self._estimate_record_tokens(rec, tree_chars)
+            plan.append((idx, asyncio.ensure_future(extract(idx, rec))))
+
+        results, unit_calls = {}, {}
+        try:
+            for idx, task in plan:
+                try:
+                    template_text, route, extract_seconds = (await task) if task is not None else (None, None, 0.0)
+                    started = time.perf_counter()
+                    with cost_scope(**self._unit_tags(units_df, idx)):
+                        path_segments, template_text, calls, hit = await asyncio.to_thread(
+                            self._commit_unit, tree, records[idx], units_df.iloc[idx]["ts"], template_text, route
+                        )
+                except LLMUnavailable as e:
+                    self._llm_unavailable(idx, e)
+                    deferred.append(idx)
+                    continue
+                if task is not None and not hit and self.template_mode != "local":
+                    calls += 1
+                if route is not None:
+                    self.route_stats["prefetched"] += 1
+                    calls += 1
+                if self.signature_cache is not None:
+                    self.signature_cache.record_latency(extract_seconds + time.perf_counter() - started, hit=hit)
+                results[idx] = (" -> ".join(path_segments), template_text)
+                unit_calls[idx] = calls
+                if on_result is not None:
+                    on_result(idx, results[idx])
+        finally:
+            for _, task in plan:
+                if task is not None and not task.done():
+                    task.cancel()
+            if batcher is not None:
+                batcher.close()
+                for k, v in batcher.stats.items():
+                    self.route_stats[k] = self.route_stats.get(k, 0) + v
+            await self.agent.aclose()
+        return results, deferred, unit_calls
+
+    def classify_rows(self, df, concurrency: int = 1, on_result=None):
+        """
+        Classify every row of `df` in the given order, without scheduling,
+        episode grouping or CSV output (used by the offline rebuild tool).
+        Returns (results, unit_calls) keyed by row position.
+        """
+        records = self.record_builder.build_records_from_csv(df)
+        order = list(range(len(df)))
+        tree = self.tree_manager.tree
+        tree_chars = len(self.tree_manager.prompt_tree_json(tree))
+        if (concurrency and concurrency > 1) or self.route_batch_size > 1:
+            results, _, unit_calls = asyncio.run(
+                self._classify_pipeline(tree, df, records, order, tree_chars, concurrency, on_result)
+            )
+        else:
+            results, _, unit_calls = self._classify_sequential(tree, df, records, order, tree_chars, on_result)
+        return results, unit_calls
+
+    def run(self, save_augmented_csv: bool = True, out_path: str = None, concurrency: int = 1,
+            resume: bool = True):
+        df = pd.read_csv(self.csv_path)
+        if self.scheduler is not None:
+            # Merge previously deferred rows back into the pending set.
+            df = self.scheduler.pending(df)
+        df_resumed = None
+        resumed_keys = []
+        if self.ledger is not None:
+            row_keys = self.ledger.keys_for(df)
+            seen = self.ledger.seen_mask(df)
+            if resume:
+                # Rows an interrupted run classified but never wrote out: emit, don't reclassify.
+                unwritten = self.ledger.unwritten()
+                resumed_rows = [p for p, k in enumerate(row_keys) if k in unwritten]
+                df_resumed = df.iloc[resumed_rows].copy()
+                df_resumed["classification"] = [unwritten[row_keys[p]][0] for p in resumed_rows]
+                df_resumed["template"] = [unwritten[row_keys[p]][1] for p in resumed_rows]
+                resumed_keys = [row_keys[p] for p in resumed_rows]
+            if any(seen):
+                print(f"[ledger] skipping {sum(seen)} of {len(df)} rows already classified"
+                      + (f" ({len(df_resumed)} resumed from checkpoint)" if df_resumed is not None and len(df_resumed) else ""))
+            df = df[[not s for s in seen]].reset_index(drop=True)
+        if self.episode_builder is not None:
+            # Classify one representative per episode and fan the result out to its members.
+            units_df, episodes = self.episode_builder.build(df)
+        else:
+            units_df, episodes = df, [[i] for i in range(len(df))]
+        if self.scheduler is not None:
+            # Process the most severe first.
+            order = self.scheduler.order(units_df)
+        else:
+            order = list(range(len(units_df)))
+        records = self.record_builder.build_records_from_csv(units_df)
+        tree = self.tree_manager.tree
+
+        on_result = None
+        if self.ledger is not None:
+            unit_keys = self.ledger.keys_for(df)
+
+            def on_result(idx, result):
+                # Checkpoint every member row of the unit as soon as it is committed.
+                self.ledger.record([unit_keys[p] for p in episodes[idx]], *result)
+
+        tree_chars = len(self.tree_manager.prompt_tree_json(tree))
+        started = time.perf_counter()
+        if (concurrency and concurrency > 1) or self.route_batch_size > 1:
+            results, deferred, unit_calls = asyncio.run(
+                self._classify_pipeline(tree, units_df, records, order, tree_chars, concurrency, on_result)
+            )
+        else:
+            results, deferred, unit_calls = self._classify_sequential(
+                tree, units_df, records, order, tree_chars, on_result
+            )
+        elapsed = time.perf_counter() - started
+        if results:
+            print(f"[throughput] classified {len(results)} records in {elapsed:.2f}s "
+                  f"({len(results) / elapsed if elapsed > 0 else 0.0:.2f} records/s, concurrency={concurrency})")
+        calls_saved = sum((len(episodes[i]) - 1) * c for i, c in unit_calls.items())
+
+        if self.signature_cache is not None:
+            self.signature_cache.save()
+            print(f"[signature-cache] {self.signature_cache.report()}")
+        if self.agent.cache is not None:
+            print(f"[response-cache] {self.agent.cache.stats()}")
+        if self.similarity_index is not None:
+            print(f"[similarity-index] {self.similarity_index.stats()}")
+        if self.route_stats["prefetched"]:
+            print(f"[snapshot-routing] {self.route_stats}")
+        for stage, st in self.agent.stage_stats().items():
+            print(f"[llm-stage] {stage}: {st['runs']} runs, {st['llm_calls']} calls, {st['cache_hits']} cache hits, "
+                  f"avg {st['avg_latency_s']:.2f}s, {st['input_tokens']}/{st['output_tokens']} in/out tokens "
+                  f"({st['cached_ratio']:.1%} of input cached), "
+                  f"escalation rate {st['escalation_rate']:.1%}, {st['retries']} retries, "
+                  f"{st['api_errors']} API errors, {st['rate_limited_s']:.2f}s rate-limited, by model {st['by_model']}")
+
+        if self.episode_builder is not None:
+            print(f"[episodes] {len(df)} anomaly rows -> {len(episodes)} episodes; "
+                  f"{calls_saved} LLM calls saved")
+
+        if self.scheduler is not None:
+            deferred_rows = sorted(p for i in deferred for p in episodes[i])
+            self.scheduler.save_backlog(df.iloc[deferred_rows])
+            if deferred:
+                print(f"[scheduler] deferred {len(deferred_rows)} of {len(df)} anomalies to {self.scheduler.backlog_path}; "
+                      f"budget usage: {self.scheduler.budget.usage()}")
 
         # print JSON view of the tree (latest template per leaf if for_display=True)
         print(json.dumps(self.tree_manager.tree_structure(tree, for_display=True),
                          indent=2, ensure_ascii=False))
 
         # build and optionally save augmented CSV
-        df_out = df.copy()
-        df_out["classification"] = classifications
-        df_out["template"] = templates
-
-        if save_augmented_csv:
-            if out_path is None:
-                base_dir = os.path.dirname(self.csv_path) or "."
-                out_path = os.path.join(base_dir, "anomaly_results_classified.csv")
+        row_results = {p: results[i] for i in results for p in episodes[i]}
+        processed = sorted(row_results)
+        df_out = df.iloc[processed].copy()
+        df_out["classification"] = [row_results[p][0] for p in processed]
+        df_out["template"] = [row_results[p][1] for p in processed]
+        if df_resumed is not None and not df_resumed.empty:
+            df_out = pd.concat([df_resumed, df_out], ignore_index=True)
+
+        if out_path is None:
+            base_dir = os.path.dirname(self.csv_path) or "."
+            out_path = os.path.join(base_dir, "anomaly_results_classified.csv")
+        if save_augmented_csv and not df_out.empty:
             # Append if file exists, otherwise write with header
             append_mode = 'a' if os.path.exists(out_path) else 'w'
             include_header = not os.path.exists(out_path)
             df_out.to_csv(out_path, mode=append_mode, header=include_header, index=False)
             print(f"[{'appended' if append_mode=='a' else 'saved'}] {out_path}")
+        if self.ledger is not None:
+            self.ledger.mark_written(resumed_keys + [unit_keys[p] for p in processed])
         # tree_json = self.tree_manager.export_tree_json(
         #     out_path=(os.path.splitext(self.csv_path)[0] + "__tree.json")
         # )
@@ -127,12 +553,18 @@ class AnomalyTreeBuilder:
         # choose consistent JSON filename next to the CSV/input directory
         base_dir_for_json = os.path.dirname(out_path) if save_augmented_csv else (os.path.dirname(self.csv_path) or ".")
         json_out = os.path.join(base_dir_for_json, "anomaly_results_classified_tree.json")
-        _ = self.tree_manager.export_tree_simple_json(json_out)
-        print(f"[saved] {json_out}")
+        tree_version = self.tree_manager.export_tree_simple_json(json_out)
+        print(f"[saved] {json_out} (tree version {tree_version})")
+        self.tree_manager.close()
+        self.detach()
 
         return {
             "json_out": json_out,      
             "csv_df": df_out,          
-
+            "deferred": sum(len(episodes[i]) for i in deferred),
+            "episodes": len(episodes),
+            "llm_calls_saved": calls_saved,
+            "signature_cache": self.signature_cache.report() if self.signature_cache is not None else None,
+            "similarity_index": self.similarity_index.stats() if self.similarity_index is not None else None,
         }
 
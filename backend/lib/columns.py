@@ -0,0 +1,5 @@
+# columns.py
+# Column names shared by the CSV/history readers.
+
+# Device id column, in order of preference; rows without one belong to device "".
+DEVICE_COLUMNS = ("device", "Device", "deviceid")
@@ -0,0 +1,89 @@
+# episode_builder.py
+import pandas as pd
+from .columns import DEVICE_COLUMNS
+
+
+class EpisodeBuilder:
+    """Coalesces runs of (near-)consecutive anomaly rows into episodes.
+
+    The edge detector maps window scores back to every point a window covers,
+    so one incident usually shows up as a run of adjacent anomalous timestamps.
+    Rows of the same device whose timestamps are at most `max_gap_seconds`
+    apart are merged; each episode is classified once through a representative
+    row whose contribution vector aggregates all members.
+    """
+
+    DEVICE_COLUMNS = DEVICE_COLUMNS
+
+    def __init__(self, max_gap_seconds: float = 60.0, aggregate: str = "max",
+                 score_column: str = "overall_anomaly_score"):
+        if aggregate not in ("max", "mean"):
+            raise ValueError(f"Unsupported aggregate '{aggregate}' (expected 'max' or 'mean')")
+        self.max_gap_seconds = max_gap_seconds
+        self.aggregate = aggregate
+        self.score_column = score_column
+
+    def _device_column(self, df: pd.DataFrame):
+        for c in self.DEVICE_COLUMNS:
+            if c in df.columns:
+                return c
+        return None
+
+    def group(self, df: pd.DataFrame):
+        """Return episodes as lists of positional row indices, in time order."""
+        if df.empty:
+            return []
+        ts = pd.to_datetime(df["ts"], errors="coerce", utc=True)
+        dev_col = self._device_column(df)
+        devices = df[dev_col].astype(str).values if dev_col else [""] * len(df)
+        keys = pd.DataFrame({"dev": devices, "ts": ts.values, "pos": range(len(df))})
+        keys = keys.sort_values(["dev", "ts", "pos"], kind="mergesort")
+
+        episodes, current = [], []
+        prev_dev, prev_ts = None, None
+        for dev, t, pos in keys.itertuples(index=False):
+            gap_ok = (
+                current and dev == prev_dev and not pd.isna(t) and not pd.isna(prev_ts)
+                and (t - prev_ts).total_seconds() <= self.max_gap_seconds
+            )
+            if not gap_ok and current:
+                episodes.append(current)
+                current = []
+            current.append(pos)
+            prev_dev, prev_ts = dev, t
+        if current:
+            episodes.append(current)
+        episodes.sort(key=lambda members: members[0])
+        return episodes
+
+    def build(self, df: pd.DataFrame):
+        """
+        Returns (representatives_df, episodes):
+        - representatives_df: one row per episode (positional order matches `episodes`),
+          taken from the member with the highest anomaly score, with every
+          contribution_* column replaced by the aggregate over all members.
+        - episodes: list of member positional indices into `df`.
+        """
+        episodes = self.group(df)
+        contrib_cols = [c for c in df.columns if c.startswith("contribution_")]
+        scores = (pd.to_numeric(df[self.score_column], errors="coerce").fillna(0.0).values
+                  if self.score_column in df.columns else None)
+
+        rows = []
+        for members in episodes:
+            if scores is not None:
+                rep_pos = max(members, key=lambda p: scores[p])
+            else:
+                rep_pos = members[0]
+            rep = df.iloc[rep_pos].copy()
+            if len(members) > 1:
+                block = df.iloc[members]
+                for c in contrib_cols:
+                    vals = pd.to_numeric(block[c], errors="coerce")
+                    rep[c] = vals.max() if self.aggregate == "max" else vals.mean()
+                if scores is not None:
+                    rep[self.score_column] = max(scores[p] for p in members)
+            rows.append(rep)
+
+        reps = pd.DataFrame(rows, columns=df.columns).reset_index(drop=True).infer_objects()
+        return reps, episodes
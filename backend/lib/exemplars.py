@@ -0,0 +1,107 @@
+# exemplars.py
+import re
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:_[a-z]+)*\d*|~?\d+(?:\.\d+)?", re.I)
+
+
+def template_signature(template: str) -> frozenset:
+    """Token set used to compare templates (case-folded words, sensor ids and numbers)."""
+    return frozenset(t.lower() for t in _TOKEN_RE.findall(template or ""))
+
+
+def jaccard_distance(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 0.0
+    return 1.0 - len(a & b) / len(a | b)
+
+
+def select_diverse(templates, k: int, signatures=None):
+    """
+    Pick at most `k` templates that cover the list as broadly as possible.
+
+    Greedy farthest-point selection over token-set Jaccard distance, seeded with
+    the oldest template; ties go to the more recent one. The result keeps the
+    original (chronological) order. Seeding with the oldest rather than the
+    newest means the pick only changes when the candidate set does, so the
+    serialized prompt (and the provider's cached prefix) survives new arrivals.
+    """
+    n = len(templates)
+    if k <= 0 or n == 0:
+        return []
+    if n <= k:
+        return list(templates)
+    sigs = signatures if signatures is not None else [template_signature(t) for t in templates]
+    chosen = [0]
+    # Distance from every template to its nearest chosen exemplar.
+    nearest = [jaccard_distance(sigs[i], sigs[0]) for i in range(n)]
+    while len(chosen) < k:
+        best, best_d = None, -1.0
+        for i in range(n - 1, -1, -1):
+            if nearest[i] > best_d:
+                best, best_d = i, nearest[i]
+        if best is None or best_d <= 0.0:
+            break
+        chosen.append(best)
+        for i in range(n):
+            d = jaccard_distance(sigs[i], sigs[best])
+            if d < nearest[i]:
+                nearest[i] = d
+    return [templates[i] for i in sorted(chosen)]
+
+
+class ExemplarSet:
+    """
+    Fixed-size, incrementally maintained set of diverse exemplars for one leaf.
+
+    Each new template is compared with the current members: while the set is
+    not full it is simply added; afterwards it replaces one member of the
+    closest (most redundant) pair whenever it is farther from the set than
+    that pair is from each other. Updates cost O(k^2) regardless of how many
+    templates the leaf has accumulated.
+    """
+
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self._items = []  # [(template, signature)] in arrival order
+        self.seen = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def items(self):
+        return [t for t, _ in self._items]
+
+    def clear(self):
+        self._items = []
+        self.seen = 0
+
+    def add(self, template: str):
+        self.seen += 1
+        if self.max_size <= 0:
+            return
+        sig = template_signature(template)
+        if len(self._items) < self.max_size:
+            self._items.append((template, sig))
+            return
+        d_new = min(jaccard_distance(sig, s) for _, s in self._items)
+        if d_new <= 0.0:
+            return
+        # Closest pair among current members.
+        best_pair, best_d = None, None
+        for i in range(len(self._items)):
+            for j in range(i + 1, len(self._items)):
+                d = jaccard_distance(self._items[i][1], self._items[j][1])
+                if best_d is None or d < best_d:
+                    best_pair, best_d = (i, j), d
+        if best_pair is None or d_new <= best_d:
+            return
+        i, j = best_pair
+        # Drop whichever member of the redundant pair is closer to the newcomer.
+        drop = i if jaccard_distance(sig, self._items[i][1]) <= jaccard_distance(sig, self._items[j][1]) else j
+        del self._items[drop]
+        self._items.append((template, sig))
+
+    def rebuild(self, templates):
+        self.clear()
+        for t in templates:
+            self.add(t)
@@ -1,15 +1,303 @@
-from openai import OpenAI
+import os
+import json
+import time
+import random
+import asyncio
+import httpx
+import openai
+from .llm_backends import TransientLLMError, backend_from_env
+from .llm_usage import current_tags
+
+
+class OutputRejected(ValueError):
+    """
+    Raised by a `validate` callback when a response fails a consistency check.
+    A soft rejection still lets the last tier's response through (the caller
+    can repair it); a hard one, like any other exception, propagates.
+    """
+
+    def __init__(self, message, soft: bool = False):
+        super().__init__(message)
+        self.soft = soft
+
+
+class LLMUnavailable(RuntimeError):
+    """A call still failed with a retryable error (timeout, 429, 5xx) after every retry."""
+
+
+class RetryPolicy:
+    """Per-attempt timeout and jittered exponential backoff for retryable API errors."""
+
+    RETRYABLE_STATUS = (408, 409, 429)
+
+    def __init__(self, timeout_s=60.0, max_retries=3, base_delay_s=0.5, max_delay_s=20.0):
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+
+    @classmethod
+    def from_env(cls):
+        """LLM_TIMEOUT_S, LLM_MAX_RETRIES, LLM_RETRY_BASE_S, LLM_RETRY_MAX_S."""
+        env = os.environ.get
+        return cls(timeout_s=float(env("LLM_TIMEOUT_S", "60")), max_retries=int(env("LLM_MAX_RETRIES", "3")),
+                   base_delay_s=float(env("LLM_RETRY_BASE_S", "0.5")), max_delay_s=float(env("LLM_RETRY_MAX_S", "20")))
+
+    def retryable(self, exc):
+        if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                            httpx.TransportError, TransientLLMError)):
+            return True
+        if isinstance(exc, openai.APIStatusError):
+            return exc.status_code in self.RETRYABLE_STATUS or exc.status_code >= 500
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in self.RETRYABLE_STATUS or exc.response.status_code >= 500
+        return False
+
+    def delay(self, attempt, exc=None):
+        """Full-jitter backoff for retry `attempt` (1-based); a server Retry-After is a lower bound."""
+        delay = random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** (attempt - 1)))
+        response = getattr(exc, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, min(float(retry_after), self.max_delay_s)) if retry_after else delay
+        except ValueError:
+            pass
+        return delay
+
+
+def load_model_tiers():
+    """
+    Per-stage model lists from LLM_MODEL_TIERS: inline JSON or a path to a JSON
+    file, e.g. {"route": ["gpt-4.1-nano", "gpt-4.1-mini"], "template": [...]}.
+    Stages: template, route, route_batch, horizontal, vertical. Batched routing
+    (route_batch) uses the route tiers unless it has its own.
+    """
+    raw = os.environ.get("LLM_MODEL_TIERS", "").strip()
+    if not raw:
+        return {}
+    if not raw.startswith("{"):
+        with open(raw, "r", encoding="utf-8") as f:
+            raw = f.read()
+    tiers = {stage: list(models) for stage, models in json.loads(raw).items()}
+    if "route" in tiers:
+        tiers.setdefault("route_batch", tiers["route"])
+    return tiers
+
 
 class GPTAgent:
-    """Wrapper for OpenAI Chat API calls."""
+    """Wrapper for LLM calls over a pluggable backend (OpenAI, local HTTP or fake).
+
+    Each call may name its pipeline `stage`. A stage configured in `tiers` tries
+    its models cheapest first and escalates to the next one only when
+    `validate(text)` raises (unparseable output or a failed consistency check).
+    Per-stage latency, tokens, cache hits and escalations are kept in
+    stage_stats().
 
-    def __init__(self, model="gpt-4.1-mini", temperature=0.0):
-        self.client = OpenAI()
+    Every attempt is bounded by `retry.timeout_s`; timeouts, connection errors,
+    429s and 5xx responses are retried with jittered exponential backoff and
+    raise LLMUnavailable once retries run out. A shared `limiter`
+    (RateLimiter) paces requests across workers, and `usage_hook(event)` is
+    called once per API call with its stage, model, latency, input/output
+    tokens, attempts and the cost_scope() tags (request_id, device, ...).
+    """
+
+    def __init__(self, model="gpt-4.1-mini", temperature=0.0, budget=None, cache=None, tiers=None,
+                 retry=None, limiter=None, usage_hook=None, backend=None):
+        self.retry = retry or RetryPolicy.from_env()
+        # Transport (lib/llm_backends.py): OpenAI by default, LLM_BACKEND selects http or fake.
+        self.backend = backend or backend_from_env(timeout_s=self.retry.timeout_s)
         self.model = model
         self.opts = {"temperature": temperature}
+        # stage -> [model, ...] in escalation order; unlisted stages use `model` only.
+        self.tiers = tiers or {}
+        # Optional LLMBudget shared with the scheduler; every call is recorded against it.
+        self.budget = budget
+        # Optional ResponseCache; only consulted for deterministic (temperature 0) calls.
+        self.cache = cache
+        self.limiter = limiter
+        self.usage_hook = usage_hook
+        self.calls = 0
+        self._stats = {}
+
+    def _models_for(self, stage):
+        return self.tiers.get(stage) or [self.model]
+
+    def _stage(self, stage):
+        key = stage or "default"
+        if key not in self._stats:
+            self._stats[key] = {"runs": 0, "llm_calls": 0, "cache_hits": 0, "latency_s": 0.0,
+                                "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "escalations": 0,
+                                "failures": 0, "api_errors": 0, "retries": 0, "rate_limited_s": 0.0, "by_model": {}}
+        return self._stats[key]
+
+    def _account(self, response, prompt, model, stage, stats, latency, attempts):
+        self.calls += 1
+        tokens = response.total_tokens
+        if self.budget is not None:
+            self.budget.record(calls=1, tokens=tokens if tokens is not None else len(prompt) // 4)
+        input_tokens = response.input_tokens or len(prompt) // 4
+        cached_tokens = response.cached_tokens or 0
+        output_tokens = response.output_tokens or 0
+        stats["llm_calls"] += 1
+        stats["latency_s"] += latency
+        stats["input_tokens"] += input_tokens
+        stats["cached_tokens"] += cached_tokens
+        stats["output_tokens"] += output_tokens
+        stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+        self._emit(stage, model, latency, input_tokens, output_tokens, attempts, ok=True,
+                   cached_tokens=cached_tokens)
+
+    def _emit(self, stage, model, latency, input_tokens, output_tokens, attempts, ok, error=None,
+              cached_tokens=0):
+        if self.usage_hook is None:
+            return
+        event = {"ts": time.time(), "stage": stage or "default", "model": model, "latency_s": latency,
+                 "input_tokens": input_tokens, "cached_tokens": cached_tokens, "output_tokens": output_tokens,
+                 "attempts": attempts, "ok": ok, "tags": current_tags()}
+        if error is not None:
+            event["error"] = error
+        try:
+            self.usage_hook(event)
+        except Exception as e:
+            print(f"[llm] usage hook failed: {e}")
+
+    def _give_up(self, exc, attempt, prompt, model, stage, stats, started):
+        """Record a failed attempt; return the backoff delay, or raise once retries are exhausted."""
+        if not self.retry.retryable(exc) or attempt > self.retry.max_retries:
+            stats["api_errors"] += 1
+            self._emit(stage, model, time.perf_counter() - started, len(prompt) // 4, 0, attempt,
+                       ok=False, error=f"{type(exc).__name__}: {exc}")
+            if self.retry.retryable(exc):
+                raise LLMUnavailable(f"{model} unavailable after {attempt} attempts: {exc}") from exc
+            raise exc
+        stats["retries"] += 1
+        delay = self.retry.delay(attempt, exc)
+        print(f"[llm] {stage or 'default'}: {model} attempt {attempt} failed ({type(exc).__name__}); "
+              f"retrying in {delay:.2f}s")
+        return delay
+
+    def _call(self, prompt, model, stage, stats):
+        started = time.perf_counter()
+        for attempt in range(1, self.retry.max_retries + 2):
+            if self.limiter is not None:
+                stats["rate_limited_s"] += self.limiter.acquire(tokens=len(prompt) // 4)
+            attempt_started = time.perf_counter()
+            try:
+                response = self.backend.complete(model, prompt, self.opts)
+            except Exception as e:
+                time.sleep(self._give_up(e, attempt, prompt, model, stage, stats, started))
+                continue
+            self._account(response, prompt, model, stage, stats, time.perf_counter() - attempt_started, attempt)
+            return response.text
+
+    async def _acall(self, prompt, model, stage, stats):
+        started = time.perf_counter()
+        for attempt in range(1, self.retry.max_retries + 2):
+            if self.limiter is not None:
+                stats["rate_limited_s"] += await self.limiter.aacquire(tokens=len(prompt) // 4)
+            attempt_started = time.perf_counter()
+            try:
+                response = await self.backend.acomplete(model, prompt, self.opts)
+            except Exception as e:
+                await asyncio.sleep(self._give_up(e, attempt, prompt, model, stage, stats, started))
+                continue
+            self._account(response, prompt, model, stage, stats, time.perf_counter() - attempt_started, attempt)
+            return response.text
+
+    def _cache_key(self, prompt, model):
+        if self.cache is None or self.cache.bypass or self.opts.get("temperature", 0.0) != 0.0:
+            return None
+        # Keys of the default backend are unchanged; others never share its entries.
+        name = getattr(self.backend, "name", "openai")
+        # Key on the model actually sent: a local server's LLM_HTTP_MODEL overrides the tier's.
+        model = getattr(self.backend, "model", None) or model
+        return self.cache.make_key(model if name == "openai" else f"{name}:{model}", self.opts, prompt)
+
+    @staticmethod
+    def _rejection(text, validate):
+        """The exception `validate` raises for `text`, or None when it passes."""
+        if validate is None:
+            return None
+        try:
+            validate(text)
+        except Exception as e:
+            return e
+        return None
+
+    def _cached(self, key, validate, stats):
+        """(text, rejection) for a cache hit, or (None, None)."""
+        if key is None:
+            return None, None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None, None
+        error = self._rejection(cached, validate)
+        if error is not None and not (isinstance(error, OutputRejected) and error.soft):
+            # Only validated output is stored; drop entries written before that held.
+            self.cache.delete(key)
+            return None, None
+        stats["cache_hits"] += 1
+        return cached, error
+
+    def _store(self, key, text, model, error):
+        # Rejected output (even soft-accepted on the last tier) is never cached, so a
+        # retry or an escalation asks the model again instead of replaying it.
+        if key is not None and error is None:
+            self.cache.put(key, text, model=model)
+
+    def _accept(self, error, stage, models, tier, stats):
+        """True to return the output, False to escalate; re-raises `error` when out of tiers."""
+        if error is None:
+            return True
+        if tier == len(models) - 1:
+            stats["failures"] += 1
+            if isinstance(error, OutputRejected) and error.soft:
+                return True
+            raise error
+        stats["escalations"] += 1
+        print(f"[llm] {stage}: {models[tier]} output rejected ({error}); escalating to {models[tier + 1]}")
+        return False
+
+    def run(self, prompt: str, user_context: str = "", stage: str = None, validate=None) -> str:
+        models = self._models_for(stage)
+        stats = self._stage(stage)
+        stats["runs"] += 1
+        for tier, model in enumerate(models):
+            key = self._cache_key(prompt, model)
+            text, error = self._cached(key, validate, stats)
+            if text is None:
+                text = self._call(prompt, model, stage, stats)
+                error = self._rejection(text, validate)
+                self._store(key, text, model, error)
+            if self._accept(error, stage, models, tier, stats):
+                return text
+
+    async def arun(self, prompt: str, user_context: str = "", stage: str = None, validate=None) -> str:
+        models = self._models_for(stage)
+        stats = self._stage(stage)
+        stats["runs"] += 1
+        for tier, model in enumerate(models):
+            key = self._cache_key(prompt, model)
+            text, error = self._cached(key, validate, stats)
+            if text is None:
+                text = await self._acall(prompt, model, stage, stats)
+                error = self._rejection(text, validate)
+                self._store(key, text, model, error)
+            if self._accept(error, stage, models, tier, stats):
+                return text
+
+    def stage_stats(self):
+        out = {}
+        for stage, s in self._stats.items():
+            out[stage] = dict(
+                s,
+                by_model=dict(s["by_model"]),
+                avg_latency_s=(s["latency_s"] / s["llm_calls"]) if s["llm_calls"] else 0.0,
+                escalation_rate=(s["escalations"] / s["runs"]) if s["runs"] else 0.0,
+                # Share of input tokens the provider served from its prompt-prefix cache.
+                cached_ratio=(s["cached_tokens"] / s["input_tokens"]) if s["input_tokens"] else 0.0,
+            )
+        return out
 
-    def run(self, prompt: str, user_context: str = "") -> str:
-        response = self.client.responses.create(
-            model=self.model, input = prompt, **self.opts
-        )
-        return response.output_text
+    async def aclose(self):
+        await self.backend.aclose()
@@ -0,0 +1,317 @@
+# llm_backends.py
+"""
+Interchangeable transports behind GPTAgent.
+
+Each backend turns (model, prompt, options) into an LLMResponse and raises on
+failure; retries, rate limiting, caching and accounting stay in GPTAgent.
+
+- OpenAIBackend: the OpenAI Responses API (default).
+- HTTPBackend:   any OpenAI-compatible /chat/completions endpoint (vLLM,
+                 llama.cpp server, Ollama, ...), e.g. a model on the edge box.
+- FakeBackend:   deterministic, prompt-compliant answers for the repo's four
+                 prompts with injected latency and failures; no network.
+
+Selected with LLM_BACKEND=openai|http|fake (see backend_from_env()).
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    input_tokens: int = None
+    output_tokens: int = None
+    total_tokens: int = None
+    # Input tokens served from the provider's prompt (prefix) cache.
+    cached_tokens: int = None
+
+
+class TransientLLMError(RuntimeError):
+    """A backend failure worth retrying (raised by FakeBackend's failure injection)."""
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, timeout_s=60.0, prompt_cache_key=None):
+        self.timeout_s = timeout_s
+        # Optional routing hint so requests sharing a prefix land on the same prompt cache.
+        self.extra = {"prompt_cache_key": prompt_cache_key} if prompt_cache_key else {}
+        # The SDK's own retries are disabled so backoff, limits and accounting happen in GPTAgent.
+        self.client = OpenAI(timeout=timeout_s, max_retries=0)
+        # Created lazily by acomplete(); bound to the running event loop until aclose().
+        self.async_client = None
+
+    @staticmethod
+    def _response(response):
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "input_tokens_details", None)
+        return LLMResponse(
+            text=response.output_text,
+            input_tokens=getattr(usage, "input_tokens", None),
+            output_tokens=getattr(usage, "output_tokens", None),
+            total_tokens=getattr(usage, "total_tokens", None),
+            cached_tokens=getattr(details, "cached_tokens", None),
+        )
+
+    def complete(self, model, prompt, opts):
+        return self._response(self.client.responses.create(model=model, input=prompt, **opts, **self.extra))
+
+    async def acomplete(self, model, prompt, opts):
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(timeout=self.timeout_s, max_retries=0)
+        return self._response(await self.async_client.responses.create(model=model, input=prompt, **opts,
+                                                                       **self.extra))
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+
+class HTTPBackend:
+    """OpenAI-compatible chat-completions endpoint at `base_url` (e.g. http://127.0.0.1:8000/v1)."""
+
+    name = "http"
+
+    def __init__(self, base_url, timeout_s=60.0, api_key=None, model=None):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.timeout_s = timeout_s
+        # Local servers usually serve one model under their own name; override the agent's.
+        self.model = model
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(timeout=timeout_s, headers=self.headers)
+        self.async_client = None
+
+    def _body(self, model, prompt, opts):
+        return {"model": self.model or model, "messages": [{"role": "user", "content": prompt}], **opts}
+
+    @staticmethod
+    def _response(r):
+        r.raise_for_status()
+        body = r.json()
+        usage = body.get("usage") or {}
+        return LLMResponse(
+            text=body["choices"][0]["message"]["content"] or "",
+            input_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens"),
+            total_tokens=usage.get("total_tokens"),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        )
+
+    def complete(self, model, prompt, opts):
+        return self._response(self.client.post(self.url, json=self._body(model, prompt, opts)))
+
+    async def acomplete(self, model, prompt, opts):
+        if self.async_client is None:
+            self.async_client = httpx.AsyncClient(timeout=self.timeout_s, headers=self.headers)
+        return self._response(await self.async_client.post(self.url, json=self._body(model, prompt, opts)))
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+
+
+def _domain_label(text):
+    t = text.lower()
+    if "cross domain" in t or "nearly tied" in t:
+        return "Cross-domain"
+    if "voltage" in t or "v_ch" in t:
+        return "Volt-related"
+    if "temperature" in t or "t_ch" in t:
+        return "Temp-related"
+    return "Other-related"
+
+
+def _group_label(text):
+    names = set(re.findall(r"\b[a-z]_ch\d+\b", text.lower()))
+    if len(names) <= 1:
+        return "SingleSensorDrift"
+    if len(names) == 2:
+        return "PartialGroupDrift"
+    return "UniformGroupDrift"
+
+
+def _fake_route(tree_text, template):
+    domain, group = _domain_label(template), _group_label(template)
+    try:
+        tree = json.loads(tree_text)
+    except json.JSONDecodeError:
+        tree = {}
+    if domain not in tree:
+        return f"Explanation: no {domain} anchor yet.\nRoute: ({domain})\nFound: NO"
+    sub = tree[domain]
+    if isinstance(sub, dict) and group in sub:
+        return f"Explanation: matches {group}.\nRoute: ({domain} -> {group})\nFound: YES"
+    return f"Explanation: closest existing node.\nRoute: ({domain})\nFound: YES"
+
+
+def fake_completion(prompt: str) -> str:
+    """Deterministic, format-compliant answer for one of the repo's prompts."""
+    if "per-row data (JSON)" in prompt:
+        record = json.loads(prompt.split("(JSON):\n", 1)[1])
+        top = record["ranking"][0]["name"]
+        sensors = next((d["sensors"] for d in record["domains"] if d["name"] == top), [])
+        sensors = sorted(sensors, key=lambda s: -s["value"])
+        active = [s for s in sensors if s["value"] >= 0.5] or sensors[:1]
+        listed = ", ".join(f"{s['name']} (~{s['value']:.2f})" for s in active)
+        return json.dumps({"template": f"{top} sensors {listed} are elevated while others remain low."})
+
+    if "Choose the SINGLE BEST path" in prompt and "\n\nTemplates:\n" in prompt:
+        tree_text, items = prompt.split("Error Tree:\n")[-1].split("\n\nTemplates:\n", 1)
+        return "\n".join(f"[{n}]\n" + _fake_route(tree_text, t)
+                         for n, t in re.findall(r"^\[(\d+)\] (.*)$", items, flags=re.M))
+
+    template = prompt.rsplit("Template:\n", 1)[-1].split("\n\nExplanation:")[0]
+    tree_text = prompt.split("Error Tree:\n")[-1].split("\n\nTemplate:")[0]
+    domain, group = _domain_label(template), _group_label(template)
+
+    if "Choose the SINGLE BEST path" in prompt:
+        return _fake_route(tree_text, template)
+
+    if "Addition:" in prompt and "Error Tree:" in prompt:
+        return (f"Explanation: Path not found: new pattern.\n"
+                f"Addition: ({domain} -> {group} -> <END>)\nExplanation: grouped by size.")
+
+    if "List 1:" in prompt:
+        tail = prompt.rsplit("Parent Category:", 1)[-1]
+        parent = tail.strip().splitlines()[0].strip() if tail.strip() else "Merged"
+        labels = []
+        for raw in re.findall(r"List (?:1|2): (\[.*?\])\n", tail, flags=re.S)[:2]:
+            try:
+                items = json.loads(raw)
+            except json.JSONDecodeError:
+                items = []
+            labels.append(_group_label(" ".join(items)) if items else parent)
+        if len(labels) == 2 and labels[0] != labels[1]:
+            return f"Explanation: group sizes differ.\nDetermination:\nList 1: <{labels[0]}>\nList 2: <{labels[1]}>"
+        return f"Explanation: same group size.\nDetermination:\nList 1: <{parent}>\nList 2: <{parent}>"
+
+    return "Explanation: unrecognized prompt."
+
+
+class FakeBackend:
+    """
+    Offline stand-in: answers with fake_completion() after `latency_s` (plus up
+    to `jitter_s`, plus `output_token_s` per output token). A seeded RNG
+    raises TransientLLMError on `failure_rate` of calls and returns a
+    malformed answer on `garbage_rate` of them, so retry and escalation paths
+    can be load-tested reproducibly.
+
+    Usage reports cached_tokens the way provider prefix caching does: the
+    longest prefix (at least 1024 tokens, in 128-token steps, ~4 chars per
+    token) already sent by an earlier call counts as cached.
+    """
+
+    name = "fake"
+    CACHE_MIN_CHARS = 4096
+    CACHE_BLOCK_CHARS = 512
+    CACHE_ENTRIES = 65536
+
+    def __init__(self, latency_s=0.0, jitter_s=0.0, failure_rate=0.0, garbage_rate=0.0, seed=0,
+                 output_token_s=0.0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.output_token_s = output_token_s
+        self.failure_rate = failure_rate
+        self.garbage_rate = garbage_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes = OrderedDict()  # digest of a block-aligned prompt prefix -> None (LRU)
+
+    def _draw(self):
+        with self._lock:
+            return (self.latency_s + self._rng.uniform(0, self.jitter_s),
+                    self._rng.random() < self.failure_rate,
+                    self._rng.random() < self.garbage_rate)
+
+    def _cached_chars(self, prompt):
+        h = hashlib.blake2b(digest_size=16)
+        digests = []
+        for end in range(self.CACHE_BLOCK_CHARS, len(prompt) + 1, self.CACHE_BLOCK_CHARS):
+            h.update(prompt[end - self.CACHE_BLOCK_CHARS:end].encode("utf-8"))
+            digests.append((end, h.copy().digest()))
+        cached = 0
+        with self._lock:
+            for end, d in digests:
+                if d in self._prefixes:
+                    self._prefixes.move_to_end(d)
+                    if end >= self.CACHE_MIN_CHARS:
+                        cached = end
+                else:
+                    self._prefixes[d] = None
+            while len(self._prefixes) > self.CACHE_ENTRIES:
+                self._prefixes.popitem(last=False)
+        return cached
+
+    def _answer(self, prompt, garbage):
+        text = "Explanation: injected malformed output." if garbage else fake_completion(prompt)
+        return LLMResponse(text=text, input_tokens=len(prompt) // 4, output_tokens=len(text) // 4,
+                           total_tokens=len(prompt) // 4 + len(text) // 4,
+                           cached_tokens=self._cached_chars(prompt) // 4)
+
+    def complete(self, model, prompt, opts):
+        delay, fail, garbage = self._draw()
+        if fail:
+            time.sleep(delay)
+            raise TransientLLMError("injected failure")
+        response = self._answer(prompt, garbage)
+        time.sleep(delay + response.output_tokens * self.output_token_s)
+        return response
+
+    async def acomplete(self, model, prompt, opts):
+        delay, fail, garbage = self._draw()
+        if fail:
+            await asyncio.sleep(delay)
+            raise TransientLLMError("injected failure")
+        response = self._answer(prompt, garbage)
+        await asyncio.sleep(delay + response.output_tokens * self.output_token_s)
+        return response
+
+    async def aclose(self):
+        pass
+
+
+BACKENDS = ("openai", "http", "fake")
+
+
+def backend_name():
+    return os.environ.get("LLM_BACKEND", "openai").strip().lower()
+
+
+def backend_from_env(timeout_s=60.0):
+    """
+    LLM_BACKEND=openai (OPENAI_API_KEY/OPENAI_BASE_URL/LLM_PROMPT_CACHE_KEY), http (LLM_HTTP_URL,
+    LLM_HTTP_MODEL, LLM_HTTP_API_KEY) or fake (LLM_FAKE_LATENCY_S,
+    LLM_FAKE_JITTER_S, LLM_FAKE_OUTPUT_TOKEN_S, LLM_FAKE_FAILURE_RATE,
+    LLM_FAKE_GARBAGE_RATE, LLM_FAKE_SEED).
+    """
+    name = backend_name()
+    env = os.environ.get
+    if name == "openai":
+        return OpenAIBackend(timeout_s=timeout_s, prompt_cache_key=env("LLM_PROMPT_CACHE_KEY"))
+    if name == "http":
+        return HTTPBackend(env("LLM_HTTP_URL", "http://127.0.0.1:8000/v1"), timeout_s=timeout_s,
+                           api_key=env("LLM_HTTP_API_KEY"), model=env("LLM_HTTP_MODEL"))
+    if name == "fake":
+        return FakeBackend(latency_s=float(env("LLM_FAKE_LATENCY_S", "0")),
+                           jitter_s=float(env("LLM_FAKE_JITTER_S", "0")),
+                           failure_rate=float(env("LLM_FAKE_FAILURE_RATE", "0")),
+                           garbage_rate=float(env("LLM_FAKE_GARBAGE_RATE", "0")),
+                           seed=int(env("LLM_FAKE_SEED", "0")),
+                           output_token_s=float(env("LLM_FAKE_OUTPUT_TOKEN_S", "0")))
+    raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,82 @@
+# llm_usage.py
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Attribution tags (request_id, device, ...) for LLM calls made in the current
+# context. Copied into asyncio tasks and asyncio.to_thread workers automatically.
+_cost_tags = contextvars.ContextVar("llm_cost_tags", default={})
+
+
+@contextmanager
+def cost_scope(**tags):
+    """Attribute every LLM call made inside the block to `tags` (nested scopes merge)."""
+    token = _cost_tags.set({**_cost_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _cost_tags.reset(token)
+
+
+def current_tags():
+    return dict(_cost_tags.get())
+
+
+class UsageMeter:
+    """Default GPTAgent usage hook: per-call events aggregated by request and device.
+
+    Each event (stage, model, latency, input/output tokens, attempts, tags) is
+    optionally appended to a JSONL log. `prices` maps a model to USD per million
+    (input, output[, cached input]) tokens; cached input defaults to the input
+    price. Models without a price are counted but not costed.
+    """
+
+    def __init__(self, path=None, prices=None):
+        self.path = path
+        self.prices = prices or {}
+        self._totals = {"request_id": {}, "device": {}, "model": {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """LLM_USAGE_LOG (JSONL path) and LLM_PRICES (JSON {model: [in, out, cached_in]} per 1M tokens)."""
+        prices = os.environ.get("LLM_PRICES")
+        return cls(path=os.environ.get("LLM_USAGE_LOG") or None,
+                   prices={m: tuple(p) for m, p in json.loads(prices).items()} if prices else None)
+
+    def cost(self, model, input_tokens, output_tokens, cached_tokens=0):
+        price = self.prices.get(model)
+        if price is None:
+            return 0.0
+        cached_price = price[2] if len(price) > 2 else price[0]
+        return ((input_tokens - cached_tokens) * price[0] + cached_tokens * cached_price
+                + output_tokens * price[1]) / 1e6
+
+    def __call__(self, event):
+        cached = event.get("cached_tokens", 0)
+        event = dict(event, cost_usd=self.cost(event["model"], event["input_tokens"], event["output_tokens"], cached))
+        with self._lock:
+            for dim, totals in self._totals.items():
+                key = event["model"] if dim == "model" else event["tags"].get(dim)
+                if key is None:
+                    continue
+                t = totals.setdefault(str(key), {"calls": 0, "failures": 0, "input_tokens": 0, "cached_tokens": 0,
+                                                 "output_tokens": 0, "latency_s": 0.0, "cost_usd": 0.0})
+                t["calls"] += 1
+                t["failures"] += 0 if event["ok"] else 1
+                t["input_tokens"] += event["input_tokens"]
+                t["cached_tokens"] += cached
+                t["output_tokens"] += event["output_tokens"]
+                t["latency_s"] += event["latency_s"]
+                t["cost_usd"] += event["cost_usd"]
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def summary(self, dim=None):
+        with self._lock:
+            if dim is not None:
+                return {k: dict(v) for k, v in self._totals[dim].items()}
+            return {d: {k: dict(v) for k, v in t.items()} for d, t in self._totals.items()}
@@ -353,4 +353,18 @@ Template: "Discharge pressure and Suction Pressure are elevated (~0.46, ~0.38) w
 Explanation: This template shows part of sensors of pressure drift up, and other remain low. So it is belong to Pressure Related.
 Route:(Pressure-related)
 Found: No
-"""
\ No newline at end of file
+"""
+ROUTE_BATCH_INSTRUCTIONS = """
+
+BATCH MODE:
+Below you are given SEVERAL templates, numbered [1], [2], ...
+Route EACH template independently against the SAME Error Tree, exactly as above
+(do not assume earlier templates in the batch have already been added).
+STRICT OUTPUT FORMAT: for every template, in order, its number on its own line
+followed by the usual three lines; nothing else:
+[<n>]
+Explanation: <show the reason in detail>
+Route: (<SEG1> -> <SEG2> -> ... )
+Found: YES | NO
+
+"""
@@ -0,0 +1,119 @@
+# processed_ledger.py
+import os
+import json
+import pandas as pd
+from .columns import DEVICE_COLUMNS
+
+
+class ProcessedLedger:
+    """Append-only record of contribution rows that have already been classified.
+
+    Rows are keyed by (device, ts); files without a device column use "" as the
+    device. Each classified row is appended (and flushed) as soon as its unit
+    commits to the tree, so the ledger doubles as a checkpoint: rerunning an
+    interrupted or re-uploaded CSV sends only unseen rows to the LLM stages.
+
+    Once a run's results reach the classified CSV, a {"written": [[device, ts],
+    ...]} line checkpoints exactly those rows. Entries not covered by one were
+    classified but never written; run(resume=True) emits them instead of
+    classifying them again.
+    """
+
+    DEVICE_COLUMNS = DEVICE_COLUMNS
+
+    def __init__(self, path="processed_rows.jsonl", fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._keys = set()
+        # key -> (classification, template) for rows not yet in the classified CSV
+        self._unwritten = {}
+        self._fh = None
+        self._load()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _device_column(self, df: pd.DataFrame):
+        for c in self.DEVICE_COLUMNS:
+            if c in df.columns:
+                return c
+        return None
+
+    @staticmethod
+    def key(device, ts):
+        return ("" if device is None or pd.isna(device) else str(device).strip(), str(ts).strip())
+
+    def keys_for(self, df: pd.DataFrame):
+        """(device, ts) key of every row of `df`, in order."""
+        dev_col = self._device_column(df)
+        devices = df[dev_col].tolist() if dev_col else [None] * len(df)
+        return [self.key(d, t) for d, t in zip(devices, df["ts"].tolist())]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final write from an interrupted run.
+                    break
+                if "written" in entry:
+                    for device, ts in entry["written"]:
+                        self._unwritten.pop((device, ts), None)
+                    continue
+                if entry.get("checkpoint"):
+                    # Global checkpoint written by older versions.
+                    self._unwritten = {}
+                    continue
+                k = (entry["device"], entry["ts"])
+                self._keys.add(k)
+                self._unwritten[k] = (entry.get("classification", ""), entry.get("template", ""))
+
+    def seen_mask(self, df: pd.DataFrame):
+        """Boolean list: True for rows of `df` already in the ledger."""
+        return [k in self._keys for k in self.keys_for(df)]
+
+    def unwritten(self):
+        return dict(self._unwritten)
+
+    def _append(self, entries):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fh = open(self.path, "a", encoding="utf-8")
+        for entry in entries:
+            self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+
+    def record(self, keys, classification, template):
+        """Mark rows (by key) as classified; written through immediately."""
+        entries = []
+        for device, ts in keys:
+            self._keys.add((device, ts))
+            self._unwritten[(device, ts)] = (classification, template)
+            entries.append({"device": device, "ts": ts, "classification": classification, "template": template})
+        if entries:
+            self._append(entries)
+
+    def mark_written(self, keys):
+        """The rows with these keys reached the classified CSV.
+
+        Only these keys are checkpointed: rows another (crashed) run recorded
+        but never wrote stay pending until a run covering them emits them.
+        """
+        written = [list(k) for k in keys if k in self._unwritten]
+        if written:
+            self._append([{"written": written}])
+            for device, ts in written:
+                del self._unwritten[(device, ts)]
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
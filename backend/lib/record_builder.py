@@ -1,76 +1,137 @@
 # record_builder.py
-import pandas as pd
+import os
+import re
+import json
 import math
+import numpy as np
+import pandas as pd
+
+# Ordered sensor -> domain rules: (domain, substrings anywhere in the name, name prefixes).
+# The first matching rule wins; names matching none are "Other" and ignored. Add a
+# domain by appending a rule, e.g. ("Pressure", ("pressure",), ("p_", "press", "pch", "pres")).
+DEFAULT_DOMAIN_RULES = (
+    ("Temperature", ("temperature",), ("t_", "temp", "tch", "temp_")),
+    ("Voltage", ("voltage",), ("v_ch", "v_", "volt", "vch")),
+)
+
+
+class DomainTaxonomy:
+    """Sensor-name classifier compiled once from a rule table (one regex per domain)."""
+
+    def __init__(self, rules=DEFAULT_DOMAIN_RULES):
+        self.domains = [r[0] for r in rules]
+        self._patterns = []
+        for domain, contains, prefixes in rules:
+            alts = [re.escape(c) for c in contains] + ["^" + re.escape(p) for p in prefixes]
+            self._patterns.append((domain, re.compile("|".join(alts)) if alts else None))
+        self._cache = {}
+
+    @classmethod
+    def from_json(cls, path):
+        """Rules from a JSON list of {"domain", "contains", "prefixes"} objects."""
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+        return cls([(r["domain"], tuple(r.get("contains", ())), tuple(r.get("prefixes", ()))) for r in rules])
+
+    def domain_of(self, name: str) -> str:
+        s = name.lower()
+        for domain, pattern in self._patterns:
+            if pattern is not None and pattern.search(s):
+                return domain
+        return "Other"
+
+    def layout(self, sensors):
+        """Per-domain column indices for a sensor list (memoized per column set)."""
+        key = tuple(sensors)
+        if key not in self._cache:
+            by_domain = {d: [] for d in self.domains}
+            for i, s in enumerate(sensors):
+                d = self.domain_of(s)
+                if d in by_domain:
+                    by_domain[d].append(i)
+            self._cache[key] = {d: np.asarray(ix, dtype=np.intp) for d, ix in by_domain.items()}
+        return self._cache[key]
+
+
+_DEFAULT_TAXONOMY = DomainTaxonomy()
+
 
 class RecordBuilder:
     """Builds per-row JSON records from CSV contribution data."""
 
+    def __init__(self, taxonomy: DomainTaxonomy = None):
+        self.taxonomy = taxonomy or _DEFAULT_TAXONOMY
+
+    @classmethod
+    def from_env(cls):
+        """Domain rules from the JSON file in ANOMALY_DOMAIN_RULES, else the defaults."""
+        path = os.environ.get("ANOMALY_DOMAIN_RULES")
+        return cls(DomainTaxonomy.from_json(path) if path else None)
+
     @staticmethod
     def sensor_domain(name: str) -> str:
-        s = name.lower()
-        if ("temperature" in s) or s.startswith(("t_", "temp", "tch", "temp_")):
-            return "Temperature"
-        # if ("pressure" in s) or s.startswith(("p_", "press", "pch", "pres")):
-        #     return "Pressure"
-        if ("voltage" in s) or s.startswith(("v_ch", "v_", "volt", "vch")):
-            return "Voltage"
+        return _DEFAULT_TAXONOMY.domain_of(name)
 
-        return "Other"
+    def domain_scores(self, values: np.ndarray, layout):
+        """
+        (n_rows, n_domains) matrix of per-domain scores: the sum of each domain's
+        top-k contributions divided by sqrt(k), where k is one more than the
+        smallest domain's sensor count. Domains without sensors score 0.
+        """
+        domain_types = self.taxonomy.domains
+        counts = [len(layout[d]) for d in domain_types]
+        top_k = min(counts) + 1 if counts else 1
+        scores = np.zeros((values.shape[0], len(domain_types)), dtype=float)
+        for j, d in enumerate(domain_types):
+            idx = layout[d]
+            m = len(idx)
+            if m == 0:
+                continue
+            k = min(top_k, m)
+            block = values[:, idx]
+            if k < m:
+                part = np.argpartition(block, m - k, axis=1)[:, m - k:]
+                block = np.take_along_axis(block, part, axis=1)
+            # Add in descending order, left to right, exactly like the scalar sum(sorted(...)[:k]).
+            top = -np.sort(-block, axis=1)
+            scores[:, j] = np.add.accumulate(top, axis=1)[:, -1] / math.sqrt(top_k)
+        return scores
 
     def build_records_from_csv(self, df: pd.DataFrame):
-        sensors = [
-            c.removeprefix("contribution_")
-            for c in df.columns
-            if c.startswith("contribution_")
-        ]
-        domain_types = ["Temperature", "Voltage"]
-        sensor_to_domain = {s: self.sensor_domain(s) for s in sensors}
+        cols = [c for c in df.columns if c.startswith("contribution_")]
+        sensors = [c.removeprefix("contribution_") for c in cols]
+        domain_types = self.taxonomy.domains
+        layout = self.taxonomy.layout(sensors)
+        values = df[cols].to_numpy(dtype=float) if cols else np.zeros((len(df), 0))
+
+        scores = self.domain_scores(values, layout)
+        # Stable descending sort keeps the rule-table order for ties, as sorted() did.
+        order = np.argsort(-scores, axis=1, kind="stable")
+        ranked = np.take_along_axis(scores, order, axis=1)
+        if len(domain_types) >= 2:
+            first, second = ranked[:, 0], ranked[:, 1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratios = np.where(first > 0, second / np.where(first > 0, first, 1.0), 0.0)
+            cross = (first > 0) & (ratios >= 0.95)
+        else:
+            ratios = np.zeros(len(df))
+            cross = np.zeros(len(df), dtype=bool)
 
+        # Python-object assembly is the only per-row work left.
+        present = [(d, [sensors[i] for i in layout[d]], layout[d].tolist()) for d in domain_types if len(layout[d])]
+        rows = values.tolist()
+        order_l, ranked_l = order.tolist(), ranked.tolist()
+        ratios_l, cross_l = ratios.tolist(), cross.tolist()
         records = []
-        counts = {d: 0 for d in domain_types}
-        for s in sensors:
-            d = sensor_to_domain[s]
-            if d in counts:
-                counts[d] += 1
-        sensors_countMin = min(counts.values())
-        top_k = sensors_countMin + 1
-
-        for i in range(len(df)):
-            row = df.iloc[i]
-            per_sensor = {s: float(row[f"contribution_{s}"]) for s in sensors}
-            by_dom = {d: [] for d in domain_types}
-            for s in sensors:
-                d = sensor_to_domain[s]
-                v = per_sensor[s]
-                if d in by_dom:
-                    by_dom[d].append({"name": s, "value": v})
-            domains_info = [{"name": d, "sensors": by_dom[d]} for d in domain_types if by_dom[d]]
-  
-
-   
-            domain_scores = {}
-            for d, sensors_list in by_dom.items():
-                if not sensors_list:
-                    continue
-                sorted_vals = sorted([x["value"] for x in sensors_list], reverse=True)
-    
-                k = min(top_k, len(sorted_vals))
-                domain_scores[d] = sum(sorted_vals[:k]) / math.sqrt(top_k)
-
-            ranking = sorted(
-                [{"name": d, "score": float(domain_scores.get(d, 0.0))} for d in domain_types],
-                key=lambda x: x["score"], reverse=True,
-            )
-
-            if len(ranking) >= 2 and ranking[0]["score"] > 0:
-                ratio = ranking[1]["score"] / ranking[0]["score"]
-                cross_domain = ratio >= 0.95
-            else:
-                ratio = 0.0
-                cross_domain = False
-            records.append({    
+        for r, row in enumerate(rows):
+            domains_info = [
+                {"name": d, "sensors": [{"name": s, "value": row[i]} for s, i in zip(names, idx)]}
+                for d, names, idx in present
+            ]
+            ranking = [{"name": domain_types[j], "score": sc} for j, sc in zip(order_l[r], ranked_l[r])]
+            records.append({
                 "domains": domains_info,
                 "ranking": ranking,
-                "ratio_2_over_1": ratio,
-                "cross_domain_close": cross_domain})  
+                "ratio_2_over_1": ratios_l[r],
+                "cross_domain_close": cross_l[r]})
         return records
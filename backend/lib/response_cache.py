@@ -0,0 +1,146 @@
+# response_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of LLM responses (SQLite, WAL mode).
+
+    Keys are the SHA-256 of (model, options, prompt), so identical requests at
+    temperature 0 are only paid for once across reruns and retries. Each thread
+    uses its own connection; WAL plus a busy timeout makes the file safe to
+    share between worker threads and processes.
+
+    Eviction drops entries older than `max_age_s` and, when the stored payload
+    exceeds `max_bytes`, the least recently used entries first.
+    """
+
+    def __init__(self, path="llm_response_cache.sqlite", max_bytes: int = 256 * 1024 * 1024,
+                 max_age_s: float = 30 * 24 * 3600, bypass: bool = False, evict_every: int = 200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.bypass = bypass
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from LLM_CACHE_PATH / LLM_CACHE_MAX_MB / LLM_CACHE_MAX_AGE_DAYS / LLM_CACHE_BYPASS."""
+        return cls(
+            path=os.environ.get("LLM_CACHE_PATH", "llm_response_cache.sqlite"),
+            max_bytes=int(float(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            max_age_s=float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            bypass=os.environ.get("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes"),
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model, opts, prompt) -> str:
+        blob = json.dumps({"model": model, "opts": opts, "prompt": prompt},
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.bypass:
+            return None
+        conn = self._conn()
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age_s and now - row[1] > self.max_age_s):
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+        with self._stats_lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, response: str, model: str = None):
+        if self.bypass:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, len(response.encode("utf-8")), now, now),
+        )
+        conn.commit()
+        with self._stats_lock:
+            self.writes += 1
+            due = self.writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        conn.commit()
+
+    def evict(self):
+        """Apply age- and size-based eviction; returns the number of rows removed."""
+        conn = self._conn()
+        removed = 0
+        if self.max_age_s:
+            cur = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_s,))
+            removed += cur.rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes and total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                stale.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            removed += len(stale)
+        conn.commit()
+        with self._stats_lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self):
+        conn = self._conn()
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+                "bypass": self.bypass,
+            }
@@ -0,0 +1,81 @@
+# route_batcher.py
+import asyncio
+from .llm_usage import cost_scope, current_tags
+
+
+class RouteBatcher:
+    """Coalesces concurrent route requests into one LLM call per batch.
+
+    Requests queue until `batch_size` are waiting or `linger_s` has passed
+    since the first one; the batch is then routed in a single call against
+    one tree snapshot. Every result carries that snapshot's structure_seq, so
+    the commit stage re-routes (individually) exactly the items whose part of
+    the tree changed under them, i.e. those behind an earlier mutation.
+    Items the batched answer leaves out or garbles are routed one by one.
+    """
+
+    def __init__(self, builder, batch_size, linger_s=0.05):
+        self.builder = builder
+        self.batch_size = batch_size
+        self.linger_s = linger_s
+        self._pending = []  # (template, tags, future)
+        self._timer = None
+        self._inflight = set()
+        self.stats = {"batches": 0, "batched_items": 0, "fallbacks": 0}
+
+    async def route(self, template):
+        """(route_str, path_found, structure_seq) for `template`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((template, current_tags(), future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch):
+        builder = self.builder
+        snap = builder.tree_manager.current()
+        templates = [t for t, _, _ in batch]
+        # One call serves several devices; attribute it to all of them.
+        devices = sorted({str(tags["device"]) for _, tags, _ in batch if tags.get("device") is not None})
+        try:
+            with cost_scope(device=",".join(devices) or None):
+                if len(batch) == 1:
+                    routes = [await builder.aroute_from_llm(snap.root, templates[0])]
+                else:
+                    routes = await builder.aroute_batch_from_llm(snap.root, templates)
+                    self.stats["batches"] += 1
+                    self.stats["batched_items"] += sum(r is not None for r in routes)
+                missing = [i for i, r in enumerate(routes) if r is None]
+                if missing:
+                    self.stats["fallbacks"] += len(missing)
+                    redone = await asyncio.gather(*(builder.aroute_from_llm(snap.root, templates[i])
+                                                    for i in missing))
+                    for i, r in zip(missing, redone):
+                        routes[i] = r
+            for (_, _, future), (route_str, path_found) in zip(batch, routes):
+                if not future.done():
+                    future.set_result((route_str, path_found, snap.structure_seq))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in list(self._inflight):
+            task.cancel()
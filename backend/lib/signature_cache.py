@@ -0,0 +1,143 @@
+# signature_cache.py
+import os
+import json
+import math
+import threading
+
+
+class SignatureCache:
+    """Persistent quantized-signature -> (template, tree path) cache.
+
+    Records built by RecordBuilder are reduced to a signature made of the domain
+    ranking, the sensors at or above `active_threshold` and their bucketed
+    contribution levels. A record whose signature was seen before reuses the
+    earlier template and classification without any LLM call.
+
+    Entries are validated against the live tree on lookup: if the cached path no
+    longer resolves to a leaf (the leaf was split by vertical expansion, or the
+    branch moved), the entry is dropped and the record takes the LLM path.
+    """
+
+    def __init__(self, path="signature_cache.json", bucket_size: float = 0.25,
+                 active_threshold: float = 0.5, max_entries: int = 50000):
+        self.path = path
+        self.bucket_size = bucket_size
+        self.active_threshold = active_threshold
+        self.max_entries = max_entries
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self.load()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.miss_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[signature-cache] ignoring unreadable cache {self.path}: {e}")
+                self.entries = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _bucket(self, value: float) -> int:
+        return int(math.floor(float(value) / self.bucket_size))
+
+    def signature(self, record) -> str:
+        ranking = [d["name"] for d in record.get("ranking", []) if d.get("score", 0.0) > 0]
+        parts = ["rank=" + ">".join(ranking), f"cross={int(bool(record.get('cross_domain_close')))}"]
+        for dom in sorted(record.get("domains", []), key=lambda d: d["name"]):
+            active = sorted(
+                (s for s in dom["sensors"] if s["value"] >= self.active_threshold),
+                key=lambda s: (-s["value"], s["name"]),
+            )
+            levels = ",".join(f"{s['name']}:{self._bucket(s['value'])}" for s in active)
+            parts.append(f"{dom['name']}[{levels}]")
+        return "|".join(parts)
+
+    @staticmethod
+    def _resolve_leaf(tree, path):
+        node = tree
+        for seg in path:
+            node = node.children.get(seg)
+            if node is None:
+                return None
+        return node if (path and node.is_leaf()) else None
+
+    def contains(self, record) -> bool:
+        """Cheap pre-check (no validation, no stats) used when planning LLM work."""
+        with self._lock:
+            return self.signature(record) in self.entries
+
+    def lookup(self, record, tree):
+        """Return (entry, leaf_node) on a valid hit, else None."""
+        key = self.signature(record)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            leaf = self._resolve_leaf(tree, entry["path"])
+            if leaf is None:
+                # Path was split or moved since this entry was written.
+                del self.entries[key]
+                self.invalidated += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry, leaf
+
+    def store(self, record, template, path):
+        if not path:
+            return
+        with self._lock:
+            self.entries[self.signature(record)] = {"template": template, "path": list(path)}
+            # Oldest entries go first (dicts keep insertion order).
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+    def invalidate_path(self, path_prefix):
+        """Drop every entry pointing at or below `path_prefix`."""
+        prefix = list(path_prefix)
+        with self._lock:
+            stale = [k for k, v in self.entries.items() if v["path"][:len(prefix)] == prefix]
+            for k in stale:
+                del self.entries[k]
+            self.invalidated += len(stale)
+
+    def record_latency(self, seconds: float, hit: bool):
+        if hit:
+            self.hit_seconds += seconds
+        else:
+            self.miss_seconds += seconds
+
+    def report(self):
+        lookups = self.hits + self.misses
+        avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+        avg_hit = self.hit_seconds / self.hits if self.hits else 0.0
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "invalidated": self.invalidated,
+            "avg_miss_latency_s": round(avg_miss, 4),
+            "avg_hit_latency_s": round(avg_hit, 4),
+            "estimated_latency_saved_s": round(self.hits * max(0.0, avg_miss - avg_hit), 3),
+            "entries": len(self.entries),
+        }
@@ -0,0 +1,175 @@
+# similarity_index.py
+import re
+import zlib
+import random
+import threading
+
+_VALUE_RE = re.compile(r"~\s*\d+(?:\.\d+)?%?")
+_SPACE_RE = re.compile(r"\s+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class SimilarityIndex:
+    """Local nearest-neighbour index over stored templates (no network model).
+
+    Templates are normalized (lower-cased, "~0.83"-style values masked) and cut
+    into character shingles. MinHash signatures split into LSH bands give the
+    candidate set; candidates are then scored by exact shingle Jaccard.
+
+    route() returns a path only when the best match clears `threshold` and beats
+    the best match on any *other* path by `margin`; otherwise the caller falls
+    back to route_from_llm(). Skip rate and agreement with the LLM's choice on
+    the fallback path are tracked in stats(). Index updates and lookups are
+    serialized by an internal lock, so peek() is safe from routing workers while
+    the writer adds templates.
+    """
+
+    def __init__(self, threshold: float = 0.9, margin: float = 0.05, shingle_size: int = 5,
+                 num_perm: int = 64, bands: int = 16, seed: int = 7):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.margin = margin
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+        self._lock = threading.RLock()
+        self.clear()
+        self.reset_stats()
+
+    def clear(self):
+        self._entries = {}   # normalized text -> (shingles, path tuple)
+        self._buckets = {}   # (band, band hash) -> set of normalized texts
+
+    def reset_stats(self):
+        self.lookups = 0
+        self.skips = 0
+        self.fallbacks = 0
+        self.agreements = 0
+        self.disagreements = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _normalize(self, text: str) -> str:
+        text = _VALUE_RE.sub("~#", (text or "").lower())
+        return _SPACE_RE.sub(" ", text).strip()
+
+    def _shingles(self, norm: str) -> frozenset:
+        k = self.shingle_size
+        if len(norm) <= k:
+            return frozenset([zlib.crc32(norm.encode("utf-8"))])
+        return frozenset(zlib.crc32(norm[i:i + k].encode("utf-8")) for i in range(len(norm) - k + 1))
+
+    def _band_keys(self, shingles):
+        sig = [min((a * h + b) % _MERSENNE_PRIME for h in shingles) for a, b in self._perms]
+        return [(i, hash(tuple(sig[i * self.rows:(i + 1) * self.rows]))) for i in range(self.bands)]
+
+    def add(self, template: str, path):
+        if not path:
+            return
+        norm = self._normalize(template)
+        path = tuple(path)
+        with self._lock:
+            if norm in self._entries:
+                # Same normalized text: remember its latest location.
+                self._entries[norm] = (self._entries[norm][0], path)
+                return
+            shingles = self._shingles(norm)
+            self._entries[norm] = (shingles, path)
+            for key in self._band_keys(shingles):
+                self._buckets.setdefault(key, set()).add(norm)
+
+    def rebuild(self, tree):
+        """Re-index every leaf of `tree` (used at startup and after a leaf split)."""
+        def walk(node, path):
+            if node.is_leaf():
+                if path:
+                    for t in node.templates:
+                        self.add(t, path)
+                return
+            for name, child in node.children.items():
+                walk(child, path + [name])
+
+        with self._lock:
+            self.clear()
+            walk(tree, [])
+
+    def query(self, template: str):
+        """Return (best_path, best_score, best_other_path_score), or None if no candidate."""
+        norm = self._normalize(template)
+        shingles = self._shingles(norm)
+        keys = self._band_keys(shingles)
+        with self._lock:
+            candidates = set()
+            for key in keys:
+                candidates |= self._buckets.get(key, set())
+            entries = [self._entries[cand] for cand in candidates]
+        if not candidates:
+            return None
+        per_path = {}
+        for cand_shingles, path in entries:
+            union = len(shingles | cand_shingles)
+            score = len(shingles & cand_shingles) / union if union else 0.0
+            if score > per_path.get(path, -1.0):
+                per_path[path] = score
+        ranked = sorted(per_path.items(), key=lambda kv: kv[1], reverse=True)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return list(ranked[0][0]), ranked[0][1], runner_up
+
+    @staticmethod
+    def _leaf_exists(tree, path):
+        node = tree
+        for seg in path:
+            node = node.children.get(seg)
+            if node is None:
+                return False
+        return node.is_leaf()
+
+    def route(self, template: str, tree):
+        """
+        Confident route for `template`, or None when the caller should ask the LLM.
+        Returns (path, guess) where exactly one is not None: `guess` is the best
+        non-confident candidate, kept to measure agreement with the LLM.
+        """
+        self.lookups += 1
+        found = self.query(template)
+        if self._confident(found, tree):
+            self.skips += 1
+            return found[0], None
+        self.fallbacks += 1
+        return None, (found[0] if found is not None else None)
+
+    def _confident(self, found, tree):
+        if found is None:
+            return False
+        path, score, runner_up = found
+        return score >= self.threshold and score - runner_up >= self.margin and self._leaf_exists(tree, path)
+
+    def peek(self, template: str, tree):
+        """Whether route() would currently answer without the LLM (no stats recorded)."""
+        return self._confident(self.query(template), tree)
+
+    def record_llm_route(self, guess, llm_path):
+        """Compare the index's best guess with where the LLM actually filed the template."""
+        if guess is None:
+            return
+        if list(guess) == list(llm_path):
+            self.agreements += 1
+        else:
+            self.disagreements += 1
+
+    def stats(self):
+        compared = self.agreements + self.disagreements
+        return {
+            "indexed": len(self._entries),
+            "lookups": self.lookups,
+            "llm_skipped": self.skips,
+            "skip_rate": (self.skips / self.lookups) if self.lookups else 0.0,
+            "llm_fallbacks": self.fallbacks,
+            "agreement_rate": (self.agreements / compared) if compared else None,
+            "compared": compared,
+        }
@@ -0,0 +1,119 @@
+# template_renderer.py
+"""
+Deterministic, LLM-free rendering of contribution templates.
+
+Follows the rules of Contribution_Score_Analysis_Prompt mechanically:
+sensors sorted by value, 0.50 activity threshold, values rounded to two
+decimals with a "~" prefix, and near-tie phrasing (with S2/S1 percentage)
+when the record is flagged cross_domain_close.
+"""
+
+import re
+
+ACTIVE_THRESHOLD = 0.50
+# Sensors listed when no sensor of a domain reaches the threshold.
+FALLBACK_TOP_N = 3
+# Sensors listed per domain in the cross-domain sentence.
+CROSS_DOMAIN_TOP_N = 3
+
+# Format contract from the prompt: one sentence, ends with ".", numbers as "~d.dd".
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_FORMATTED_NUMBER_RE = re.compile(r"~\d+\.\d{2}\b")
+
+
+def _fmt(value):
+    return f"~{float(value):.2f}"
+
+
+def _join_names(names):
+    if len(names) == 1:
+        return names[0]
+    if len(names) == 2:
+        return f"{names[0]} and {names[1]}"
+    return ", ".join(names[:-1]) + f", and {names[-1]}"
+
+
+def _sorted_sensors(record, domain):
+    for d in record.get("domains", []):
+        if d["name"] == domain:
+            return sorted(d["sensors"], key=lambda s: (-float(s["value"]), s["name"]))
+    return []
+
+
+def _characteristic(sensors, top_n):
+    """Sensors ≥ threshold, else the top few that best characterize the pattern."""
+    active = [s for s in sensors if float(s["value"]) >= ACTIVE_THRESHOLD]
+    return (active, True) if active else (sensors[:top_n], False)
+
+
+def _single_domain(record, domain):
+    sensors = _sorted_sensors(record, domain)
+    if not sensors:
+        return f"No {domain} sensor shows a notable contribution."
+    listed, is_active = _characteristic(sensors, FALLBACK_TOP_N)
+    others = sensors[len(listed):]
+    names = [s["name"] for s in listed]
+    values = ", ".join(_fmt(s["value"]) for s in listed)
+
+    if not is_active:
+        return (f"{domain} sensors {_join_names(names)} show only modest contributions ({values}) "
+                f"with none reaching ~0.50.")
+    if not others:
+        if len(listed) == 1:
+            return f"{names[0]} is elevated (contribution {values}) as the only {domain} sensor."
+        return f"All {domain} sensors {_join_names(names)} are elevated together ({values})."
+    rest = _fmt(others[0]["value"])
+    if len(listed) == 1:
+        return (f"{names[0]} jumps sharply (contribution {values}) while other {domain} sensors "
+                f"stay near baseline ({rest}).")
+    return f"{_join_names(names)} are elevated ({values}) while others remain low ({rest})."
+
+
+def _brace_list(sensors):
+    return "{" + ", ".join(f"{s['name']}({_fmt(s['value'])})" for s in sensors) + "}"
+
+
+def _cross_domain(record, d1, d2):
+    pct = round(float(record.get("ratio_2_over_1", 0.0)) * 100)
+    s1, _ = _characteristic(_sorted_sensors(record, d1), CROSS_DOMAIN_TOP_N)
+    s2, _ = _characteristic(_sorted_sensors(record, d2), CROSS_DOMAIN_TOP_N)
+    return (f"{d1} and {d2} are Cross Domain. Total contribution scores for {d1} and {d2} are "
+            f"nearly tied (S2/S1 ~ {pct}%); {d1} {_brace_list(s1[:CROSS_DOMAIN_TOP_N])} "
+            f"vs {d2} {_brace_list(s2[:CROSS_DOMAIN_TOP_N])}.")
+
+
+def render_template(record) -> str:
+    """Render the one-sentence template for a RecordBuilder record."""
+    ranking = record.get("ranking", [])
+    if not ranking:
+        return "No domain shows a notable contribution."
+    if record.get("cross_domain_close") and len(ranking) >= 2:
+        return _cross_domain(record, ranking[0]["name"], ranking[1]["name"])
+    return _single_domain(record, ranking[0]["name"])
+
+
+def check_template_format(template: str) -> list:
+    """Return a list of format-contract violations (empty when compliant)."""
+    problems = []
+    if not template or not template.strip():
+        return ["empty template"]
+    if "\n" in template:
+        problems.append("template spans multiple lines")
+    if not template.endswith("."):
+        problems.append("template does not end with '.'")
+    if '"' in template:
+        problems.append("template contains a double quote")
+    # Every decimal value must be "~" prefixed with exactly two decimals;
+    # the only bare number allowed is the near-tie percentage.
+    for m in _NUMBER_RE.finditer(template):
+        start = m.start()
+        if template[start - 1:start] == "~" and _FORMATTED_NUMBER_RE.match(template, start - 1):
+            continue
+        if template[m.end():m.end() + 1] == "%":
+            continue
+        if not ("." in m.group(0)) and re.search(r"[A-Za-z_]$", template[:start]):
+            # Digits that are part of a sensor name such as v_ch2.
+            continue
+        problems.append(f"unformatted number '{m.group(0)}' at {start}")
+    return problems
+
@@ -3,118 +3,509 @@ import os
 import re
 import json
 import shutil
+import threading
+from contextlib import contextmanager
 from typing import Dict
-from .tree_node import TreeNode
+from .tree_node import TreeNode, in_time_order, ts_filename
+from .tree_snapshot import TreeSnapshot
+from .exemplars import select_diverse
+from .gpt_agent import OutputRejected
 
 class TemplateTreeManager:
-    """Handles tree creation, structure traversal, and LLM-driven expansions."""
+    """Handles tree creation, structure traversal, and LLM-driven expansions.
 
-    def __init__(self, base_path="templates_storage", reset: bool = False):
+    The tree lives in memory with a template -> path index. Every mutation is
+    appended to `tree_journal.jsonl` under `base_path`; every `snapshot_every`
+    operations the tree is compacted into `tree_snapshot.json` and the journal
+    restarts. The original one-folder-per-node / one-.txt-per-template layout
+    remains available through import_folders() / export_folders(), and a legacy
+    layout found in `base_path` is imported automatically on first load.
+
+    Writers mutate the live tree under a lock and, when the outermost
+    transaction() ends, publish an immutable TreeSnapshot that shares every
+    unchanged subtree with the previous one. Readers take current() and never
+    lock; routes computed on a snapshot are validated with route_is_stale()
+    before they are applied.
+    """
+
+    SNAPSHOT_FILE = "tree_snapshot.json"
+    JOURNAL_FILE = "tree_journal.jsonl"
+    # Placed ahead of every "Error Tree:" section (fixed text, so it stays in the cached prefix).
+    PROMPT_TREE_NOTE = ('Leaves of the Error Tree list example templates. A leaf shown as '
+                        '{"exemplars": [...], "more": "N"} holds N more templates that are not listed; '
+                        '"exemplars" and "more" are not categories.\n\n')
+
+    def __init__(self, base_path="templates_storage", reset: bool = False, prompt_exemplars: int = 3,
+                 leaf_exemplars: int = 8, snapshot_every: int = 500, fsync: bool = False):
         self.base_path = base_path
+        # Max templates shown per leaf in routing/expansion prompts.
+        self.prompt_exemplars = prompt_exemplars
+        # Size of each leaf's exemplar set, used as List 1 when deciding splits.
+        self.leaf_exemplars = leaf_exemplars
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(base_path, self.SNAPSHOT_FILE)
+        self.journal_path = os.path.join(base_path, self.JOURNAL_FILE)
+        self._lock = threading.RLock()
+        self._journal = None
+        self._seq = 0
+        self._ops_since_snapshot = 0
+        # template text -> path tuple of the leaf it was (last) filed under
+        self._template_index = {}
+        # out_path -> tree version last written there.
+        self._exported = {}
+        # Bumped whenever a node is created or a leaf is split.
+        self._structure_seq = 0
+        self._tx_depth = 0
         if reset and os.path.exists(base_path):
             shutil.rmtree(base_path)
         os.makedirs(base_path, exist_ok=True)
-        self.tree = self._load_tree_from_fs(base_path)
-
-    def _load_tree_from_fs(self, base_path: str) -> TreeNode:
-        root = TreeNode("root", folder_path=base_path)
-        self._load_children(root)
-        return root
-
-    def _load_children(self, node: TreeNode) -> None:
-        if not node.folder_path or not os.path.isdir(node.folder_path):
-            return
-        node.update_templates()
-        for name in sorted(os.listdir(node.folder_path)):
-            p = os.path.join(node.folder_path, name)
+        self.tree = self._load()
+        self._published = None
+        self._publish()
+        # Callbacks invoked with the path of a leaf that vertical expansion just split
+        # (also used by TreeCompactor after merging or collapsing nodes).
+        self.split_listeners = []
+
+    # ------------------------------------------------------------------ storage
+
+    def _new_node(self, name, path):
+        return TreeNode(name, path=path, max_exemplars=self.leaf_exemplars)
+
+    def _load(self) -> TreeNode:
+        has_store = os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+        if not has_store and self._has_folder_layout(self.base_path):
+            print(f"[tree] importing legacy folder layout from {self.base_path}")
+            self.tree = self._read_folders(self.base_path)
+            self._reindex()
+            self.snapshot()
+            return self.tree
+
+        root = self._new_node("root", ())
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            root = TreeNode.from_dict(snap["tree"], max_exemplars=self.leaf_exemplars)
+            self._seq = snap.get("seq", 0)
+        self.tree = root
+        self._reindex()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final write from a crash; everything before it is intact.
+                        print(f"[tree] ignoring truncated journal line in {self.journal_path}")
+                        break
+                    if op.get("seq", 0) <= self._seq:
+                        continue
+                    self._apply(op)
+                    self._seq = op["seq"]
+                    self._ops_since_snapshot += 1
+        return self.tree
+
+    @staticmethod
+    def _has_folder_layout(path):
+        return os.path.isdir(path) and any(
+            os.path.isdir(os.path.join(path, e)) for e in os.listdir(path)
+        )
+
+    def _reindex(self):
+        self._template_index = {}
+
+        def walk(node):
+            for t in node.templates:
+                self._template_index[t] = node.path
+            for child in node.children.values():
+                walk(child)
+        walk(self.tree)
+
+    def _journal_append(self, op):
+        self._seq += 1
+        op["seq"] = self._seq
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(op, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._ops_since_snapshot += 1
+        if self.snapshot_every and self._ops_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Compact the journal: write the whole tree atomically, then restart the journal."""
+        with self._lock:
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "seq": self._seq, "tree": self.tree.to_dict()},
+                          f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            # Ops up to self._seq are in the snapshot; replay skips them even if this truncation is lost.
+            open(self.journal_path, "w", encoding="utf-8").close()
+            self._ops_since_snapshot = 0
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _apply(self, op):
+        """Replay one journal operation against the in-memory tree."""
+        kind = op["op"]
+        if kind == "add":
+            self._add(self._require(op["path"]), op["template"], op["ts"])
+        elif kind == "mkdir":
+            self._mkdir(self._require(op["path"]), op["name"])
+        elif kind == "split":
+            self._split(self._require(op["path"]), *op["names"])
+        elif kind == "archive":
+            self._archive(self._require(op["path"]), op["indices"])
+        elif kind == "merge":
+            self._merge(self._require(op["path"]), op["src"], op["dst"])
+        elif kind == "collapse":
+            self._collapse(self._require(op["path"]))
+        else:
+            raise ValueError(f"Unknown journal op '{kind}'")
+
+    def _require(self, path):
+        node = self.node_at(path)
+        if node is None:
+            raise KeyError(f"Journal references missing node {'/'.join(path)}")
+        return node
+
+    # ------------------------------------------------------------- mutations
+
+    @property
+    def version(self):
+        """Monotonic tree version (the journal sequence number; survives restarts)."""
+        return self._seq
+
+    def _touch(self, node):
+        """Mark `node` and its ancestors dirty so the next publish re-freezes them."""
+        cur = self.tree
+        cur.frozen = None
+        for seg in node.path:
+            cur = cur.children.get(seg)
+            if cur is None:
+                break
+            cur.frozen = None
+
+    def _publish(self):
+        # A single reference assignment: readers see the old or the new version, never a mix.
+        self._published = TreeSnapshot(self.version, self._structure_seq, self.tree.freeze())
+
+    @contextmanager
+    def transaction(self):
+        """Group mutations so readers only see the tree once all of them are applied."""
+        with self._lock:
+            self._tx_depth += 1
+            try:
+                yield self
+            finally:
+                self._tx_depth -= 1
+                if self._tx_depth == 0:
+                    self._publish()
+
+    def current(self) -> TreeSnapshot:
+        """Latest published snapshot (lock-free)."""
+        return self._published
+
+    def route_is_stale(self, route_parts, path_found, structure_seq):
+        """
+        True if a route computed on a snapshot with `structure_seq` may no longer
+        hold: for a found path, any node on it was created or split since; for a
+        not-found route, any node was added anywhere (it might now match).
+        """
+        with self._lock:
+            if not path_found:
+                return self._structure_seq > structure_seq
+            node = self.tree
+            for seg in route_parts:
+                node = node.children.get(seg)
+                if node is None or node.structure_seq > structure_seq:
+                    return True
+            return False
+
+    def _add(self, node, template, ts):
+        node.add_template(template, ts=ts)
+        self._template_index[template] = node.path
+        self._touch(node)
+
+    def _mkdir(self, parent, name):
+        child = parent.children.get(name)
+        if child is None:
+            child = self._new_node(name, parent.path + (name,))
+            parent.children[name] = child
+            self._structure_seq += 1
+            child.structure_seq = self._structure_seq
+            self._touch(parent)
+        return child
+
+    def _split(self, leaf, c1_name, c2_name):
+        c1 = self._mkdir(leaf, c1_name)
+        self._mkdir(leaf, c2_name)
+        for ts, template in zip(leaf.timestamps, leaf.templates):
+            self._add(c1, template, ts)
+        leaf.templates = []
+        leaf.timestamps = []
+        leaf.exemplars.clear()
+        self._structure_seq += 1
+        leaf.structure_seq = self._structure_seq
+        self._touch(leaf)
+        return c1
+
+    def _set_templates(self, node, pairs):
+        # New lists rather than in-place edits: published snapshots still reference the old ones.
+        node.timestamps = [ts for ts, _ in pairs]
+        node.templates = [t for _, t in pairs]
+        node.exemplars.rebuild(node.templates)
+        for t in node.templates:
+            self._template_index[t] = node.path
+        self._touch(node)
+
+    def _unindex(self, node, templates):
+        for t in templates:
+            if self._template_index.get(t) == node.path:
+                del self._template_index[t]
+
+    def _archive(self, leaf, indices):
+        drop = set(indices)
+        pairs = list(zip(leaf.timestamps, leaf.templates))
+        removed = [pairs[i] for i in sorted(drop)]
+        self._unindex(leaf, [t for _, t in removed])
+        self._set_templates(leaf, [p for i, p in enumerate(pairs) if i not in drop])
+        return removed
+
+    def _merge(self, parent, src_name, dst_name):
+        src, dst = parent.children[src_name], parent.children[dst_name]
+        if not (src.is_leaf() and dst.is_leaf()) or src is dst:
+            raise ValueError(f"Can only merge two distinct leaves, got '{src_name}' into '{dst_name}'")
+        del parent.children[src_name]
+        self._unindex(src, src.templates)
+        # Time order, so retention's "newest N" stays the last N entries.
+        self._set_templates(dst, in_time_order(list(zip(dst.timestamps, dst.templates)) +
+                                               list(zip(src.timestamps, src.templates))))
+        self._structure_seq += 1
+        dst.structure_seq = self._structure_seq
+        self._touch(parent)
+        return dst
+
+    def _collapse(self, node):
+        pairs = []
+
+        def gather(n):
+            pairs.extend(zip(n.timestamps, n.templates))
+            for child in n.children.values():
+                gather(child)
+        gather(node)
+        node.children = {}
+        self._set_templates(node, in_time_order(pairs))
+        self._structure_seq += 1
+        node.structure_seq = self._structure_seq
+        return node
+
+    def archive_templates(self, leaf, indices):
+        """Remove the templates at `indices` from `leaf`; returns the removed (ts, template) pairs."""
+        with self.transaction():
+            removed = self._archive(leaf, indices)
+            self._journal_append({"op": "archive", "path": list(leaf.path), "indices": sorted(set(indices))})
+        return removed
+
+    def merge_leaves(self, parent, src_name, dst_name):
+        """Fold leaf `src_name` into its sibling leaf `dst_name` and drop it."""
+        with self.transaction():
+            dst = self._merge(parent, src_name, dst_name)
+            self._journal_append({"op": "merge", "path": list(parent.path), "src": src_name, "dst": dst_name})
+        return dst
+
+    def collapse(self, node):
+        """Turn `node` into a leaf holding all templates of its subtree."""
+        with self.transaction():
+            self._collapse(node)
+            self._journal_append({"op": "collapse", "path": list(node.path)})
+        return node
+
+    def add_template(self, node, template, ts):
+        """File `template` under `node` and journal it."""
+        with self.transaction():
+            if ts is None or str(ts).strip() == "":
+                raise ValueError(f"'ts' is required for node '{node.name}'")
+            self._add(node, template, ts)
+            self._journal_append({"op": "add", "path": list(node.path), "ts": str(ts).strip(),
+                                  "template": template})
+        return node
+
+    def create_child(self, parent, name):
+        with self.transaction():
+            existed = name in parent.children
+            child = self._mkdir(parent, name)
+            if not existed:
+                self._journal_append({"op": "mkdir", "path": list(parent.path), "name": name})
+        return child
+
+    def split_leaf(self, leaf, c1_name, c2_name):
+        """Turn `leaf` into an internal node; its templates move to `c1_name`."""
+        with self.transaction():
+            self._split(leaf, c1_name, c2_name)
+            self._journal_append({"op": "split", "path": list(leaf.path), "names": [c1_name, c2_name]})
+        return leaf.children[c1_name], leaf.children[c2_name]
+
+    # ------------------------------------------------------- folder import/export
+
+    def _read_folders(self, folder_path, name="root", path=()):
+        node = self._new_node(name, path)
+        entries = sorted(os.listdir(folder_path)) if os.path.isdir(folder_path) else []
+        for entry in entries:
+            p = os.path.join(folder_path, entry)
+            if entry.endswith(".txt") and os.path.isfile(p):
+                with open(p, "r", encoding="utf-8") as fh:
+                    node.add_template(fh.read().strip(), ts=entry[:-len(".txt")])
+        for entry in entries:
+            p = os.path.join(folder_path, entry)
             if os.path.isdir(p):
-                child = TreeNode(name, folder_path=p)
-                node.children[name] = child
-                self._load_children(child)
-    def find_path_by_template(self, template_text: str):
-        def dfs(node: TreeNode, cur):
-            node.update_templates()
-            if template_text in node.templates:
-                return cur
+                node.children[entry] = self._read_folders(p, entry, path + (entry,))
+        return node
+
+    def import_folders(self, folder_path):
+        """Replace the tree with a folder-layout tree and persist it as a snapshot."""
+        with self.transaction():
+            self.tree = self._read_folders(folder_path)
+            self._reindex()
+            self._seq += 1
+            self._structure_seq += 1
+            self.snapshot()
+        return self.tree
+
+    def export_folders(self, dest_path):
+        """Write the tree in the folder layout (one folder per node, one .txt per template)."""
+        def write(node, folder):
+            os.makedirs(folder, exist_ok=True)
+            for ts, template in zip(node.timestamps, node.templates):
+                with open(os.path.join(folder, ts_filename(ts)), "w", encoding="utf-8") as fh:
+                    fh.write(template)
             for name, child in node.children.items():
-                got = dfs(child, cur + [name])
-                if got is not None:
-                    return got
-            return None
-        return dfs(self.tree, []) or []
+                write(child, os.path.join(folder, name))
+        with self._lock:
+            write(self.tree, dest_path)
+        return dest_path
+
+    # ---------------------------------------------------------------- queries
+
+    def find_path_by_template(self, template_text: str):
+        return list(self._template_index.get(template_text, ()))
+
+    def node_at(self, path):
+        """Return the node at `path` (list of segment names), or None."""
+        node = self.tree
+        for seg in path:
+            node = node.children.get(seg)
+            if node is None:
+                return None
+        return node
+
     def tree_structure(self, node, for_display=False):
         if node.is_leaf():
-            node.update_templates()
             return node.templates[-1:] if (for_display and node.templates) else node.templates.copy()
         return {k: self.tree_structure(v, for_display) for k, v in node.children.items()}
 
-    def horizontal_expansion(self, tree, new_template, agent, prompt_text, ts):
-        prompt = prompt_text + "Error Tree:\n" + json.dumps(
-            self.tree_structure(tree, for_display=False), indent=2, ensure_ascii=False
-        ) + f"\n\nTemplate:\n{new_template}\n\nExplanation:\n"
-        response = agent.run(prompt)
-        print("Horizontal expansion response:\n", response)
+    @staticmethod
+    def _hidden_hint(hidden):
+        """Count of templates not shown, rounded down to one significant digit past 10."""
+        if hidden < 10:
+            return str(hidden)
+        scale = 10 ** (len(str(hidden)) - 1)
+        return f"{hidden // scale * scale}+"
+
+    def prompt_tree(self, node):
+        """
+        Bounded view of the tree for LLM prompts: every node name, and per leaf at
+        most `prompt_exemplars` diverse templates. A leaf with templates left out
+        becomes {"exemplars": [...], "more": count}, so the count never reads as a
+        template (see PROMPT_TREE_NOTE).
+
+        The view is canonical so consecutive prompts share the longest possible
+        prefix with the provider's prompt cache: children are sorted by name,
+        exemplars only change when the leaf's exemplar set does, and the count
+        is coarse, so adding a template to a leaf usually leaves the text as is.
+        """
+        if node.is_leaf():
+            shown = select_diverse(node.exemplars.items(), self.prompt_exemplars)
+            hidden = node.template_count - len(shown)
+            return {"exemplars": shown, "more": self._hidden_hint(hidden)} if hidden > 0 else shown
+        return {k: self.prompt_tree(node.children[k]) for k in sorted(node.children)}
+
+    def prompt_tree_json(self, tree):
+        """Compact (no indentation) JSON of prompt_tree(), as embedded in prompts."""
+        return json.dumps(self.prompt_tree(tree), ensure_ascii=False, separators=(",", ":"))
+
+    def prompt_tree_section(self, tree):
+        """PROMPT_TREE_NOTE and the "Error Tree:" block, as embedded in route and expansion prompts."""
+        return self.PROMPT_TREE_NOTE + "Error Tree:\n" + self.prompt_tree_json(tree)
+
+    # ------------------------------------------------------------- expansions
+
+    @staticmethod
+    def parse_addition(response):
+        """Category path from a horizontal-expansion response ("Addition: (A -> B -> <END>)")."""
         if "Addition" not in response:
             raise RuntimeError(f"No 'Addition' found in response:\n{response}")
         route_match = re.findall(r"\((.*?)\)", response.split("Addition:")[-1])
         if not route_match:
             raise RuntimeError(f"Failed to parse route from:\n{response}")
-        parts = [p.strip() for p in route_match[0].split("->") if p.strip() and p.strip() != "<END>"]
+        return [p.strip() for p in route_match[0].split("->") if p.strip() and p.strip() != "<END>"]
+
+    def _check_addition(self, response):
+        if not self.parse_addition(response):
+            raise OutputRejected("empty Addition path", soft=True)
+
+    @staticmethod
+    def _check_split(response):
+        if len(re.findall(r"<(.*?)>", response)) != 2:
+            raise OutputRejected("expected exactly two <NAME> entries", soft=True)
+
+    def horizontal_expansion(self, tree, new_template, agent, prompt_text, ts):
+        prompt = prompt_text + self.prompt_tree_section(tree) + \
+            f"\n\nTemplate:\n{new_template}\n\nExplanation:\n"
+        response = agent.run(prompt, stage="horizontal", validate=self._check_addition)
+        print("Horizontal expansion response:\n", response)
+        parts = self.parse_addition(response)
         node = tree
         for error_type in parts:
             if error_type in node.children:
                 node = node.children[error_type]
             else:
-                new_folder = os.path.join(node.folder_path, error_type)
-                os.makedirs(new_folder, exist_ok=True)
-                new_leaf = TreeNode(error_type, folder_path=new_folder)
-                new_leaf.add_template(new_template, ts=ts)
-                node.children[error_type] = new_leaf
+                new_leaf = self.create_child(node, error_type)
+                self.add_template(new_leaf, new_template, ts=ts)
                 return new_leaf
-        node.add_template(new_template, ts=ts)
+        self.add_template(node, new_template, ts=ts)
         return node
 
     def vertical_expansion(self, parent_node, leaf_node, new_template, agent, prompt_text, ts):
-        leaf_node.update_templates()
-        few_shot = leaf_node.templates.copy()
+        # Constant-size List 1: the leaf's diverse exemplars rather than its full history.
+        few_shot = leaf_node.exemplars.items()
         prompt = prompt_text + f"\nParent Category: {leaf_node.name}\n\nList 1: {json.dumps(few_shot)}\nList 2: {json.dumps([new_template])}\n"
-        response = agent.run(prompt)
+        response = agent.run(prompt, stage="vertical", validate=self._check_split)
         print("Vertical expansion response:\n", response)
         names = re.findall(r"<(.*?)>", response)
         if len(names) == 2 and names[0] != names[1]:
-            old_folder = leaf_node.folder_path
             c1_name, c2_name = names
-            c1_folder = os.path.join(old_folder, c1_name)
-            c2_folder = os.path.join(old_folder, c2_name)
-            os.makedirs(c1_folder, exist_ok=True)
-            os.makedirs(c2_folder, exist_ok=True)
-            c1 = TreeNode(c1_name, folder_path=c1_folder)
-            c2 = TreeNode(c2_name, folder_path=c2_folder)
-            for f in os.listdir(old_folder):
-                if f.endswith(".txt"):
-                    shutil.move(os.path.join(old_folder, f), os.path.join(c1_folder, f))
-            c1.update_templates()
-            c2.add_template(new_template, ts=ts)
-            leaf_node.templates = []
-            leaf_node.children = {c1_name: c1, c2_name: c2}
+            _, c2 = self.split_leaf(leaf_node, c1_name, c2_name)
+            self.add_template(c2, new_template, ts=ts)
             return c2
         else:
-            leaf_node.add_template(new_template, ts=ts)
+            self.add_template(leaf_node, new_template, ts=ts)
             return leaf_node
-        
-    def _build_node_from_fs(self, folder_path: str, name: str):
-        """Rehydrate a TreeNode from the filesystem recursively."""
-        node = TreeNode(name=name, folder_path=folder_path)
-        try:
-            entries = sorted(os.listdir(folder_path))
-        except FileNotFoundError:
-            entries = []
-        for entry in entries:
-            child_path = os.path.join(folder_path, entry)
-            if os.path.isdir(child_path):
-                node.children[entry] = self._build_node_from_fs(child_path, entry)
-        node.update_templates()  # loads template file contents into node.templates
-        return node
 
     def _node_to_simple(self, node: "TreeNode"):
         """Leaf → list[str]; Internal → dict[str, ...]."""
@@ -128,25 +519,33 @@ class TemplateTreeManager:
         Build a rootless simple dict:
         { "<TopCategory>": <list or dict>, ... }
         """
-        result = {}
-        try:
-            for entry in sorted(os.listdir(self.base_path)):
-                p = os.path.join(self.base_path, entry)
-                if os.path.isdir(p):
-                    top = self._build_node_from_fs(p, entry)
-                    result[entry] = self._node_to_simple(top)
-        except FileNotFoundError:
-            pass
-        return result
+        return {name: self._node_to_simple(child) for name, child in sorted(self.tree.children.items())}
+
+    def tree_export(self):
+        """
+        (version, UTF-8 bytes) of simple_tree_dict() as JSON, from the published
+        snapshot. Only subtrees changed since the previous version are
+        re-serialized; no lock is taken.
+        """
+        snap = self._published
+        return snap.version, snap.export_bytes()
 
     def export_tree_simple_json(self, out_path: str):
-        """Write the simple tree JSON to file and return the dict."""
-        data = self.simple_tree_dict()
+        """
+        Write the simple tree JSON to file (temp file + rename) if the tree changed
+        since the last export there. Returns the exported tree version.
+        """
+        version, body = self.tree_export()
+        if self._exported.get(out_path) == version and os.path.exists(out_path):
+            return version
         os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return data
-        
+        tmp = out_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, out_path)
+        self._exported[out_path] = version
+        return version
+
     def update_sensor_tree(self, tree, event, agent, h_prompt, v_prompt):
         route_parts = event.get("error_code", "").split(":") if event.get("error_code") else []
         path_found = bool(event.get("path_found", False))
@@ -166,9 +565,12 @@ class TemplateTreeManager:
 
         # If the final node is a leaf → Vertical expansion
         if node.is_leaf():
-            return self.vertical_expansion(parent, node, event["template"], agent, v_prompt, ts=event["ts"])
+            landed = self.vertical_expansion(parent, node, event["template"], agent, v_prompt, ts=event["ts"])
+            if landed is not node:
+                for listener in self.split_listeners:
+                    listener(route_parts)
+            return landed
 
         # If the final node is internal (has children), we cannot split a non-leaf;
         # attach horizontally (prompt will guide adding an appropriate child).
         return self.horizontal_expansion(tree, event["template"], agent, h_prompt, ts=event["ts"])
-
@@ -0,0 +1,209 @@
+# tree_compactor.py
+import os
+import json
+import time
+import pandas as pd
+from .exemplars import template_signature, jaccard_distance
+from .tree_node import parse_template_ts
+
+
+class TreeCompactor:
+    """Maintenance pass that keeps the template tree bounded.
+
+    1. Depth cap: nodes at `max_depth` are collapsed into leaves.
+    2. Merging: leaves with fewer than `min_leaf_templates` templates are folded
+       into their most similar sibling leaf, and a parent with more than
+       `max_fanout` children has its smallest leaves merged the same way.
+       Top-level domain nodes are never merged.
+    3. Retention: per leaf, templates older than `max_age_days` and all but the
+       newest `max_leaf_templates` are moved to an append-only archive file
+       (`tree_archive.jsonl` next to the journal) and out of the hot tree.
+       It runs last so leaves produced by collapsing/merging are bounded too.
+
+    Every change is a journaled TemplateTreeManager operation, so readers see
+    consistent snapshots throughout. Any limit set to None/0 is skipped.
+    """
+
+    ARCHIVE_FILE = "tree_archive.jsonl"
+
+    def __init__(self, manager, max_age_days: float = None, max_leaf_templates: int = None,
+                 min_leaf_templates: int = 0, max_depth: int = None, max_fanout: int = None,
+                 archive_path: str = None):
+        self.manager = manager
+        self.max_age_days = max_age_days
+        self.max_leaf_templates = max_leaf_templates
+        self.min_leaf_templates = min_leaf_templates
+        self.max_depth = max_depth
+        self.max_fanout = max_fanout
+        self.archive_path = archive_path or os.path.join(manager.base_path, self.ARCHIVE_FILE)
+
+    @classmethod
+    def from_env(cls, manager):
+        def _get(name, cast):
+            v = os.environ.get(name)
+            return cast(v) if v not in (None, "") else None
+        return cls(
+            manager,
+            max_age_days=_get("ANOMALY_TREE_RETENTION_DAYS", float),
+            max_leaf_templates=_get("ANOMALY_TREE_MAX_LEAF_TEMPLATES", int),
+            min_leaf_templates=_get("ANOMALY_TREE_MIN_LEAF_TEMPLATES", int) or 0,
+            max_depth=_get("ANOMALY_TREE_MAX_DEPTH", int),
+            max_fanout=_get("ANOMALY_TREE_MAX_FANOUT", int),
+        )
+
+    # ------------------------------------------------------------ measurements
+
+    def measure(self):
+        nodes = leaves = templates = depth = 0
+        stack = [(self.manager.tree, 0)]
+        while stack:
+            node, d = stack.pop()
+            nodes += 1
+            templates += len(node.templates)
+            depth = max(depth, d)
+            if node.is_leaf():
+                leaves += 1
+            stack.extend((c, d + 1) for c in node.children.values())
+        prompt_chars = len(self.manager.prompt_tree_json(self.manager.tree))
+        return {
+            "nodes": nodes - 1,  # excluding the root
+            "leaves": leaves,
+            "templates": templates,
+            "max_depth": depth,
+            "prompt_tokens_est": prompt_chars // 4,
+            "export_bytes": len(self.manager.tree_export()[1]),
+            "disk_bytes": sum(os.path.getsize(p) for p in (self.manager.snapshot_path, self.manager.journal_path)
+                              if os.path.exists(p)),
+        }
+
+    # ----------------------------------------------------------------- passes
+
+    def _leaves(self, node=None):
+        node = node or self.manager.tree
+        if node.is_leaf():
+            if node.path:
+                yield node
+            return
+        for child in list(node.children.values()):
+            yield from self._leaves(child)
+
+    def _archive(self, leaf, indices):
+        removed = self.manager.archive_templates(leaf, indices)
+        if removed:
+            now = time.time()
+            with open(self.archive_path, "a", encoding="utf-8") as f:
+                for ts, template in removed:
+                    f.write(json.dumps({"path": list(leaf.path), "ts": ts, "template": template,
+                                        "archived_at": now}, ensure_ascii=False) + "\n")
+        return len(removed)
+
+    def apply_retention(self, now=None):
+        archived = 0
+        cutoff = None
+        if self.max_age_days:
+            # Template ts are tz-aware (with DST offsets) or naive; compare everything in UTC.
+            now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+            now = now.tz_localize("UTC") if now.tzinfo is None else now.tz_convert("UTC")
+            cutoff = now - pd.Timedelta(days=self.max_age_days)
+        for leaf in list(self._leaves()):
+            n = len(leaf.templates)
+            drop = set()
+            stamps = parse_template_ts(leaf.timestamps)
+            if cutoff is not None:
+                # Unparseable timestamps (e.g. imported file names) are never aged out.
+                drop.update(i for i, ts in enumerate(stamps) if pd.notna(ts) and ts < cutoff)
+            if self.max_leaf_templates and n - len(drop) > self.max_leaf_templates:
+                # Newest by timestamp, not list position; unparseable ones rank oldest.
+                ranked = sorted((i for i in range(n) if i not in drop),
+                                key=lambda i: (pd.notna(stamps[i]), stamps[i].value if pd.notna(stamps[i]) else 0, i))
+                drop = set(range(n)) - set(ranked[-self.max_leaf_templates:])
+            if drop:
+                archived += self._archive(leaf, drop)
+        return archived
+
+    def apply_depth_cap(self):
+        if not self.max_depth:
+            return 0
+        collapsed = 0
+        stack = [self.manager.tree]
+        while stack:
+            node = stack.pop()
+            if len(node.path) >= self.max_depth and node.children:
+                self.manager.collapse(node)
+                self._notify(node.path)
+                collapsed += 1
+                continue
+            stack.extend(node.children.values())
+        return collapsed
+
+    @staticmethod
+    def _leaf_signature(leaf):
+        sig = frozenset()
+        for t in leaf.exemplars.items():
+            sig |= template_signature(t)
+        return sig
+
+    def _merge_into_nearest(self, parent, src):
+        siblings = [c for c in parent.children.values() if c is not src and c.is_leaf()]
+        if not siblings:
+            return False
+        src_sig = self._leaf_signature(src)
+        dst = min(siblings, key=lambda c: (jaccard_distance(src_sig, self._leaf_signature(c)), -len(c.templates)))
+        self.manager.merge_leaves(parent, src.name, dst.name)
+        self._notify(src.path)
+        return True
+
+    def apply_merges(self):
+        merged = 0
+        stack = [self.manager.tree]
+        while stack:
+            parent = stack.pop()
+            if parent.is_leaf():
+                continue
+            if not parent.path:
+                # The root's children are the domain anchors (Temp-related, Volt-related, ...);
+                # merging them would file one domain's templates under another.
+                stack.extend(parent.children.values())
+                continue
+            if self.min_leaf_templates:
+                sparse = sorted((c for c in parent.children.values()
+                                 if c.is_leaf() and len(c.templates) < self.min_leaf_templates),
+                                key=lambda c: len(c.templates))
+                for leaf in sparse:
+                    # Keep at least one child; a parent never becomes a leaf by merging.
+                    if len(parent.children) > 1 and leaf.name in parent.children:
+                        merged += self._merge_into_nearest(parent, leaf)
+            while self.max_fanout and len(parent.children) > self.max_fanout:
+                leaves = sorted((c for c in parent.children.values() if c.is_leaf()),
+                                key=lambda c: len(c.templates))
+                if len(leaves) < 2 or not self._merge_into_nearest(parent, leaves[0]):
+                    break
+                merged += 1
+            stack.extend(parent.children.values())
+        return merged
+
+    def _notify(self, path):
+        for listener in self.manager.split_listeners:
+            listener(list(path))
+
+    def run(self, now=None):
+        """Run all passes, persist a fresh snapshot and return a before/after report."""
+        started = time.perf_counter()
+        before = self.measure()
+        collapsed = self.apply_depth_cap()
+        merged = self.apply_merges()
+        archived = self.apply_retention(now=now)
+        self.manager.snapshot()
+        after = self.measure()
+        report = {
+            "archived_templates": archived,
+            "collapsed_nodes": collapsed,
+            "merged_leaves": merged,
+            "before": before,
+            "after": after,
+            "prompt_token_reduction": (1 - after["prompt_tokens_est"] / before["prompt_tokens_est"])
+            if before["prompt_tokens_est"] else 0.0,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        print(f"[compaction] {json.dumps(report)}")
+        return report
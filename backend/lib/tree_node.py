@@ -1,44 +1,85 @@
 # tree_node.py
-import os
-import shutil
-from datetime import datetime
+import pandas as pd
+from .exemplars import ExemplarSet
+from .tree_snapshot import FrozenTreeNode
+
+
+def ts_filename(ts) -> str:
+    """File name used for a template in the folder layout (one .txt per timestamp)."""
+    ts_str = str(ts).strip()
+    safe = (ts_str.replace(":", "").replace("-", "")
+                    .replace(" ", "_").replace("/", "")
+                    .replace("\\", ""))
+    return f"{safe}.txt"
+
+
+def parse_template_ts(timestamps) -> pd.Series:
+    """Template timestamps as UTC Timestamps, each parsed on its own (naive ones read as UTC);
+    NaT where a value is not a timestamp (e.g. an imported file name)."""
+    return pd.to_datetime(pd.Series(list(timestamps), dtype=object), errors="coerce", utc=True, format="mixed")
+
+
+def in_time_order(pairs):
+    """(ts, template) pairs sorted by parsed timestamp, unparseable ones first, ties kept in order."""
+    keys = [(False, 0) if pd.isna(s) else (True, s.value) for s in parse_template_ts(ts for ts, _ in pairs)]
+    return [pairs[i] for i in sorted(range(len(pairs)), key=keys.__getitem__)]
+
 
 class TreeNode:
-    """Represents a node in the anomaly/error tree."""
+    """Represents a node in the anomaly/error tree (held in memory).
+
+    Persistence is handled by TemplateTreeManager through its journal; nodes
+    only keep their templates (with timestamps), children and exemplar set.
+    """
 
-    def __init__(self, name, folder_path=None):
+    def __init__(self, name, path=(), max_exemplars=8):
         self.name = name
+        # Segment names from the root to this node; () for the root.
+        self.path = tuple(path)
         self.children = {}
         self.templates = []
-        self.folder_path = folder_path
+        self.timestamps = []
+        # Bounded, diverse sample of this leaf's templates (full history stays in storage).
+        self.exemplars = ExemplarSet(max_exemplars)
+        # Value of the manager's structure counter when this node was created or split.
+        self.structure_seq = 0
+        # Immutable view of this subtree as of the last publish; None when dirty.
+        self.frozen = None
 
     def is_leaf(self):
         return len(self.children) == 0
 
-    def update_templates(self):
-        if not self.folder_path or not os.path.isdir(self.folder_path):
-            self.templates = []
-            return
-        files = sorted([f for f in os.listdir(self.folder_path) if f.endswith(".txt")])
-        new_templates = []
-        for fname in files:
-            with open(os.path.join(self.folder_path, fname), "r", encoding="utf-8") as fh:
-                new_templates.append(fh.read().strip())
-        self.templates = new_templates
+    @property
+    def template_count(self):
+        return len(self.templates)
+
+    def freeze(self):
+        """Immutable view of this subtree, reusing the frozen views of clean children."""
+        if self.frozen is None:
+            self.frozen = FrozenTreeNode(self, {k: c.freeze() for k, c in self.children.items()})
+        return self.frozen
 
     def add_template(self, content, ts):
         if ts is None or str(ts).strip() == "":
             raise ValueError(f"'ts' is required for node '{self.name}'")
-        if not self.folder_path:
-            raise ValueError(f"Folder path not set for node '{self.name}'.")
-        os.makedirs(self.folder_path, exist_ok=True)
-        ts_str = str(ts).strip()
-        safe = (ts_str.replace(":", "").replace("-", "")
-                        .replace(" ", "_").replace("/", "")
-                        .replace("\\", ""))
-
-        fname = f"{safe}.txt"
-        path = os.path.join(self.folder_path, fname)
-        with open(path, "w", encoding="utf-8") as fh:
-            fh.write(content)
-        self.update_templates()
+        self.templates.append(content)
+        self.timestamps.append(str(ts).strip())
+        self.exemplars.add(content)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "templates": [[ts, t] for ts, t in zip(self.timestamps, self.templates)],
+            "children": [c.to_dict() for c in self.children.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data, path=(), max_exemplars=8):
+        node = cls(data["name"], path=path, max_exemplars=max_exemplars)
+        for ts, template in data.get("templates", []):
+            node.add_template(template, ts)
+        for child in data.get("children", []):
+            node.children[child["name"]] = cls.from_dict(
+                child, path=tuple(path) + (child["name"],), max_exemplars=max_exemplars
+            )
+        return node
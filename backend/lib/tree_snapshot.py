@@ -0,0 +1,101 @@
+# tree_snapshot.py
+import json
+from types import MappingProxyType
+
+
+class FrozenExemplars:
+    """Read-only copy of a leaf's ExemplarSet at snapshot time."""
+
+    __slots__ = ("_items", "seen")
+
+    def __init__(self, items, seen):
+        self._items = tuple(items)
+        self.seen = seen
+
+    def __len__(self):
+        return len(self._items)
+
+    def items(self):
+        return list(self._items)
+
+
+class FrozenTreeNode:
+    """
+    Immutable view of a TreeNode at one tree version.
+
+    Unchanged subtrees are shared between consecutive versions, so publishing a
+    new version only allocates the nodes on the mutated paths. Templates are not
+    copied: the node keeps the leaf's append-only list and the length it had,
+    which is stable because a split replaces the list rather than clearing it.
+    """
+
+    __slots__ = ("name", "path", "children", "structure_seq", "exemplars",
+                 "_templates", "_count", "_templates_view", "_simple_json")
+
+    def __init__(self, node, children):
+        self.name = node.name
+        self.path = node.path
+        self.children = MappingProxyType(children)
+        self.structure_seq = node.structure_seq
+        self.exemplars = FrozenExemplars(node.exemplars.items(), node.exemplars.seen)
+        self._templates = node.templates
+        self._count = len(node.templates)
+        self._templates_view = None
+        self._simple_json = None
+
+    def is_leaf(self):
+        return len(self.children) == 0
+
+    @property
+    def template_count(self):
+        return self._count
+
+    @property
+    def templates(self):
+        if self._templates_view is None:
+            self._templates_view = tuple(self._templates[:self._count])
+        return self._templates_view
+
+    def simple_json(self):
+        """Compact JSON of the simple export for this subtree (computed once per frozen node)."""
+        if self._simple_json is None:
+            if self.children:
+                self._simple_json = "{" + ",".join(
+                    json.dumps(c.name, ensure_ascii=False) + ":" + c.simple_json()
+                    for c in self.children.values()
+                ) + "}"
+            else:
+                self._simple_json = json.dumps(list(self.templates), ensure_ascii=False)
+        return self._simple_json
+
+
+class TreeSnapshot:
+    """One published, consistent version of the template tree; safe to read without locks."""
+
+    __slots__ = ("version", "structure_seq", "root", "_export")
+
+    def __init__(self, version, structure_seq, root):
+        self.version = version
+        # Bumped by every node creation or split; routes computed on this snapshot
+        # are stale once the live tree's structure_seq moves past it.
+        self.structure_seq = structure_seq
+        self.root = root
+        self._export = None
+
+    def node_at(self, path):
+        node = self.root
+        for seg in path:
+            node = node.children.get(seg)
+            if node is None:
+                return None
+        return node
+
+    def export_bytes(self):
+        """Rootless simple-tree JSON (top-level categories sorted by name) as UTF-8."""
+        if self._export is None:
+            top = sorted(self.root.children.items())
+            body = "{" + ",".join(
+                json.dumps(name, ensure_ascii=False) + ":" + child.simple_json() for name, child in top
+            ) + "}"
+            self._export = body.encode("utf-8")
+        return self._export
@@ -0,0 +1,66 @@
+# migrate_history.py
+"""
+One-off import of the flat CSV history into the partitioned Parquet store.
+
+Each CSV is streamed in chunks and appended to its dataset; the CSVs are
+left in place. A dataset that already has files is skipped unless --force
+is given, so rerunning the migration does not duplicate rows.
+
+    python migrate_history.py --store history_store \\
+        --sensor normal_data.csv \\
+        --contributions backend_anomaly_contribution_results.csv \\
+        --classified anomaly_results_classified.csv
+
+Then start the backend with ANOMALY_HISTORY_STORE=history_store. The edge
+feed keeps appending to normal_data.csv, which the backend still serves
+alongside the store (rows in both are returned once); once migrated, its
+history can be rotated out of the CSV.
+"""
+
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from history_store import HistoryStore
+
+
+def migrate(store, dataset, csv_path, chunk_size=500_000, force=False):
+    if store.footprint(dataset)[0] and not force:
+        print(f"[migrate] {dataset}: store already has data; skipping {csv_path} (use --force to append anyway)")
+        return 0
+    started = time.perf_counter()
+    rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        rows += store.append(dataset, chunk)
+    files, size = store.footprint(dataset)
+    csv_size = os.path.getsize(csv_path)
+    print(f"[migrate] {dataset}: {rows} rows from {csv_path} in {time.perf_counter() - started:.1f}s; "
+          f"{csv_size / 1e6:.1f} MB CSV -> {size / 1e6:.1f} MB in {files} Parquet files")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=os.environ.get("ANOMALY_HISTORY_STORE") or "history_store")
+    parser.add_argument("--sensor", help="sensor readings CSV (normal_data.csv)")
+    parser.add_argument("--contributions", help="contribution results CSV")
+    parser.add_argument("--classified", help="classified anomalies CSV")
+    parser.add_argument("--chunk-size", type=int, default=500_000)
+    parser.add_argument("--force", action="store_true", help="append even if the dataset already has data")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.store)
+    for dataset in HistoryStore.DATASETS:
+        csv_path = getattr(args, dataset)
+        if not csv_path:
+            continue
+        if not os.path.exists(csv_path):
+            print(f"[migrate] {dataset}: {csv_path} not found; skipping")
+            continue
+        migrate(store, dataset, csv_path, chunk_size=args.chunk_size, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
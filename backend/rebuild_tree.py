@@ -0,0 +1,190 @@
+# rebuild_tree.py
+"""
+Offline rebuild of the template tree from historical anomaly CSVs.
+
+Streams the input files in chunks, sorts each chunk by timestamp, extracts
+templates concurrently and replays the tree mutations in timestamp order.
+Progress is checkpointed (tree snapshot + processed-row ledger) every
+--checkpoint-every rows, so an interrupted rebuild resumes where it stopped
+when rerun with the same arguments. LLM responses go through the shared
+response cache, so a replay after a crash or of an overlapping history does
+not pay for calls it already made.
+
+    python rebuild_tree.py anomaly_results_classified.csv --base-path templates_storage_new \\
+        --reset --concurrency 8 --out rebuilt_classified.csv
+
+Inputs are expected to be roughly chronological (as the classified CSV is
+appended); rows are ordered by ts within each chunk. The rebuild writes to
+templates_storage_new by default and refuses to --reset the live
+templates_storage; swap the finished tree in while the service is stopped.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from generate_tree import pipeline_prompts
+from lib.anomaly_tree_builder import AnomalyTreeBuilder
+from lib.anomaly_scheduler import RateLimiter
+from lib.gpt_agent import load_model_tiers
+from lib.llm_backends import backend_name
+from lib.processed_ledger import ProcessedLedger
+from lib.response_cache import ResponseCache
+from lib.signature_cache import SignatureCache
+from lib.similarity_index import SimilarityIndex
+from lib.template_tree_manager import TemplateTreeManager
+
+# Tree the running service serves; --reset must never target it.
+LIVE_BASE_PATH = "templates_storage"
+LEDGER_FILE = "rebuild_ledger.jsonl"
+PROGRESS_FILE = "rebuild_progress.json"
+
+
+def _sort_by_ts(df):
+    return df.sort_values("ts", key=lambda s: pd.to_datetime(s, errors="coerce"), kind="mergesort")
+
+
+def _checkpoint(builder, base_path, state):
+    builder.tree_manager.snapshot()
+    if builder.signature_cache is not None:
+        builder.signature_cache.save()
+    state = dict(state, tree_version=builder.tree_manager.version, updated_at=time.time())
+    tmp = os.path.join(base_path, PROGRESS_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(base_path, PROGRESS_FILE))
+
+
+def rebuild_tree(inputs, base_path="templates_storage_new", reset=False, concurrency=8, chunk_size=5000,
+                 checkpoint_every=1000, template_mode="llm", out_path=None, response_cache=None,
+                 route_batch_size=1):
+    """
+    Replay historical anomaly rows into the tree at `base_path`. Returns the
+    final progress dict (rows replayed/skipped, LLM calls, throughput).
+    """
+    prompts = pipeline_prompts()
+    # A reset wipes base_path, including the ledger of a previous rebuild.
+    manager = TemplateTreeManager(base_path=base_path, reset=reset)
+    ledger = ProcessedLedger(path=os.path.join(base_path, LEDGER_FILE))
+    builder = AnomalyTreeBuilder(
+        csv_path=None,
+        prompts=prompts,
+        signature_cache=SignatureCache(path=os.path.join(base_path, "signature_cache.json")),
+        template_mode=template_mode,
+        response_cache=response_cache if response_cache is not None else ResponseCache.from_env(),
+        similarity_index=SimilarityIndex(),
+        tree_manager=manager,
+        model_tiers=load_model_tiers(),
+        rate_limiter=RateLimiter.from_env(),
+        route_batch_size=route_batch_size,
+    )
+    if len(ledger):
+        print(f"[rebuild] resuming: {len(ledger)} rows already replayed into {base_path}")
+    # Rows replayed by an interrupted run whose chunk never reached `out_path`.
+    unwritten = ledger.unwritten() if out_path else {}
+
+    state = {"inputs": list(inputs), "rows_replayed": 0, "rows_skipped": 0, "llm_calls": 0,
+             "last_ts": None, "elapsed_s": 0.0, "rows_per_s": 0.0}
+    started = time.perf_counter()
+    since_checkpoint = 0
+    last_ts = None
+    try:
+        for path in inputs:
+            for chunk in pd.read_csv(path, chunksize=chunk_size):
+                # Drop columns of a previous classification; only contribution data is replayed.
+                chunk = chunk.drop(columns=[c for c in ("classification", "template") if c in chunk.columns])
+                seen = ledger.seen_mask(chunk)
+                state["rows_skipped"] += sum(seen)
+                resumed = None
+                resumed_keys = []
+                if unwritten:
+                    chunk_keys = ledger.keys_for(chunk)
+                    rows = [p for p, k in enumerate(chunk_keys) if k in unwritten]
+                    resumed_keys = [chunk_keys[p] for p in rows]
+                    resumed = chunk.iloc[rows].copy()
+                    resumed["classification"] = [unwritten[chunk_keys[p]][0] for p in rows]
+                    resumed["template"] = [unwritten[chunk_keys[p]][1] for p in rows]
+                chunk = _sort_by_ts(chunk[[not s for s in seen]]).reset_index(drop=True)
+                if chunk.empty:
+                    if resumed is not None and not resumed.empty:
+                        resumed.to_csv(out_path, mode="a", header=not os.path.exists(out_path), index=False)
+                        ledger.mark_written(resumed_keys)
+                    continue
+                first_ts = pd.to_datetime(chunk["ts"].iloc[0], errors="coerce")
+                if last_ts is not None and first_ts < last_ts:
+                    print(f"[rebuild] warning: {path} is not chronological around {chunk['ts'].iloc[0]}")
+                last_ts = pd.to_datetime(chunk["ts"].iloc[-1], errors="coerce")
+
+                keys = ledger.keys_for(chunk)
+                calls_before = builder.agent.calls
+
+                def on_result(idx, result):
+                    nonlocal since_checkpoint
+                    ledger.record([keys[idx]], *result)
+                    state["rows_replayed"] += 1
+                    state["last_ts"] = keys[idx][1]
+                    since_checkpoint += 1
+                    if since_checkpoint >= checkpoint_every:
+                        _checkpoint(builder, base_path, state)
+                        since_checkpoint = 0
+
+                results, _ = builder.classify_rows(chunk, concurrency=concurrency, on_result=on_result)
+
+                if out_path:
+                    done = sorted(results)
+                    df_out = chunk.iloc[done].copy()
+                    df_out["classification"] = [results[i][0] for i in done]
+                    df_out["template"] = [results[i][1] for i in done]
+                    if resumed is not None and not resumed.empty:
+                        df_out = pd.concat([resumed, df_out], ignore_index=True)
+                    df_out.to_csv(out_path, mode="a", header=not os.path.exists(out_path), index=False)
+                ledger.mark_written(resumed_keys + [keys[i] for i in sorted(results)])
+
+                elapsed = time.perf_counter() - started
+                state["llm_calls"] += builder.agent.calls - calls_before
+                state["elapsed_s"] = round(elapsed, 2)
+                state["rows_per_s"] = round(state["rows_replayed"] / elapsed, 2) if elapsed > 0 else 0.0
+                cache = builder.agent.cache.stats() if builder.agent.cache is not None else {}
+                print(f"[rebuild] {state['rows_replayed']} rows replayed ({state['rows_skipped']} skipped) "
+                      f"up to {state['last_ts']} | {state['rows_per_s']} rows/s | "
+                      f"{state['llm_calls']} LLM calls, response-cache hit rate {cache.get('hit_rate', 0.0):.1%}")
+    finally:
+        _checkpoint(builder, base_path, state)
+        ledger.close()
+        manager.close()
+
+    print(f"[rebuild] done: {json.dumps(state)}")
+    if builder.signature_cache is not None:
+        print(f"[signature-cache] {builder.signature_cache.report()}")
+    print(f"[similarity-index] {builder.similarity_index.stats()}")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="historical contribution/classified CSVs, oldest first")
+    parser.add_argument("--base-path", default="templates_storage_new",
+                        help="tree to rebuild into; keep it apart from the live service tree (templates_storage)")
+    parser.add_argument("--reset", action="store_true", help="start from an empty tree (discards progress)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--route-batch-size", type=int, default=1, help="templates routed per LLM call")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--checkpoint-every", type=int, default=1000)
+    parser.add_argument("--template-mode", choices=("llm", "local"), default="llm")
+    parser.add_argument("--out", default=None, help="append re-classified rows to this CSV")
+    args = parser.parse_args()
+    if args.reset and os.path.abspath(args.base_path) == os.path.abspath(LIVE_BASE_PATH):
+        parser.error(f"--reset would wipe the live service tree {LIVE_BASE_PATH!r}; rebuild into another --base-path")
+
+    if backend_name() == "openai" and not os.environ.get("OPENAI_API_KEY"):
+        raise SystemExit("OPENAI_API_KEY environment variable not set")
+    rebuild_tree(args.inputs, base_path=args.base_path, reset=args.reset, concurrency=args.concurrency,
+                 chunk_size=args.chunk_size, checkpoint_every=args.checkpoint_every,
+                 template_mode=args.template_mode, out_path=args.out, route_batch_size=args.route_batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+# conftest.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Tests import the backend modules the way the service does (`lib.*`, top-level scripts).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SENSORS = ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0"]
+
+
+@pytest.fixture
+def contribution_csv(tmp_path):
+    """Factory writing a contribution CSV (ts every 10 min, random contributions) under tmp_path."""
+    def make(name, n, start="2024-01-01", seed=0):
+        rng = np.random.default_rng(seed)
+        df = pd.DataFrame({"ts": pd.date_range(start, periods=n, freq="10min").astype(str)})
+        for s in SENSORS:
+            df[f"contribution_{s}"] = rng.random(n).round(4)
+        df["overall_anomaly_score"] = rng.random(n).round(4)
+        path = tmp_path / name
+        df.to_csv(path, index=False)
+        return str(path)
+    return make
@@ -0,0 +1,37 @@
+# test_anomaly_scheduler.py
+import importlib
+
+import pandas as pd
+
+from lib.anomaly_scheduler import AnomalyScheduler, load_device_priority
+
+
+def test_order_puts_priority_devices_first_then_severity():
+    df = pd.DataFrame({
+        "ts": ["t1", "t2", "t3", "t4"],
+        "device": ["edge-1", "edge-2", 7, "edge-1"],
+        "overall_anomaly_score": [0.9, 0.1, 0.2, 0.5],
+    })
+    scheduler = AnomalyScheduler(backlog_path=None, device_priority={"edge-2": 10, "7": 5})
+    assert scheduler.order(df) == [1, 2, 0, 3]
+
+
+def test_load_device_priority_inline_and_file(monkeypatch, tmp_path):
+    monkeypatch.delenv("ANOMALY_DEVICE_PRIORITY", raising=False)
+    assert load_device_priority() == {}
+    monkeypatch.setenv("ANOMALY_DEVICE_PRIORITY", '{"edge-2": 10, "7": 5}')
+    assert load_device_priority() == {"edge-2": 10.0, "7": 5.0}
+    path = tmp_path / "prio.json"
+    path.write_text('{"edge-9": 1}')
+    monkeypatch.setenv("ANOMALY_DEVICE_PRIORITY", str(path))
+    assert load_device_priority() == {"edge-9": 1.0}
+
+
+def test_service_scheduler_uses_device_priority(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ANOMALY_DEVICE_PRIORITY", '{"edge-2": 10}')
+    generate_tree = importlib.import_module("generate_tree")
+    scheduler = generate_tree._make_scheduler(str(tmp_path / "contrib.csv"))
+    assert scheduler.device_priority == {"edge-2": 10.0}
+    df = pd.DataFrame({"ts": ["t1", "t2"], "device": ["edge-1", "edge-2"], "overall_anomaly_score": [0.9, 0.1]})
+    assert scheduler.order(df) == [1, 0]
@@ -0,0 +1,117 @@
+# test_gpt_agent.py
+import asyncio
+
+import pytest
+
+from lib.anomaly_tree_builder import AnomalyTreeBuilder
+from lib.gpt_agent import GPTAgent, OutputRejected, RetryPolicy
+from lib.llm_backends import LLMResponse
+from lib.response_cache import ResponseCache
+
+GOOD = '{"template": "t_ch0 jumps sharply (contribution ~0.91)."}'
+GARBAGE = "not json at all"
+validate_template = AnomalyTreeBuilder._parse_template_response
+
+
+class ScriptedBackend:
+    """Answers from a {model: text} table and counts calls."""
+    name = "scripted"
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def complete(self, model, prompt, opts):
+        self.calls.append(model)
+        return LLMResponse(text=self.answers[model], input_tokens=10, output_tokens=5, total_tokens=15)
+
+    async def acomplete(self, model, prompt, opts):
+        return self.complete(model, prompt, opts)
+
+    async def aclose(self):
+        pass
+
+
+def _agent(backend, cache, tiers=None):
+    return GPTAgent(model="m1", cache=cache, tiers=tiers, backend=backend,
+                    retry=RetryPolicy(max_retries=0))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "cache.sqlite"))
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_rejected_output_is_not_cached(cache, use_async):
+    def run(agent):
+        if use_async:
+            return asyncio.run(agent.arun("prompt", stage="template", validate=validate_template))
+        return agent.run("prompt", stage="template", validate=validate_template)
+
+    with pytest.raises(ValueError, match="Invalid JSON"):
+        run(_agent(ScriptedBackend({"m1": GARBAGE}), cache))
+    healthy = ScriptedBackend({"m1": GOOD})
+    assert run(_agent(healthy, cache)) == GOOD
+    assert healthy.calls == ["m1"]
+    # Validated output is cached and served without a call.
+    again = ScriptedBackend({"m1": GARBAGE})
+    assert run(_agent(again, cache)) == GOOD
+    assert again.calls == []
+
+
+def test_escalation_asks_again_instead_of_replaying_rejected_output(cache):
+    tiers = {"template": ["m1", "m2"]}
+    first = ScriptedBackend({"m1": GARBAGE, "m2": GOOD})
+    assert _agent(first, cache, tiers).run("prompt", stage="template", validate=validate_template) == GOOD
+    assert first.calls == ["m1", "m2"]
+    # m1 is asked again on the next run (its answer was not cached); m2's is served from cache.
+    second = ScriptedBackend({"m1": GARBAGE, "m2": GARBAGE})
+    assert _agent(second, cache, tiers).run("prompt", stage="template", validate=validate_template) == GOOD
+    assert second.calls == ["m1"]
+
+
+def test_soft_rejection_is_returned_but_not_cached(cache):
+    def soft(text):
+        raise OutputRejected("route marked found but missing", soft=True)
+
+    backend = ScriptedBackend({"m1": "route"})
+    assert _agent(backend, cache).run("prompt", stage="route", validate=soft) == "route"
+    assert _agent(backend, cache).run("prompt", stage="route", validate=soft) == "route"
+    assert backend.calls == ["m1", "m1"]
+
+
+def test_previously_cached_invalid_output_is_dropped(cache):
+    backend = ScriptedBackend({"m1": GOOD})
+    agent = _agent(backend, cache)
+    cache.put(agent._cache_key("prompt", "m1"), GARBAGE, model="m1")
+    assert agent.run("prompt", stage="template", validate=validate_template) == GOOD
+    assert backend.calls == ["m1"]
+    assert cache.get(agent._cache_key("prompt", "m1")) == GOOD
+
+
+class LocalServerBackend(ScriptedBackend):
+    """Like HTTPBackend with LLM_HTTP_MODEL set: sends its own model instead of the agent's."""
+    name = "http"
+
+    def __init__(self, answers, model):
+        super().__init__(answers)
+        self.model = model
+
+    def complete(self, model, prompt, opts):
+        return super().complete(self.model or model, prompt, opts)
+
+
+def test_cache_is_keyed_on_the_model_the_backend_sends(cache):
+    answers = {"qwen-7b": GOOD, "llama-8b": '{"template": "v_ch0 jumps sharply (contribution ~0.88)."}'}
+    old = LocalServerBackend(answers, model="qwen-7b")
+    assert _agent(old, cache).run("prompt", stage="template", validate=validate_template) == GOOD
+
+    # Switching the local model must not replay the previous model's answer.
+    new = LocalServerBackend(answers, model="llama-8b")
+    assert _agent(new, cache).run("prompt", stage="template", validate=validate_template) == answers["llama-8b"]
+    assert new.calls == ["llama-8b"]
+    # The same local model still hits the cache.
+    again = LocalServerBackend(answers, model="qwen-7b")
+    assert _agent(again, cache).run("prompt", stage="template", validate=validate_template) == GOOD
+    assert again.calls == []
@@ -0,0 +1,49 @@
+# test_history_store.py
+import pandas as pd
+
+from data_cache import LOCAL_TZ
+from history_store import HistoryStore
+
+
+def _rows(start, n, device="edge-0", value=0.0):
+    ts = pd.date_range(start, periods=n, freq="s", tz=LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S%z")
+    return pd.DataFrame({"ts": ts, "device": device, "t_ch0": [value + i for i in range(n)]})
+
+
+def test_overlapping_batches_read_back_once(tmp_path):
+    store = HistoryStore(str(tmp_path / "store"))
+    assert store.append("sensor", _rows("2025-01-06 10:00:00", 10)) == 10
+    # Re-sent edge window: the last 5 seconds again, with corrected values.
+    assert store.append("sensor", _rows("2025-01-06 10:00:05", 5, value=100.0)) == 5
+    store.append("sensor", _rows("2025-01-06 10:00:05", 5, device="edge-1"))
+
+    df = store.read("sensor", devices=["edge-0"])
+    assert len(df) == 10
+    assert df["ts"].is_monotonic_increasing
+    assert df["t_ch0"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 100.0, 101.0, 102.0, 103.0, 104.0]
+    assert len(store.read("sensor")) == 15
+
+    # Projections without the key columns are deduplicated too.
+    assert store.read("sensor", columns=["t_ch0"]).columns.tolist() == ["t_ch0"]
+    assert len(store.read("sensor", columns=["t_ch0"])) == 15
+
+
+def test_duplicates_within_a_batch_keep_the_last_row(tmp_path):
+    store = HistoryStore(str(tmp_path / "store"))
+    batch = pd.concat([_rows("2025-01-06 10:00:00", 3), _rows("2025-01-06 10:00:01", 1, value=50.0)])
+    assert store.append("sensor", batch) == 3
+    assert store.read("sensor")["t_ch0"].tolist() == [0.0, 50.0, 2.0]
+
+
+def test_merge_serves_store_and_live_csv_rows_once(tmp_path):
+    store = HistoryStore(str(tmp_path / "store"))
+    store.append("sensor", _rows("2025-01-06 10:00:00", 10))
+    # normal_data.csv rows: naive Pacific wall time, overlapping the store by 5 seconds.
+    live = _rows("2025-01-06 10:00:05", 10, value=5.0)
+    live["ts"] = pd.to_datetime(live["ts"]).dt.tz_localize(None)
+
+    df = store.merge(store.read("sensor"), live)
+    assert len(df) == 15
+    assert str(df["ts"].dt.tz) == LOCAL_TZ
+    assert df["t_ch0"].tolist() == [float(i) for i in range(15)]
+    assert store.merge(None, None) is None
@@ -0,0 +1,75 @@
+# test_processed_ledger.py
+import json
+
+import pandas as pd
+import pytest
+
+from generate_tree import pipeline_prompts
+from lib.anomaly_tree_builder import AnomalyTreeBuilder
+from lib.llm_backends import FakeBackend
+from lib.processed_ledger import ProcessedLedger
+
+
+def test_mark_written_checkpoints_only_its_keys(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    ledger = ProcessedLedger(path)
+    ledger.record([("a", "t1"), ("a", "t2")], "A", "run A template")
+    ledger.record([("b", "t1")], "B", "run B template")
+    ledger.mark_written([("b", "t1")])
+    assert set(ledger.unwritten()) == {("a", "t1"), ("a", "t2")}
+    ledger.close()
+
+    reloaded = ProcessedLedger(path)
+    assert set(reloaded.unwritten()) == {("a", "t1"), ("a", "t2")}
+    assert len(reloaded) == 3
+
+
+def test_legacy_global_checkpoint_is_still_honoured(tmp_path):
+    path = tmp_path / "ledger.jsonl"
+    path.write_text("\n".join(json.dumps(e) for e in [
+        {"device": "", "ts": "t1", "classification": "c", "template": "x"},
+        {"checkpoint": True},
+        {"device": "", "ts": "t2", "classification": "c", "template": "y"},
+    ]) + "\n")
+    assert set(ProcessedLedger(str(path)).unwritten()) == {("", "t2")}
+
+
+def _builder(csv_path, tmp_path, ledger):
+    return AnomalyTreeBuilder(csv_path=csv_path, prompts=pipeline_prompts(),
+                              base_path=str(tmp_path / "templates_storage"), ledger=ledger, llm_backend=FakeBackend(), template_mode="local")
+
+
+def test_crashed_run_rows_survive_another_runs_checkpoint(tmp_path, contribution_csv):
+    ledger_path = str(tmp_path / "ledger.jsonl")
+    out_a, out_b = str(tmp_path / "classified_a.csv"), str(tmp_path / "classified_b.csv")
+    csv_a = contribution_csv("a.csv", 5)
+    csv_b = contribution_csv("b.csv", 3, start="2024-02-01", seed=1)
+
+    # Run A commits two units to the tree, then dies before writing its CSV.
+    ledger = ProcessedLedger(ledger_path)
+    record = ledger.record
+    committed = []
+
+    def crash_after_two(keys, *result):
+        if len(committed) == 2:
+            raise RuntimeError("worker killed")
+        committed.append(keys)
+        record(keys, *result)
+
+    ledger.record = crash_after_two
+    with pytest.raises(RuntimeError, match="worker killed"):
+        _builder(csv_a, tmp_path, ledger).run(out_path=out_a)
+    ledger.close()
+
+    # Run B, on another CSV, succeeds and checkpoints.
+    ledger = ProcessedLedger(ledger_path)
+    assert len(_builder(csv_b, tmp_path, ledger).run(out_path=out_b)["csv_df"]) == 3
+    ledger.close()
+
+    # Retrying A emits all five rows: two resumed from the ledger, three classified now.
+    ledger = ProcessedLedger(ledger_path)
+    _builder(csv_a, tmp_path, ledger).run(out_path=out_a)
+    ledger.close()
+    written = pd.read_csv(out_a)
+    assert sorted(written["ts"]) == sorted(pd.read_csv(csv_a)["ts"])
+    assert ProcessedLedger(ledger_path).unwritten() == {}
@@ -0,0 +1,72 @@
+# test_record_builder.py
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.record_builder import RecordBuilder
+
+
+def scalar_records(df):
+    """The original row-by-row RecordBuilder algorithm, kept as the reference."""
+    sensors = [c.removeprefix("contribution_") for c in df.columns if c.startswith("contribution_")]
+    domain_types = ["Temperature", "Voltage"]
+    sensor_to_domain = {s: RecordBuilder.sensor_domain(s) for s in sensors}
+    counts = {d: 0 for d in domain_types}
+    for s in sensors:
+        if sensor_to_domain[s] in counts:
+            counts[sensor_to_domain[s]] += 1
+    top_k = min(counts.values()) + 1
+
+    records = []
+    for i in range(len(df)):
+        row = df.iloc[i]
+        by_dom = {d: [] for d in domain_types}
+        for s in sensors:
+            d = sensor_to_domain[s]
+            if d in by_dom:
+                by_dom[d].append({"name": s, "value": float(row[f"contribution_{s}"])})
+        domains_info = [{"name": d, "sensors": by_dom[d]} for d in domain_types if by_dom[d]]
+        domain_scores = {}
+        for d, sensors_list in by_dom.items():
+            if not sensors_list:
+                continue
+            sorted_vals = sorted([x["value"] for x in sensors_list], reverse=True)
+            k = min(top_k, len(sorted_vals))
+            domain_scores[d] = sum(sorted_vals[:k]) / math.sqrt(top_k)
+        ranking = sorted([{"name": d, "score": float(domain_scores.get(d, 0.0))} for d in domain_types],
+                         key=lambda x: x["score"], reverse=True)
+        if len(ranking) >= 2 and ranking[0]["score"] > 0:
+            ratio = ranking[1]["score"] / ranking[0]["score"]
+            cross_domain = ratio >= 0.95
+        else:
+            ratio = 0.0
+            cross_domain = False
+        records.append({"domains": domains_info, "ranking": ranking,
+                        "ratio_2_over_1": ratio, "cross_domain_close": cross_domain})
+    return records
+
+
+LAYOUTS = {
+    "bench_sensors": ["t_ch0", "t_ch1", "t_ch2", "t_ch3", "v_ch0"],
+    "more_voltage": ["temp_a", "temp_b", "v_ch0", "v_ch1", "voltage_rail"],
+    "only_temperature": ["t_ch0", "t_ch1"],
+    "with_other_sensors": ["humidity", "t_ch0", "vch1", "tch2", "pressure_0"],
+}
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+@pytest.mark.parametrize("decimals", [1, 4])
+def test_vectorized_records_match_scalar_algorithm(layout, decimals):
+    # One decimal produces many exact ties, within and across domains.
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({f"contribution_{s}": rng.random(200).round(decimals) for s in LAYOUTS[layout]})
+    df.loc[:4] = 0.0
+    df["overall_anomaly_score"] = rng.random(200)
+    assert RecordBuilder().build_records_from_csv(df) == scalar_records(df)
+
+
+def test_empty_frame():
+    df = pd.DataFrame({"contribution_t_ch0": [], "contribution_v_ch0": []})
+    assert RecordBuilder().build_records_from_csv(df) == []
@@ -0,0 +1,42 @@
+# test_route_batch.py
+from generate_tree import pipeline_prompts
+from lib.anomaly_tree_builder import AnomalyTreeBuilder
+from lib.gpt_agent import load_model_tiers
+from lib.llm_backends import FakeBackend, LLMResponse
+
+
+class RefusingBatchBackend(FakeBackend):
+    """Fake backend that answers every batched route prompt with prose and no [k] blocks."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_prompts = 0
+
+    def _answer(self, prompt, garbage):
+        if "\n\nTemplates:\n" in prompt:
+            self.batch_prompts += 1
+            return LLMResponse(text="sorry, cannot comply", input_tokens=len(prompt) // 4, output_tokens=5,
+                               total_tokens=len(prompt) // 4 + 5, cached_tokens=0)
+        return super()._answer(prompt, garbage)
+
+
+def test_unparseable_batch_reply_falls_back_to_single_routes(tmp_path, contribution_csv):
+    csv_path = contribution_csv("contrib.csv", 12)
+    backend = RefusingBatchBackend()
+    builder = AnomalyTreeBuilder(csv_path=csv_path, prompts=pipeline_prompts(),
+                                 base_path=str(tmp_path / "templates_storage"), llm_backend=backend,
+                                 template_mode="local", route_batch_size=4)
+    result = builder.run(out_path=str(tmp_path / "classified.csv"), concurrency=4)
+
+    assert len(result["csv_df"]) == 12
+    assert backend.batch_prompts > 0
+    # Nothing came back from the batched calls; every item was routed on its own.
+    assert builder.route_stats["batched_items"] == 0
+    assert builder.route_stats["fallbacks"] > 0
+
+
+def test_route_batch_uses_route_tiers_unless_configured(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_TIERS", '{"route": ["nano", "mini"]}')
+    assert load_model_tiers()["route_batch"] == ["nano", "mini"]
+    monkeypatch.setenv("LLM_MODEL_TIERS", '{"route": ["nano", "mini"], "route_batch": ["mini"]}')
+    assert load_model_tiers()["route_batch"] == ["mini"]
@@ -0,0 +1,88 @@
+# test_template_renderer.py
+import pytest
+
+from lib.template_renderer import render_template, check_template_format
+
+
+def _record(domains, ranking, ratio=0.0, close=False):
+    return {
+        "domains": [{"name": d, "sensors": [{"name": n, "value": v} for n, v in sensors]}
+                    for d, sensors in domains],
+        "ranking": [{"name": d, "score": s} for d, s in ranking],
+        "ratio_2_over_1": ratio,
+        "cross_domain_close": close,
+    }
+
+
+CASES = {
+    "single jump": (
+        _record([("Temperature", [("t_ch0", 0.91), ("t_ch1", 0.21), ("t_ch2", 0.05)])],
+                [("Temperature", 0.8), ("Voltage", 0.0)]),
+        "t_ch0 jumps sharply (contribution ~0.91) while other Temperature sensors stay near baseline (~0.21).",
+    ),
+    "several elevated": (
+        _record([("Temperature", [("t_ch0", 0.85), ("t_ch1", 0.79), ("t_ch2", 0.214)])],
+                [("Temperature", 1.1), ("Voltage", 0.2)], ratio=0.18),
+        "t_ch0 and t_ch1 are elevated (~0.85, ~0.79) while others remain low (~0.21).",
+    ),
+    "one-sensor domain": (
+        _record([("Voltage", [("v_ch0", 1.0)]), ("Temperature", [("t_ch0", 0.12), ("t_ch1", 0.08)])],
+                [("Voltage", 0.71), ("Temperature", 0.14)], ratio=0.2),
+        "v_ch0 is elevated (contribution ~1.00) as the only Voltage sensor.",
+    ),
+    "one-sensor domain below threshold": (
+        _record([("Voltage", [("v_ch0", 0.3)])], [("Voltage", 0.3), ("Temperature", 0.0)]),
+        "Voltage sensors v_ch0 show only modest contributions (~0.30) with none reaching ~0.50.",
+    ),
+    "no sensor above 0.50": (
+        _record([("Temperature", [("t_ch0", 0.31), ("t_ch1", 0.29), ("t_ch2", 0.2), ("t_ch3", 0.1)])],
+                [("Temperature", 0.42), ("Voltage", 0.1)], ratio=0.24),
+        "Temperature sensors t_ch0, t_ch1, and t_ch2 show only modest contributions (~0.31, ~0.29, ~0.20) "
+        "with none reaching ~0.50.",
+    ),
+    "all sensors elevated": (
+        _record([("Temperature", [("t_ch1", 0.6), ("t_ch0", 0.6)])], [("Temperature", 0.6), ("Voltage", 0.0)]),
+        "All Temperature sensors t_ch0 and t_ch1 are elevated together (~0.60, ~0.60).",
+    ),
+    "near-tie cross domain": (
+        _record([("Temperature", [("t_ch0", 0.66), ("t_ch3", 0.61)]), ("Voltage", [("v_ch0", 0.9)])],
+                [("Temperature", 0.73), ("Voltage", 0.7)], ratio=0.9589, close=True),
+        "Temperature and Voltage are Cross Domain. Total contribution scores for Temperature and Voltage "
+        "are nearly tied (S2/S1 ~ 96%); Temperature {t_ch0(~0.66), t_ch3(~0.61)} vs Voltage {v_ch0(~0.90)}.",
+    ),
+    "near-tie cross domain, nothing above 0.50": (
+        _record([("Temperature", [("t_ch0", 0.4), ("t_ch1", 0.3), ("t_ch2", 0.2), ("t_ch3", 0.1)]),
+                 ("Voltage", [("v_ch0", 0.45)])],
+                [("Temperature", 0.5), ("Voltage", 0.45)], ratio=0.9, close=True),
+        "Temperature and Voltage are Cross Domain. Total contribution scores for Temperature and Voltage "
+        "are nearly tied (S2/S1 ~ 90%); Temperature {t_ch0(~0.40), t_ch1(~0.30), t_ch2(~0.20)} "
+        "vs Voltage {v_ch0(~0.45)}.",
+    ),
+    "close flag with a single ranked domain": (
+        _record([("Voltage", [("v_ch0", 0.8)])], [("Voltage", 0.8)], close=True),
+        "v_ch0 is elevated (contribution ~0.80) as the only Voltage sensor.",
+    ),
+}
+
+
+@pytest.mark.parametrize("record,expected", CASES.values(), ids=list(CASES))
+def test_render_template(record, expected):
+    text = render_template(record)
+    assert text == expected
+    assert check_template_format(text) == []
+
+
+def test_empty_ranking():
+    assert render_template({"domains": [], "ranking": []}) == "No domain shows a notable contribution."
+
+
+@pytest.mark.parametrize("template", [
+    "",
+    "t_ch0 is elevated (contribution 0.91).",
+    "t_ch0 is elevated (contribution ~0.9).",
+    "t_ch0 is elevated (contribution ~0.91)",
+    't_ch0 is "elevated" (contribution ~0.91).',
+    "t_ch0 is elevated\n(contribution ~0.91).",
+])
+def test_check_template_format_rejects(template):
+    assert check_template_format(template)
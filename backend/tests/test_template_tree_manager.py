@@ -0,0 +1,99 @@
+# test_template_tree_manager.py
+import json
+
+from lib.template_tree_manager import TemplateTreeManager
+
+
+def _template(i):
+    return f"t_ch{i % 4} jumps sharply (contribution ~0.{50 + i:02d}) while other Temperature sensors stay low."
+
+
+def _manager(tmp_path, **kwargs):
+    return TemplateTreeManager(base_path=str(tmp_path / "tree"), reset=True, **kwargs)
+
+
+def test_prompt_tree_keeps_hidden_count_out_of_the_exemplars(tmp_path):
+    manager = _manager(tmp_path, prompt_exemplars=3)
+    temp = manager.create_child(manager.tree, "Temp-related")
+    small = manager.create_child(temp, "SingleSensorDrift")
+    big = manager.create_child(temp, "UniformGroupDrift")
+    volt = manager.create_child(manager.tree, "Volt-related")
+    for i in range(2):
+        manager.add_template(small, _template(i), f"2025-01-06 00:00:0{i}")
+    for i in range(7):
+        manager.add_template(big, _template(10 + i), f"2025-01-06 00:01:{i:02d}")
+    for i in range(25):
+        manager.add_template(volt, f"v_ch0 drops (contribution ~0.{50 + i:02d}).", f"2025-01-06 00:02:{i:02d}")
+
+    view = json.loads(manager.prompt_tree_json(manager.tree))
+    assert view["Temp-related"]["SingleSensorDrift"] == [_template(0), _template(1)]
+    assert set(view["Temp-related"]["UniformGroupDrift"]) == {"exemplars", "more"}
+    assert len(view["Temp-related"]["UniformGroupDrift"]["exemplars"]) == 3
+    assert view["Temp-related"]["UniformGroupDrift"]["more"] == "4"
+    assert view["Volt-related"]["more"] == "20+"
+    assert not any("more" in t for t in view["Volt-related"]["exemplars"])
+
+    section = manager.prompt_tree_section(manager.tree)
+    note, tree_json = section.split("Error Tree:\n")
+    assert note == TemplateTreeManager.PROMPT_TREE_NOTE
+    assert json.loads(tree_json) == view
+
+
+def _filled(manager, path, stamps, tag):
+    node = manager.tree
+    for name in path:
+        node = node.children.get(name) or manager.create_child(node, name)
+    for i, ts in enumerate(stamps):
+        manager.add_template(node, f"{tag} {i}", ts)
+    return node
+
+
+def test_merge_leaves_keeps_time_order_and_index(tmp_path):
+    manager = _manager(tmp_path)
+    dst = _filled(manager, ["Temp-related", "A"], ["2025-06-01", "2025-06-03"], "a")
+    _filled(manager, ["Temp-related", "B"], ["2025-06-02", "imported_0001.txt"], "b")
+    parent = manager.tree.children["Temp-related"]
+    seq = manager.current().structure_seq
+
+    assert manager.merge_leaves(parent, "B", "A") is dst
+    assert list(parent.children) == ["A"]
+    assert dst.timestamps == ["imported_0001.txt", "2025-06-01", "2025-06-02", "2025-06-03"]
+    assert dst.templates == ["b 1", "a 0", "b 0", "a 1"]
+    assert manager.find_path_by_template("b 0") == ["Temp-related", "A"]
+    assert dst.structure_seq > seq
+
+
+def test_collapse_gathers_the_subtree_in_time_order(tmp_path):
+    manager = _manager(tmp_path)
+    _filled(manager, ["Temp-related", "A", "Deep"], ["2025-06-04"], "deep")
+    _filled(manager, ["Temp-related", "A"], [], "a")
+    _filled(manager, ["Temp-related", "B"], ["2025-06-01", "2025-06-03"], "b")
+    node = manager.tree.children["Temp-related"]
+
+    manager.collapse(node)
+    assert node.is_leaf()
+    assert node.timestamps == ["2025-06-01", "2025-06-03", "2025-06-04"]
+    assert manager.find_path_by_template("deep 0") == ["Temp-related"]
+    assert manager.node_at(["Temp-related", "A"]) is None
+
+
+def test_journal_replays_archive_merge_and_collapse(tmp_path):
+    manager = _manager(tmp_path)
+    a = _filled(manager, ["Temp-related", "A"], ["2025-06-01", "2025-06-02", "2025-06-03"], "a")
+    _filled(manager, ["Temp-related", "B"], ["2024-01-01"], "b")
+    _filled(manager, ["Volt-related", "X", "Y"], ["2025-05-01"], "y")
+    _filled(manager, ["Volt-related", "Z"], ["2025-05-02"], "z")
+    manager.archive_templates(a, [1])
+    manager.merge_leaves(manager.tree.children["Temp-related"], "B", "A")
+    manager.collapse(manager.tree.children["Volt-related"])
+    expected, version = manager.tree.to_dict(), manager.version
+    manager.close()
+
+    ops = [json.loads(line)["op"] for line in open(manager.journal_path, encoding="utf-8")]
+    assert {"archive", "merge", "collapse"} <= set(ops)
+    reloaded = TemplateTreeManager(base_path=manager.base_path)
+    assert reloaded.tree.to_dict() == expected
+    assert reloaded.version == version
+    assert reloaded.find_path_by_template("b 0") == ["Temp-related", "A"]
+    assert reloaded.find_path_by_template("y 0") == ["Volt-related"]
+    assert reloaded.find_path_by_template("a 1") == []
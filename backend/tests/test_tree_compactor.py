@@ -0,0 +1,74 @@
+# test_tree_compactor.py
+from lib.template_tree_manager import TemplateTreeManager
+from lib.tree_compactor import TreeCompactor
+
+
+def _tree(tmp_path, stamps):
+    manager = TemplateTreeManager(base_path=str(tmp_path / "tree"), reset=True)
+    leaf = manager.create_child(manager.tree, "Temperature")
+    for i, ts in enumerate(stamps):
+        manager.add_template(leaf, f"t_ch{i} jumps sharply (contribution ~0.9{i}).", ts)
+    return manager, leaf
+
+
+def test_retention_ages_out_tz_aware_templates(tmp_path):
+    # Pacific timestamps on both sides of a DST change, plus a name that is not a timestamp.
+    manager, leaf = _tree(tmp_path, ["2025-01-06 00:00:00-08:00", "2025-05-01 12:00:00-07:00",
+                                     "2025-06-20 08:00:00-07:00", "imported_0001.txt"])
+    archived = TreeCompactor(manager, max_age_days=30).apply_retention(now="2025-07-01 00:00:00-07:00")
+    assert archived == 2
+    assert leaf.timestamps == ["2025-06-20 08:00:00-07:00", "imported_0001.txt"]
+
+
+def test_retention_accepts_naive_now_and_naive_timestamps(tmp_path):
+    manager, leaf = _tree(tmp_path, ["2025-01-06 00:00:00", "2025-06-20 08:00:00-07:00"])
+    assert TreeCompactor(manager, max_age_days=30).apply_retention(now="2025-07-01 00:00:00") == 1
+    assert leaf.timestamps == ["2025-06-20 08:00:00-07:00"]
+
+
+def test_retention_default_now_with_tz_aware_templates(tmp_path):
+    manager, leaf = _tree(tmp_path, ["2000-01-03 00:00:00-08:00", "2999-01-03 00:00:00-08:00"])
+    assert TreeCompactor(manager, max_age_days=1).apply_retention() == 1
+    assert leaf.timestamps == ["2999-01-03 00:00:00-08:00"]
+
+
+def _leaf(manager, path, stamps, tag):
+    node = manager.tree
+    for name in path:
+        node = node.children.get(name) or manager.create_child(node, name)
+    for i, ts in enumerate(stamps):
+        manager.add_template(node, f"{tag} template {i} (contribution ~0.{60 + i}).", ts)
+    return node
+
+
+def test_merged_leaf_keeps_the_newest_templates(tmp_path):
+    manager = TemplateTreeManager(base_path=str(tmp_path / "tree"), reset=True)
+    a = _leaf(manager, ["Temp-related", "A"], ["2025-06-01", "2025-06-02", "2025-06-03"], "t_ch0")
+    _leaf(manager, ["Temp-related", "B"], ["2020-01-01"], "t_ch1")
+    report = TreeCompactor(manager, min_leaf_templates=2, max_leaf_templates=2).run()
+
+    assert report["merged_leaves"] == 1 and report["archived_templates"] == 2
+    assert list(manager.tree.children["Temp-related"].children) == ["A"]
+    assert a.timestamps == ["2025-06-02", "2025-06-03"]
+
+
+def test_retention_ranks_out_of_order_templates_by_timestamp(tmp_path):
+    manager = TemplateTreeManager(base_path=str(tmp_path / "tree"), reset=True)
+    leaf = _leaf(manager, ["Temp-related"], ["2025-06-03", "imported_0001.txt", "2020-01-01", "2025-06-02"], "t_ch0")
+    assert TreeCompactor(manager, max_leaf_templates=2).apply_retention() == 2
+    assert leaf.timestamps == ["2025-06-03", "2025-06-02"]
+
+
+def test_domain_anchors_are_never_merged(tmp_path):
+    manager = TemplateTreeManager(base_path=str(tmp_path / "tree"), reset=True)
+    _leaf(manager, ["Temp-related", "SingleSensorDrift"], ["2025-06-01"] * 3, "t_ch0")
+    _leaf(manager, ["Temp-related", "UniformGroupDrift"], ["2025-06-02"] * 2, "t_ch1")
+    _leaf(manager, ["Volt-related", "SingleSensorDrift"], ["2025-06-03"], "v_ch0")
+    _leaf(manager, ["Other-related"], ["2025-06-04"], "x_ch0")
+    report = TreeCompactor(manager, max_depth=1, min_leaf_templates=3, max_fanout=1).run()
+
+    # The depth cap collapses every domain to a leaf; none of them is then folded into another.
+    assert report["collapsed_nodes"] == 2 and report["merged_leaves"] == 0
+    assert sorted(manager.tree.children) == ["Other-related", "Temp-related", "Volt-related"]
+    assert manager.tree.children["Temp-related"].template_count == 5
+    assert manager.find_path_by_template("v_ch0 template 0 (contribution ~0.60).") == ["Volt-related"]